@@ -0,0 +1,178 @@
+import math
+import time
+
+
+# hitTest used to hard-code this as well
+ProjectileSpeed = 40.0
+# roughly half a tank - aim errors below this still hit
+TargetRadius = 2.0
+
+
+class AxisFilter(object):
+	'''
+	Kalman filter for one axis, state [position, velocity] or
+	[position, velocity, acceleration], measuring position only
+	'''
+	def __init__(self, position, order, processNoise, measurementNoise):
+		self.Order = order
+		self.State = [position] + [0.0] * (order - 1)
+		# we know where it is, we have no idea how it is moving
+		self.Covariance = [[0.0] * order for _ in range(order)]
+		self.Covariance[0][0] = measurementNoise
+		for i in range(1, order):
+			self.Covariance[i][i] = 100.0
+		self.ProcessNoise = processNoise
+		self.MeasurementNoise = measurementNoise
+
+	def transition(self, dt):
+		if self.Order == 2:
+			return [[1.0, dt], [0.0, 1.0]]
+		return [[1.0, dt, 0.5 * dt * dt], [0.0, 1.0, dt], [0.0, 0.0, 1.0]]
+
+	def noise(self, dt):
+		# discrete white-noise on the highest derivative
+		if self.Order == 2:
+			gain = [0.5 * dt * dt, dt]
+		else:
+			gain = [0.5 * dt * dt, dt, 1.0]
+		q = self.ProcessNoise
+		return [[gain[i] * gain[j] * q for j in range(self.Order)] for i in range(self.Order)]
+
+	def predicted(self, dt):
+		'''
+		(state, covariance) dt seconds ahead, without changing the filter
+		'''
+		n = self.Order
+		F = self.transition(dt)
+		Q = self.noise(dt)
+		P = self.Covariance
+		state = [sum(F[i][k] * self.State[k] for k in range(n)) for i in range(n)]
+		FP = [[sum(F[i][k] * P[k][j] for k in range(n)) for j in range(n)] for i in range(n)]
+		covariance = [[sum(FP[i][k] * F[j][k] for k in range(n)) + Q[i][j] for j in range(n)] for i in range(n)]
+		return state, covariance
+
+	def update(self, position, dt):
+		n = self.Order
+		state, P = self.predicted(dt)
+		innovation = position - state[0]
+		s = P[0][0] + self.MeasurementNoise
+		gain = [P[i][0] / s for i in range(n)]
+		self.State = [state[i] + gain[i] * innovation for i in range(n)]
+		self.Covariance = [[P[i][j] - gain[i] * P[0][j] for j in range(n)] for i in range(n)]
+
+
+class KalmanTracker(object):
+	'''
+	Constant-velocity (or, with acceleration=True, constant-acceleration)
+	track of one tank, fed from its OBJECTUPDATEs
+	'''
+	def __init__(self, x, y, t, acceleration=False, processNoise=4.0, measurementNoise=0.25):
+		order = 3 if acceleration else 2
+		self.X = AxisFilter(x, order, processNoise, measurementNoise)
+		self.Y = AxisFilter(y, order, processNoise, measurementNoise)
+		self.LastTime = t
+		self.Updates = 1
+
+	def update(self, x, y, t):
+		dt = t - self.LastTime
+		if dt <= 0:
+			return
+		self.X.update(x, dt)
+		self.Y.update(y, dt)
+		self.LastTime = t
+		self.Updates += 1
+
+	def predict(self, t):
+		'''
+		(x, y, vx, vy, positionVariance) at time t
+		'''
+		dt = max(0.0, t - self.LastTime)
+		stateX, covarianceX = self.X.predicted(dt)
+		stateY, covarianceY = self.Y.predicted(dt)
+		return stateX[0], stateY[0], stateX[1], stateY[1], covarianceX[0][0] + covarianceY[0][0]
+
+
+def solveIntercept(shooterX, shooterY, targetX, targetY, velocityX, velocityY, speed=ProjectileSpeed):
+	'''
+	Time until a projectile fired now at speed meets a target moving at
+	constant velocity, from |D + V t| = speed t. None if it can't catch it.
+	'''
+	dx = targetX - shooterX
+	dy = targetY - shooterY
+	a = velocityX * velocityX + velocityY * velocityY - speed * speed
+	b = 2.0 * (dx * velocityX + dy * velocityY)
+	c = dx * dx + dy * dy
+
+	if abs(a) < 1e-9:
+		if b >= 0:
+			return None
+		return -c / b
+
+	discriminant = b * b - 4.0 * a * c
+	if discriminant < 0:
+		return None
+	root = math.sqrt(discriminant)
+	times = [t for t in ((-b - root) / (2.0 * a), (-b + root) / (2.0 * a)) if t >= 0]
+	return min(times) if times else None
+
+
+class AimingEngine(object):
+	'''
+	Predictive aiming: one KalmanTracker per enemy tank and a closed-form
+	intercept, so each shot costs the same small, fixed amount of work.
+
+	aim() returns (x, y, confidence). confidence is in [0, 1] and falls as
+	the predicted position at impact gets less certain - few updates, an
+	old track or a long flight time - so the caller can hold fire on a
+	guess.
+	'''
+	def __init__(self, projectileSpeed=ProjectileSpeed, acceleration=False, maxAge=2.0):
+		self.ProjectileSpeed = projectileSpeed
+		self.Acceleration = acceleration
+		self.MaxAge = maxAge
+		self.Trackers = {}
+
+	def update(self, message, t=None):
+		'''
+		Feed an OBJECTUPDATE for a tank
+		'''
+		if t is None:
+			t = time.monotonic()
+		id = message['Id']
+		tracker = self.Trackers.get(id)
+		if tracker is None or t - tracker.LastTime > self.MaxAge:
+			self.Trackers[id] = KalmanTracker(message['X'], message['Y'], t, self.Acceleration)
+		else:
+			tracker.update(message['X'], message['Y'], t)
+
+	def evict(self, id):
+		self.Trackers.pop(id, None)
+
+	def aim(self, shooterX, shooterY, id, now=None):
+		'''
+		Where to shoot to hit tank id, as (x, y, confidence), or None if it
+		isn't tracked
+		'''
+		tracker = self.Trackers.get(id)
+		if tracker is None:
+			return None
+		if now is None:
+			now = time.monotonic()
+
+		x, y, vx, vy, variance = tracker.predict(now)
+		flightTime = solveIntercept(shooterX, shooterY, x, y, vx, vy, self.ProjectileSpeed)
+		if flightTime is None:
+			# it is outrunning the shell - shoot where it is and say so
+			return x, y, 0.0
+
+		impactX, impactY, vx, vy, variance = tracker.predict(now + flightTime)
+		if self.Acceleration:
+			# acceleration bends the path - a couple of fixed refinements is plenty
+			for _ in range(2):
+				flightTime = math.hypot(impactX - shooterX, impactY - shooterY) / self.ProjectileSpeed
+				impactX, impactY, vx, vy, variance = tracker.predict(now + flightTime)
+
+		confidence = TargetRadius * TargetRadius / (TargetRadius * TargetRadius + variance)
+		if tracker.Updates < 3:
+			confidence *= tracker.Updates / 3.0
+		return impactX, impactY, confidence
@@ -0,0 +1,494 @@
+#!/usr/bin/python
+
+import asyncio
+import logging
+import random
+import time
+
+from messageTypes import ServerMessageTypes
+from messages import decodeMessage
+from commandBuffer import CommandBuffer, encodeFrame
+from worldState import WorldState
+from aiming import AimingEngine
+from geometry import calculateDistance, getHeading
+from metrics import Metrics
+from evasion import EvasionPlanner
+from serverComms import argumentParser, setupLogging, threadedOnly
+from turretControl import TurretController, serverHeading, hitTolerance
+
+
+class StreamWriterSink(object):
+	'''
+	Lets a CommandBuffer write into an asyncio StreamWriter
+	'''
+	def __init__(self, writer):
+		self.Writer = writer
+
+	def sendall(self, data):
+		self.Writer.write(data)
+
+
+class AsyncServerComms(object):
+	'''
+	asyncio flavour of ServerComms - same framing, read through a StreamReader
+
+	send() queues a frame on the transport (coalesced inside batch()),
+	sendMessage() does the same and waits for the transport to drain.
+	'''
+	MessageTypes = ServerMessageTypes()
+
+	def __init__(self, reader, writer):
+		self.Reader = reader
+		self.Writer = writer
+		self.Commands = CommandBuffer(StreamWriterSink(writer))
+		self.Metrics = Metrics()
+
+	@classmethod
+	async def connect(cls, hostname, port):
+		reader, writer = await asyncio.open_connection(hostname, port)
+		return cls(reader, writer)
+
+	async def readMessage(self):
+		'''
+		Read a message from the server
+		'''
+		header = await self.Reader.readexactly(2)
+		messageType = header[0]
+		messageData = await self.Reader.readexactly(header[1]) if header[1] else b''
+		receivedAt = time.perf_counter()
+		messagePayload = decodeMessage(messageType, messageData)
+		self.Metrics.inbound(messageType, receivedAt, time.perf_counter() - receivedAt, messagePayload)
+		return messagePayload, messageType
+
+	def send(self, messageType=None, messagePayload=None):
+		startedAt = time.perf_counter()
+		queued = self.Commands.send(encodeFrame(messageType, messagePayload))
+		self.Metrics.outbound(messageType, startedAt, time.perf_counter() - startedAt, messagePayload)
+		return queued
+
+	async def sendMessage(self, messageType=None, messagePayload=None):
+		'''
+		Send a message to the server
+		'''
+		self.send(messageType, messagePayload)
+		await self.Writer.drain()
+
+	def batch(self):
+		return self.Commands
+
+	async def drain(self):
+		await self.Writer.drain()
+
+	def close(self):
+		self.Writer.close()
+
+
+class AsyncBot(object):
+	'''
+	One tank driven by coroutines on the caller's event loop
+
+	readServer feeds every OBJECTUPDATE into the bot's own WorldState and
+	wakes anything blocked in waitFor. The strategies are the
+	botPy ones - scan, fastScan, chase, movement - but they await timers
+	and messages instead of sleeping threads, so many bots can share a loop.
+	'''
+	def __init__(self, hostname, port, name):
+		self.Hostname = hostname
+		self.Port = port
+		self.Name = name
+		self.Comms = None
+		self.IdTank = None
+		self.World = WorldState()
+		self.Aim = AimingEngine()
+		self.Turret = TurretController()
+		self.Evasion = EvasionPlanner()
+		self.Waiters = {}
+		# who we last fired at, for a KILL without an Id
+		self.LastTarget = None
+		# set by teamPool - where we publish sightings and read the team's
+		self.Team = None
+		self.TeamView = None
+
+	@property
+	def Me(self):
+		return self.World.snapshot().me
+
+	async def run(self):
+		self.Comms = await AsyncServerComms.connect(self.Hostname, self.Port)
+		logging.info("Creating tank with name '{}'".format(self.Name))
+		await self.Comms.sendMessage(ServerMessageTypes.CREATETANK, {'Name': self.Name})
+
+		#getting our tank id - the first OBJECTUPDATE is about us
+		messageType = None
+		while messageType != ServerMessageTypes.OBJECTUPDATE:
+			message, messageType = await self.Comms.readMessage()
+		self.IdTank = message['Id']
+		self.World.setIdTank(self.IdTank)
+		self.Comms.Metrics.setIdTank(self.IdTank)
+		self.World.update(message)
+		logging.info("{} has tank id {}".format(self.Name, self.IdTank))
+
+		#the strategies only ever wait on what the reader feeds them, so the
+		#bot is done when the reader or any strategy fails
+		reader = asyncio.ensure_future(self.readServer())
+		tasks = [reader, asyncio.ensure_future(self.main()), asyncio.ensure_future(self.movement())]
+		try:
+			done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+			#the reader's error first - a lost connection explains the rest
+			for task in sorted(done, key=lambda task: task is not reader):
+				if not task.cancelled() and task.exception() is not None:
+					raise task.exception()
+		finally:
+			for task in tasks:
+				task.cancel()
+			self.Comms.close()
+
+	async def readServer(self):
+		while True:
+			message, messageType = await self.Comms.readMessage()
+			if messageType == ServerMessageTypes.OBJECTUPDATE:
+				self.World.update(message)
+				if message['Id'] == self.IdTank:
+					self.Turret.observe(message['TurretHeading'])
+				elif message['Type'] == "Tank":
+					self.Aim.update(message)
+				if self.Team is not None:
+					self.Team.publish(message, self.IdTank)
+			elif messageType in (ServerMessageTypes.DESTROYED, ServerMessageTypes.KILL) and self.Team is not None:
+				#dead tanks leave the team table now, not when their rows go stale
+				id = message.get('Id') if message else None
+				if id is None:
+					id = self.IdTank if messageType == ServerMessageTypes.DESTROYED else self.LastTarget
+				if id is not None:
+					self.Team.remove(id)
+			self.notify(messageType, message)
+
+	def notify(self, messageType, message):
+		waiters = self.Waiters.get(messageType)
+		if not waiters:
+			return
+		for entry in list(waiters):
+			predicate, future = entry
+			if future.done():
+				waiters.remove(entry)
+			elif predicate is None or predicate(message):
+				future.set_result(message)
+				waiters.remove(entry)
+
+	async def waitFor(self, messageType, timeout=None, predicate=None):
+		'''
+		Wait for the next message of a type (optionally matching predicate),
+		None if the timeout runs out first
+		'''
+		future = asyncio.get_event_loop().create_future()
+		entry = (predicate, future)
+		waiters = self.Waiters.setdefault(messageType, [])
+		waiters.append(entry)
+		try:
+			return await asyncio.wait_for(future, timeout)
+		except asyncio.TimeoutError:
+			return None
+		finally:
+			if entry in waiters:
+				waiters.remove(entry)
+
+	def isMe(self, message):
+		return message['Id'] == self.IdTank
+
+	def isEnemyTank(self, message):
+		return message['Id'] != self.IdTank and message['Type'] == "Tank"
+
+	def enemies(self, maxAge=1.0):
+		'''
+		Enemy tanks we have seen, plus those the rest of the team has seen
+		when running under teamPool
+		'''
+		tanks = dict((tank['Id'], tank) for tank in self.World.snapshot().tanks(maxAge))
+		if self.TeamView is not None:
+			for id, sighting in self.TeamView.sightings(maxAge).items():
+				if sighting['Type'] == "Tank" and id not in tanks:
+					tanks[id] = sighting
+			#membership from the self-reports, not from whoever saw a tank last
+			for id in self.TeamView.teammates():
+				tanks.pop(id, None)
+		tanks.pop(self.IdTank, None)
+		return list(tanks.values())
+
+	async def waitForEnemy(self, timeout):
+		return await self.waitFor(ServerMessageTypes.OBJECTUPDATE, timeout, self.isEnemyTank)
+
+	def weakEnemy(self, maxDist, maxAge=1.0):
+		'''
+		The closest enemy worth chasing within maxDist, None if there is none
+		'''
+		me = self.Me
+		weak = [(calculateDistance(me['X'], me['Y'], tank['X'], tank['Y']), tank['Id'], tank)
+			for tank in self.enemies(maxAge) if tank['Health'] < 7]
+		weak = [entry for entry in weak if entry[0] < maxDist]
+		return min(weak)[2] if weak else None
+
+	def dodge(self):
+		'''
+		Send the dodge for a hit, planned against every enemy the team knows of
+		'''
+		escape = self.Evasion.plan(self.Me, self.enemies(maxAge=2.0))
+		move = ServerMessageTypes.MOVEBACKWARSDISTANCE if escape.Reverse else ServerMessageTypes.MOVEFORWARDDISTANCE
+		with self.Comms.batch():
+			self.Comms.send(ServerMessageTypes.TURNTOHEADING, {'Amount': escape.Heading})
+			self.Comms.send(move, {'Amount': escape.Distance})
+		return escape
+
+	def aimTurret(self, turretHeading):
+		'''
+		Send TURNTURRETTOHEADING and return when the turret should get there
+		'''
+		self.Comms.send(ServerMessageTypes.TURNTURRETTOHEADING, {'Amount': turretHeading})
+		return self.Turret.command(turretHeading % 360)
+
+	async def fireCoord(self, x, y):
+		'''
+		Turn the turret onto (x, y) and fire the moment it gets there.
+		Holds fire (returns False) if it still isn't on target by then.
+		'''
+		me = self.Me
+		turretHeading = serverHeading(me['X'], me['Y'], x, y)
+		tolerance = hitTolerance(calculateDistance(me['X'], me['Y'], x, y))
+		if not self.Turret.onTarget(turretHeading, tolerance):
+			fireAt = self.aimTurret(turretHeading)
+			await self.Comms.drain()
+			delay = fireAt - time.monotonic()
+			if delay > 0:
+				await asyncio.sleep(delay)
+			if not self.Turret.onTarget(turretHeading, tolerance):
+				await self.waitFor(ServerMessageTypes.OBJECTUPDATE, 0.1, self.isMe)
+				if not self.Turret.onTarget(turretHeading, tolerance):
+					logging.debug("Turret not on target, holding fire")
+					return False
+		logging.info("Firing")
+		await self.Comms.sendMessage(ServerMessageTypes.FIRE)
+		return True
+
+	async def goTo(self, x, y):
+		'''
+		Drive straight at a point and wait until we get there (or should have)
+		'''
+		distance = calculateDistance(self.Me['X'], self.Me['Y'], x, y)
+		heading = getHeading(self.Me['X'], self.Me['Y'], x, y)
+		with self.Comms.batch():
+			self.Comms.send(ServerMessageTypes.TURNTOHEADING, {'Amount': 360 - heading})
+			self.Comms.send(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': distance})
+		await self.Comms.drain()
+
+		deadline = time.monotonic() + distance / 10.0 + 1.0
+		arrived = lambda message: message['Id'] == self.IdTank and \
+			calculateDistance(message['X'], message['Y'], x, y) < 3
+		while time.monotonic() < deadline:
+			if await self.waitFor(ServerMessageTypes.OBJECTUPDATE, deadline - time.monotonic(), arrived):
+				break
+
+	async def scan(self):
+		'''
+		Full 360 turret sweep, returns what was seen in the same shape as
+		botPy's scan()
+		'''
+		scan_result = {"Tank": {}, "HealthPickup": {}, "AmmoPickup": {}, "Snitch": {}, "Emergency": False}
+		seenVersion = self.World.version
+		heading = self.Me['TurretHeading']
+		for step in range(72):
+			heading = (heading + 5) % 360
+			self.aimTurret(heading)
+			await self.Comms.drain()
+			await asyncio.sleep(0.05)
+
+			snapshot = self.World.snapshot()
+			me = snapshot.me
+			for t_id, message in snapshot.changedSince(seenVersion):
+				if message is None or t_id == self.IdTank or message['Type'] not in scan_result:
+					continue
+				dist = calculateDistance(me['X'], me['Y'], message['X'], message['Y'])
+				scan_result[message['Type']][t_id] = {"x": message['X'], "y": message['Y'], "dist": dist}
+				if message['Type'] == "Tank":
+					scan_result["Tank"][t_id]["hp"] = message['Health']
+					if dist <= 15:
+						scan_result["Emergency"] = True
+			seenVersion = snapshot.Version
+			if scan_result["Emergency"]:
+				break
+		return scan_result
+
+	async def fastScan(self):
+		'''
+		Short back-and-forth turret sweep, chasing the first weak tank that
+		shows up nearby. Returns True if it chased something.
+		'''
+		heading = self.Me['TurretHeading']
+		for step in range(16):
+			await self.waitForEnemy(0.15)
+			#our own sightings and, under teamPool, the rest of the team's
+			enemy = self.weakEnemy(30)
+			if enemy is not None:
+				await self.chase(enemy)
+				return True
+
+			if step < 4 or step >= 12:
+				heading = (heading + 15) % 360
+			else:
+				heading = (heading - 15) % 360
+			self.aimTurret(heading)
+			await self.Comms.drain()
+		logging.debug("no tanks found during fast scan")
+		return False
+
+	async def chase(self, enemy):
+		await self.Comms.sendMessage(ServerMessageTypes.STOPALL)
+		for attempt in range(4):
+			aimHeading = getHeading(self.Me['X'], self.Me['Y'], enemy['X'], enemy['Y'])
+			dist = calculateDistance(self.Me['X'], self.Me['Y'], enemy['X'], enemy['Y'])
+			with self.Comms.batch():
+				self.aimTurret(360 - aimHeading)
+				self.Comms.send(ServerMessageTypes.TURNTOHEADING, {'Amount': 360 - aimHeading})
+				self.Comms.send(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': dist / 2})
+			self.LastTarget = enemy['Id']
+			aim = self.Aim.aim(self.Me['X'], self.Me['Y'], enemy['Id'])
+			if aim is not None and aim[2] >= 0.3:
+				await self.fireCoord(aim[0], aim[1])
+			else:
+				await self.fireCoord(enemy['X'], enemy['Y'])
+
+			sameTank = lambda message: message['Id'] == enemy['Id']
+			update = await self.waitFor(ServerMessageTypes.OBJECTUPDATE, 1.5, sameTank)
+			if update is None:
+				logging.debug("lost the tank during chase")
+				return
+			enemy = update
+
+	async def movement(self):
+		while True:
+			await self.waitFor(ServerMessageTypes.HITDETECTED)
+			logging.info("got shot")
+			self.dodge()
+			await self.Comms.drain()
+
+	async def main(self):
+		iMain = 0
+		scan_out = None
+		while True:
+			await self.fastScan()
+			if (iMain % 15) == 0:
+				scan_out = await self.scan()
+			iMain += 1
+
+			if self.Me["Health"] < 3 and scan_out and scan_out["HealthPickup"]:
+				closest = min(scan_out["HealthPickup"].values(), key=lambda pickup: pickup["dist"])
+				if closest["dist"] < 60:
+					await self.goTo(closest["x"], closest["y"])
+
+			# get out of the net
+			if self.Me["Y"] > 101:
+				await self.goTo(random.randint(-15, 15), random.randint(80, 90))
+			elif self.Me["Y"] < -101:
+				await self.goTo(random.randint(-15, 15), random.randint(-90, -80))
+
+
+class AsyncAimBot(AsyncBot):
+	'''
+	aimBot's strategy: keep the turret on the closest enemy tank, fire once
+	it lines up, and turn or move at random now and then
+	'''
+	async def main(self):
+		while True:
+			if await self.waitForEnemy(1.0) is None:
+				continue
+			me = self.Me
+			enemies = self.enemies(maxAge=1.0)
+			if not enemies:
+				continue
+			enemy = min(enemies, key=lambda tank: calculateDistance(me['X'], me['Y'], tank['X'], tank['Y']))
+			self.LastTarget = enemy['Id']
+			aim = self.Aim.aim(me['X'], me['Y'], enemy['Id'])
+			if aim is not None and aim[2] >= 0.3:
+				await self.fireCoord(aim[0], aim[1])
+			else:
+				await self.fireCoord(enemy['X'], enemy['Y'])
+
+	async def movement(self):
+		while True:
+			await asyncio.sleep(random.uniform(1.0, 3.0))
+			logging.debug("Turning randomly")
+			await self.Comms.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': random.randint(0, 359)})
+			await asyncio.sleep(random.uniform(1.0, 3.0))
+			logging.debug("Moving randomly")
+			await self.Comms.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': random.randint(0, 10)})
+
+
+class AsyncScanBot(AsyncBot):
+	'''
+	scanBot's strategy: a coarse 18-step turret sweep every 20 updates
+	about ourselves, and a dodge across the shooter's line of fire
+	whenever we are hit
+	'''
+	async def sweep(self):
+		scan_result = {"Tank": {}, "HealthPickup": {}, "AmmoPickup": {}, "Snitch": {}, "Emergency": False}
+		seenVersion = self.World.version
+		heading = self.Me['Heading']
+		for step in range(18):
+			heading = (heading + 20) % 360
+			self.aimTurret(heading)
+			await self.Comms.drain()
+			await self.waitFor(ServerMessageTypes.OBJECTUPDATE, 0.5, self.isMe)
+
+			snapshot = self.World.snapshot()
+			me = snapshot.me
+			for t_id, message in snapshot.changedSince(seenVersion):
+				if message is None or t_id == self.IdTank or message['Type'] not in scan_result:
+					continue
+				dist = calculateDistance(me['X'], me['Y'], message['X'], message['Y'])
+				scan_result[message['Type']][t_id] = {"x": message['X'], "y": message['Y'], "dist": dist}
+				if message['Type'] == "Tank":
+					scan_result["Tank"][t_id]["hp"] = message['Health']
+					if dist <= 15:
+						scan_result["Emergency"] = True
+			seenVersion = snapshot.Version
+			if scan_result["Emergency"]:
+				break
+		return scan_result
+
+	async def main(self):
+		updates = 0
+		while True:
+			if await self.waitFor(ServerMessageTypes.OBJECTUPDATE, 1.0, self.isMe) is None:
+				continue
+			updates += 1
+			if updates % 20 == 0:
+				logging.debug("scanning")
+				await self.sweep()
+
+
+async def runBotsAsync(bots):
+	# one bot losing its connection shouldn't take the others down
+	results = await asyncio.gather(*(bot.run() for bot in bots), return_exceptions=True)
+	for bot, result in zip(bots, results):
+		if isinstance(result, Exception):
+			logging.error("{} stopped: {!r}".format(bot.Name, result))
+
+
+def runBots(hostname, port, names):
+	'''
+	Run one AsyncBot per name on a single event loop
+	'''
+	bots = [AsyncBot(hostname, port, name) for name in names]
+	asyncio.run(runBotsAsync(bots))
+
+
+if __name__ == '__main__':
+	parser = argumentParser('AsyncBot')
+	parser.add_argument('-c', '--count', default=1, type=int, help='Number of bots to run on the loop')
+	args = parser.parse_args()
+	threadedOnly(parser, args)
+	setupLogging(args.debug)
+
+	if args.count == 1:
+		names = [args.name]
+	else:
+		names = ['{}{}'.format(args.name, i) for i in range(args.count)]
+	runBots(args.hostname, args.port, names)
@@ -0,0 +1,396 @@
+#!/usr/bin/python
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from messageTypes import ServerMessageTypes
+from messages import decodeMessage
+from frameReader import FrameReader, syntheticStream
+from commandBuffer import CommandBuffer, encodeFrame
+from recorder import DiscardSink
+from geometry import calculateDistance, getHeading, inArcMask
+from trackStore import TrackStore
+from aiming import AimingEngine
+from worldState import WorldState
+from spatialIndex import SpatialIndex
+
+
+# results to compare against, kept in the repo next to this file. Timings
+# only compare on the machine that saved them (the file says which): run
+# --save there before a change, or after a deliberate speed change, and
+# commit the file with it
+DefaultBaseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchBaseline.json')
+Benchmarks = []
+
+
+def benchmark(name):
+	'''
+	Register a setup function. It builds whatever state it needs and
+	returns the zero-argument callable that is timed.
+	'''
+	def register(setup):
+		Benchmarks.append((name, setup))
+		return setup
+	return register
+
+
+class LoopSocket(object):
+	'''
+	Serves the same byte stream over and over through recv_into, so the
+	reader is measured without a real socket in the way
+	'''
+	def __init__(self, stream, chunkSize=4096):
+		self.Stream = memoryview(stream)
+		self.ChunkSize = chunkSize
+		self.Offset = 0
+
+	def recv_into(self, buffer):
+		size = min(len(buffer), self.ChunkSize, len(self.Stream) - self.Offset)
+		buffer[:size] = self.Stream[self.Offset:self.Offset + size]
+		self.Offset = (self.Offset + size) % len(self.Stream)
+		return size
+
+
+def objectUpdates(count, tanks=16):
+	'''
+	count OBJECTUPDATE payloads for tanks moving in circles
+	'''
+	messages = []
+	for i in range(count):
+		id = i % tanks
+		step = i // tanks
+		messages.append({
+			'Id': id, 'Name': 'Bot%d' % id, 'Type': 'Tank',
+			'X': (id * 11) % 160 - 80.0 + step % 20, 'Y': (id * 17) % 160 - 80.0 - step % 15,
+			'Heading': (step * 5) % 360, 'TurretHeading': (step * 7) % 360,
+			'Health': 5, 'Ammo': 10})
+	return messages
+
+
+def cycle(items):
+	'''
+	Endless zero-argument supplier over items
+	'''
+	state = [0]
+	count = len(items)
+
+	def next():
+		i = state[0]
+		state[0] = (i + 1) % count
+		return items[i]
+	return next
+
+
+#protocol codec - the two halves of ServerComms.readMessage/sendMessage
+@benchmark('codec.readFrame')
+def benchReadFrame():
+	reader = FrameReader(LoopSocket(syntheticStream(1000)))
+	return reader.readFrame
+
+
+@benchmark('codec.readMessage')
+def benchReadMessage():
+	reader = FrameReader(LoopSocket(syntheticStream(1000)))
+
+	def readMessage():
+		messageType, messageData = reader.readFrame()
+		return decodeMessage(messageType, messageData), messageType
+	return readMessage
+
+
+@benchmark('codec.decodeJson')
+def benchDecodeJson():
+	#what readMessage decoded with before the typed messages, for comparison
+	reader = FrameReader(LoopSocket(syntheticStream(1000)))
+
+	def decode():
+		messageType, messageData = reader.readFrame()
+		messagePayload = json.loads(str(messageData, 'utf-8'))
+		messagePayload['messageType'] = messageType
+		return messagePayload
+	return decode
+
+
+@benchmark('codec.encodeAmount')
+def benchEncodeAmount():
+	payload = {'Amount': 137.5}
+	return lambda: encodeFrame(ServerMessageTypes.TURNTURRETTOHEADING, payload)
+
+
+@benchmark('codec.encodeJson')
+def benchEncodeJson():
+	payload = {'Name': 'RandomBot'}
+	return lambda: encodeFrame(ServerMessageTypes.CREATETANK, payload)
+
+
+@benchmark('codec.sendMessage')
+def benchSendMessage():
+	commands = CommandBuffer(DiscardSink())
+	payload = {'Amount': 137.5}
+
+	def sendMessage():
+		commands.send(encodeFrame(ServerMessageTypes.TURNTURRETTOHEADING, payload))
+	return sendMessage
+
+
+@benchmark('codec.sendBatch')
+def benchSendBatch():
+	commands = CommandBuffer(DiscardSink())
+	turret = {'Amount': 137.5}
+	heading = {'Amount': 42}
+
+	def sendBatch():
+		with commands:
+			commands.send(encodeFrame(ServerMessageTypes.TURNTURRETTOHEADING, turret))
+			commands.send(encodeFrame(ServerMessageTypes.TURNTOHEADING, heading))
+			commands.send(encodeFrame(ServerMessageTypes.FIRE))
+	return sendBatch
+
+
+#geometry
+@benchmark('geometry.calculateDistance')
+def benchDistance():
+	return lambda: calculateDistance(10.0, -5.0, 37.5, 61.25)
+
+
+@benchmark('geometry.getHeading')
+def benchHeading():
+	return lambda: getHeading(10.0, -5.0, 37.5, 61.25)
+
+
+@benchmark('geometry.inArcMask100')
+def benchInArcMask():
+	messages = objectUpdates(100, tanks=100)
+	xs = [message['X'] for message in messages]
+	ys = [message['Y'] for message in messages]
+	return lambda: inArcMask(10.0, -5.0, xs, ys, 45.0, 30.0, 100.0)
+
+
+#per-message state updates - TrackStore replaced update_target_dict
+@benchmark('tracks.append')
+def benchTrackAppend():
+	tracks = TrackStore()
+	supply = cycle(objectUpdates(4096))
+	clock = [0.0]
+
+	def append():
+		clock[0] += 0.01
+		tracks.update(supply(), clock[0])
+	return append
+
+
+@benchmark('tracks.closest')
+def benchTrackClosest():
+	tracks = TrackStore()
+	for i, message in enumerate(objectUpdates(2048)):
+		tracks.update(message, i * 0.01)
+	return lambda: tracks.closest(3, 0.5, 20.0)
+
+
+@benchmark('world.update')
+def benchWorldUpdate():
+	world = WorldState(idTank=0)
+	supply = cycle(objectUpdates(4096))
+	return lambda: world.update(supply())
+
+
+@benchmark('spatial.update')
+def benchSpatialUpdate():
+	space = SpatialIndex()
+	supply = cycle(objectUpdates(4096))
+	return lambda: space.update(supply())
+
+
+@benchmark('spatial.nearest')
+def benchSpatialNearest():
+	space = SpatialIndex()
+	for message in objectUpdates(256, tanks=256):
+		space.update(message)
+	return lambda: space.nearest(10.0, -5.0, 'Tank', exclude=0)
+
+
+#aiming - AimingEngine replaced smart_shot/hitTest
+@benchmark('aiming.update')
+def benchAimUpdate():
+	aim = AimingEngine()
+	supply = cycle(objectUpdates(4096))
+	clock = [0.0]
+
+	def update():
+		clock[0] += 0.01
+		aim.update(supply(), clock[0])
+	return update
+
+
+@benchmark('aiming.aim')
+def benchAim():
+	aim = AimingEngine()
+	for i, message in enumerate(objectUpdates(256)):
+		aim.update(message, i * 0.01)
+	return lambda: aim.aim(10.0, -5.0, 3, 2.6)
+
+
+def percentile(ordered, fraction):
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(setup, duration=0.5, batch=50):
+	'''
+	Time op in batches of batch calls for about duration seconds.
+	p50/p99 are over the per-call average of each batch - a single call is
+	too close to the timer resolution to time on its own.
+
+	allocBytes is the tracemalloc peak one call reaches above where it
+	started, retainedBlocks the net growth in allocated blocks per call -
+	anything above zero keeps memory after it returns.
+	'''
+	op = setup()
+	for _ in range(batch * 10):
+		op()
+
+	gcWasEnabled = gc.isenabled()
+	gc.disable()
+	try:
+		samples = []
+		calls = 0
+		started = time.perf_counter()
+		deadline = started + duration
+		now = started
+		while now < deadline or len(samples) < 20:
+			before = now
+			for _ in range(batch):
+				op()
+			now = time.perf_counter()
+			samples.append((now - before) / batch)
+			calls += batch
+		elapsed = now - started
+
+		blocksBefore = sys.getallocatedblocks()
+		for _ in range(batch * 20):
+			op()
+		retained = (sys.getallocatedblocks() - blocksBefore) / float(batch * 20)
+
+		tracemalloc.start()
+		peaks = []
+		for _ in range(batch):
+			tracemalloc.reset_peak()
+			current = tracemalloc.get_traced_memory()[0]
+			op()
+			peaks.append(tracemalloc.get_traced_memory()[1] - current)
+		tracemalloc.stop()
+	finally:
+		if gcWasEnabled:
+			gc.enable()
+
+	samples.sort()
+	peaks.sort()
+	return {
+		'opsPerSecond': calls / elapsed,
+		'p50': percentile(samples, 0.5),
+		'p99': percentile(samples, 0.99),
+		'allocBytes': percentile(peaks, 0.5),
+		'retainedBlocks': retained,
+	}
+
+
+def runSuite(duration=0.5, only=None):
+	results = {}
+	for name, setup in Benchmarks:
+		if only and not any(name.startswith(prefix) for prefix in only):
+			continue
+		results[name] = measure(setup, duration)
+	return results
+
+
+def numpyVersion():
+	#the array paths in geometry only run with numpy installed
+	try:
+		import numpy
+	except ImportError:
+		return None
+	return numpy.__version__
+
+
+def environment():
+	'''
+	What the numbers depend on besides the code
+	'''
+	return {
+		'python': platform.python_version(),
+		'machine': platform.machine(),
+		'numpy': numpyVersion(),
+	}
+
+
+def saveBaseline(results, path):
+	with open(path, 'w') as baseline:
+		saved = environment()
+		saved['saved'] = time.strftime('%Y-%m-%d %H:%M:%S')
+		saved['results'] = results
+		json.dump(saved, baseline, indent=1, sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+	'''
+	(name, change) for every benchmark whose p50 got more than tolerance
+	slower than the baseline - change is the ratio minus one
+	'''
+	regressions = []
+	for name, result in results.items():
+		before = baseline['results'].get(name)
+		if before is None or not before['p50']:
+			continue
+		change = result['p50'] / before['p50'] - 1.0
+		if change > tolerance:
+			regressions.append((name, change))
+	return regressions
+
+
+def report(results, baseline=None):
+	print('{:<28} {:>12} {:>10} {:>10} {:>10} {:>9} {:>8}'.format(
+		'benchmark', 'ops/s', 'p50 ns', 'p99 ns', 'alloc B', 'retained', 'vs base'))
+	for name, result in results.items():
+		versus = ''
+		if baseline is not None and name in baseline['results'] and baseline['results'][name]['p50']:
+			versus = '{:+.0%}'.format(result['p50'] / baseline['results'][name]['p50'] - 1.0)
+		print('{:<28} {:>12,.0f} {:>10.0f} {:>10.0f} {:>10} {:>9.2f} {:>8}'.format(
+			name, result['opsPerSecond'], result['p50'] * 1e9, result['p99'] * 1e9,
+			result['allocBytes'], result['retainedBlocks'], versus))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Microbenchmarks for the per-message hot paths')
+	parser.add_argument('-d', '--duration', default=0.5, type=float, help='Seconds of timing per benchmark')
+	parser.add_argument('-b', '--baseline', default=DefaultBaseline, help='Baseline file')
+	parser.add_argument('-s', '--save', action='store_true', help='Write these results as the new baseline')
+	parser.add_argument('-t', '--tolerance', default=0.25, type=float, help='Allowed p50 slowdown before failing, 0.25 = 25%%')
+	parser.add_argument('only', nargs='*', help='Only run benchmarks starting with these prefixes')
+	args = parser.parse_args()
+
+	results = runSuite(args.duration, args.only)
+	baseline = None
+	if not args.save and os.path.exists(args.baseline):
+		with open(args.baseline) as baselineFile:
+			baseline = json.load(baselineFile)
+	if baseline is not None:
+		current = environment()
+		for key, value in current.items():
+			if baseline.get(key, value) != value:
+				print('Baseline {} is {}, this run {} - compare with care'.format(key, baseline[key], value))
+	report(results, baseline)
+
+	if args.save:
+		saveBaseline(results, args.baseline)
+		print('Baseline written to {}'.format(args.baseline))
+	elif baseline is not None:
+		regressions = compare(results, baseline, args.tolerance)
+		for name, change in regressions:
+			print('REGRESSION {}: p50 {:+.0%}'.format(name, change))
+		if regressions:
+			sys.exit(1)
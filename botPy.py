@@ -1,242 +1,129 @@
 #!/usr/bin/python
 
-import json
-import socket
 import logging
-import binascii
-import struct
-import argparse
 import random
 import math   #needed for math fns
 import time
 import threading
 
-
-
-class ServerMessageTypes(object):
-	TEST = 0
-	CREATETANK = 1
-	DESPAWNTANK = 2
-	FIRE = 3
-	TOGGLEFORWARD = 4
-	TOGGLEREVERSE = 5
-	TOGGLELEFT = 6
-	TOGGLERIGHT = 7
-	TOGGLETURRETLEFT = 8
-	TOGGLETURRETRIGHT = 9
-	TURNTURRETTOHEADING = 10
-	TURNTOHEADING = 11
-	MOVEFORWARDDISTANCE = 12
-	MOVEBACKWARSDISTANCE = 13
-	STOPALL = 14
-	STOPTURN = 15
-	STOPMOVE = 16
-	STOPTURRET = 17
-	OBJECTUPDATE = 18
-	HEALTHPICKUP = 19
-	AMMOPICKUP = 20
-	SNITCHPICKUP = 21
-	DESTROYED = 22
-	ENTEREDGOAL = 23
-	KILL = 24
-	SNITCHAPPEARED = 25
-	GAMETIMEUPDATE = 26
-	HITDETECTED = 27
-	SUCCESSFULLHIT = 28
-
-	strings = {
-		TEST: "TEST",
-		CREATETANK: "CREATETANK",
-		DESPAWNTANK: "DESPAWNTANK",
-		FIRE: "FIRE",
-		TOGGLEFORWARD: "TOGGLEFORWARD",
-		TOGGLEREVERSE: "TOGGLEREVERSE",
-		TOGGLELEFT: "TOGGLELEFT",
-		TOGGLERIGHT: "TOGGLERIGHT",
-		TOGGLETURRETLEFT: "TOGGLETURRETLEFT",
-		TOGGLETURRETRIGHT: "TOGGLETURRENTRIGHT",
-		TURNTURRETTOHEADING: "TURNTURRETTOHEADING",
-		TURNTOHEADING: "TURNTOHEADING",
-		MOVEFORWARDDISTANCE: "MOVEFORWARDDISTANCE",
-		MOVEBACKWARSDISTANCE: "MOVEBACKWARDSDISTANCE",
-		STOPALL: "STOPALL",
-		STOPTURN: "STOPTURN",
-		STOPMOVE: "STOPMOVE",
-		STOPTURRET: "STOPTURRET",
-		OBJECTUPDATE: "OBJECTUPDATE",
-		HEALTHPICKUP: "HEALTHPICKUP",
-		AMMOPICKUP: "AMMOPICKUP",
-		SNITCHPICKUP: "SNITCHPICKUP",
-		DESTROYED: "DESTROYED",
-		ENTEREDGOAL: "ENTEREDGOAL",
-		KILL: "KILL",
-		SNITCHAPPEARED: "SNITCHAPPEARED",
-		GAMETIMEUPDATE: "GAMETIMEUPDATE",
-		HITDETECTED: "HITDETECTED",
-		SUCCESSFULLHIT: "SUCCESSFULLHIT"
-	}
-
-	def toString(self, id):
-		if id in self.strings.keys():
-			return self.strings[id]
-		else:
-			return "??UNKNOWN??"
-
-
-class ServerComms(object):
-	'''
-	TCP comms handler
-
-	Server protocol is simple:
-
-	* 1st byte is the message type - see ServerMessageTypes
-	* 2nd byte is the length in bytes of the payload (so max 255 byte payload)
-	* 3rd byte onwards is the payload encoded in JSON
-	'''
-	ServerSocket = None
-	MessageTypes = ServerMessageTypes()
-
-
-	def __init__(self, hostname, port):
-		self.ServerSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.ServerSocket.connect((hostname, port))
-
-	def readMessage(self):
-		'''
-		Read a message from the server
-		'''
-		messageTypeRaw = self.ServerSocket.recv(1)
-		messageLenRaw = self.ServerSocket.recv(1)
-		messageType = struct.unpack('>B', messageTypeRaw)[0]
-		messageLen = struct.unpack('>B', messageLenRaw)[0]
-
-		if messageLen == 0:
-			messageData = bytearray()
-			messagePayload = {'messageType': messageType}
-		else:
-			messageData = self.ServerSocket.recv(messageLen)
-			logging.debug("*** {}".format(messageData))
-			messagePayload = json.loads(messageData.decode('utf-8'))
-			messagePayload['messageType'] = messageType
-
-		logging.debug('Turned message {} into type {} payload {}'.format(
-			binascii.hexlify(messageData),
-			self.MessageTypes.toString(messageType),
-			messagePayload))
-		return messagePayload, messageType
-
-	def sendMessage(self, messageType=None, messagePayload=None):
-		'''
-		Send a message to the server
-		'''
-		message = bytearray()
-
-
-		if messageType is not None:
-			message.append(messageType)
-		else:
-			message.append(0)
-
-		if messagePayload is not None:
-			messageString = json.dumps(messagePayload)
-			message.append(len(messageString))
-			message.extend(str.encode(messageString))
-
-		else:
-			message.append(0)
-
-		logging.debug('Turned message type {} payload {} into {}'.format(
-			self.MessageTypes.toString(messageType),
-			messagePayload,
-			binascii.hexlify(message)))
-		return self.ServerSocket.send(message)
-
-
-# Parse command line args
-parser = argparse.ArgumentParser()
-parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
-parser.add_argument('-H', '--hostname', default='127.0.0.1', help='Hostname to connect to')
-parser.add_argument('-p', '--port', default=8052, type=int, help='Port to connect to')
-parser.add_argument('-n', '--name', default='RandomBot', help='Name of bot')
-args = parser.parse_args()
-
-# Set up console logging
-if args.debug:
-	logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.DEBUG)
-else:
-	logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.INFO)
-
-
-# Connect to game server
-GameServer = ServerComms(args.hostname, args.port)
-
-# Spawn our tank
-logging.info("Creating tank with name '{}'".format(args.name))
-GameServer.sendMessage(ServerMessageTypes.CREATETANK, {'Name': args.name})
+from messageTypes import ServerMessageTypes
+from serverComms import argumentParser, setupLogging, connect
+from tracing import Trace, TraceEvents
+from worldState import WorldState
+from trackStore import TrackStore
+from aiming import AimingEngine
+from spatialIndex import SpatialIndex
+from notifier import MessageNotifier
+from pathPlanner import PathPlanner, MoveSpeed
+from turretControl import TurretController, serverHeading, hitTolerance
+from targetQueue import TargetQueue
+from scheduler import TickScheduler, Priorities, Wait
+from evasion import EvasionPlanner, evade
+from heatMap import HeatMap
+from geometry import calculateDistance, getHeading, turnAngle
+
+
+
+# Set by run() - importing this module connects to nothing
+GameServer = None
+idTank = None
+
+# Everything we can see, keyed by Id - readServer writes, everyone else reads snapshots
+World = WorldState()
+# Recent positions of every enemy tank, for leading shots
+Tracks = TrackStore()
+# Kalman-filtered enemy motion, for leading shots
+Aim = AimingEngine()
+# don't waste shells on a guess
+MinFireConfidence = 0.3
+# Where every tank and pickup we've seen is, for nearest/within queries
+Space = SpatialIndex()
+PickupTypes = {
+	ServerMessageTypes.HEALTHPICKUP: "HealthPickup",
+	ServerMessageTypes.AMMOPICKUP: "AmmoPickup",
+	ServerMessageTypes.SNITCHPICKUP: "Snitch",
+}
+# readServer publishes every message here so the strategies can block on it
+Notifier = MessageNotifier()
+# Routes around walls and enemies; the places we keep going back to are planned up front
+Planner = PathPlanner()
+NorthExits = [[-10, 85], [10, 85]]
+SouthExits = [[-10, -85], [10, -85]]
+# Learns how fast our turret turns, so we fire when it gets there
+Turret = TurretController()
+# Enemy tanks ordered by how cheap they are to kill
+Targets = TargetQueue()
+# Runs the strategies as prioritised tasks, one step per game tick
+Scheduler = TickScheduler()
+# seconds a shot may wait for the turret before it is stale
+FireExpiry = 0.2
+# Which way to run when a shell hits us
+Evasion = EvasionPlanner(isOpen=Planner.isOpen)
+# seconds from reading a HITDETECTED to the dodge going out
+EvadeBudget = 0.05
+# the evade task keeps the hull until then
+EvadeUntil = 0.0
+# Where enemy tanks have been lately, fading with a 10s half-life
+Heat = HeatMap(isOpen=Planner.isOpen)
+# a full 360 scan this often, otherwise the turret goes where the heat is
+FullScanEvery = 5
+# heat around us that sends roam() somewhere quieter, and how far it looks
+RoamDanger = 40.0
+RoamDistance = 40.0
 #aiming functions
 
 
 
-#math and helper functions
-def calculateDistance(ownX, ownY, otherX, otherY):
-	headingX = otherX - ownX
-	headingY = otherY - ownY
-	return math.sqrt((headingX * headingX) + (headingY * headingY))
-
-
-#fns to calculate how many degree there is need to rotate
-def getHeading(x1, y1, x2, y2):
-	heading = math.atan2(y2 - y1, x2 - x1)
-	heading = radianToDegree(heading)
-	heading = (heading - 360) % 360
-	return math.fabs(heading)
-
-
-def radianToDegree(angle):
-	return angle * (180.0 / math.pi)
-
-
 #definitions to invoke in main_loop
 def goToForLists(x, y, places):
-	#firstPart iterates over save points and look for the closest one
-
-	closestDist = 0
-	iPoint = 0
-	for point in places:
-		distance = calculateDistance(x, y, point[0], point[1])
-		if iPoint == 0 or distance < closestDist:
-			closestDist = distance
-			closestPoint = point
-		iPoint += 1
-
-	#zigzagging towards destination
-
-	print(point)
-	i = 0
-
-	while (math.fabs(point[0] - x) > 2 and math.fabs(point[1] - y) > 2):
-		if (math.fabs(point[0] - x) < 25 or math.fabs(point[1] - y) < 25):
-			electedHeading = getHeading(x, y, closestPoint[0], closestPoint[1])
-			distance = calculateDistance(x, y, closestPoint[0], closestPoint[1])
-			GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': 360 - electedHeading})
-			time.sleep(2)
-			GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': distance})
+	#pick the place with the shortest route, not the shortest straight line
+	closestPoint = min(places, key=lambda point: Planner.distance(x, y, point[0], point[1]))
+	closestDist = Planner.distance(x, y, closestPoint[0], closestPoint[1])
+	if Trace.Enabled:
+		Trace.record(TraceEvents.GOTO, 0, -1, closestPoint[0], closestPoint[1], closestDist)
+
+	waypoints = []
+	obstacleVersion = None
+	deadline = time.monotonic() + closestDist / MoveSpeed * 2 + 5
+	while time.monotonic() < deadline:
+		snapshot = World.snapshot()
+		x = snapshot.me['X']
+		y = snapshot.me['Y']
+		if calculateDistance(x, y, closestPoint[0], closestPoint[1]) < 2:
+			break
+		#re-plan only when the enemies around us have moved
+		Planner.setObstacles([(tank['X'], tank['Y']) for tank in snapshot.tanks(maxAge=1.0)])
+		if not waypoints or Planner.ObstacleVersion != obstacleVersion:
+			waypoints = Planner.route(x, y, closestPoint[0], closestPoint[1])
+			obstacleVersion = Planner.ObstacleVersion
+		wx, wy = waypoints[0]
+		if calculateDistance(x, y, wx, wy) < 2:
+			waypoints.pop(0)
+			continue
+		yield from driveTo(x, y, wx, wy)
+
+def driveTo(x, y, wx, wy):
+	#one straight leg: turn on the spot, then drive until we are there
+	heading = (360 - getHeading(x, y, wx, wy)) % 360
+	GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': heading})
+	#resumes on the tick we are facing the right way
+	yield Wait(2.5, lambda: facing(heading))
+
+	distance = calculateDistance(x, y, wx, wy)
+	GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': distance})
+	obstacleVersion = Planner.ObstacleVersion
+	deadline = time.monotonic() + distance / MoveSpeed * 1.5 + 1
+	while time.monotonic() < deadline:
+		yield
+		me = World.snapshot().me
+		if calculateDistance(me['X'], me['Y'], wx, wy) < 2:
+			break
+		#an enemy drove into our way - stop and let goToForLists re-plan
+		Planner.setObstacles([(tank['X'], tank['Y']) for tank in World.snapshot().tanks(maxAge=1.0)])
+		if Planner.ObstacleVersion != obstacleVersion and \
+				not Planner.clear(Planner.cellOf(me['X'], me['Y']), Planner.cellOf(wx, wy), Planner.Penalty):
+			GameServer.sendMessage(ServerMessageTypes.STOPMOVE)
 			break
-
-		electedHeading = getHeading(x, y, closestPoint[0], closestPoint[1])
-		logging.info("Turning towards destination (with zigzag)")
-		if i%2 == 0:
-			GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': 360 - electedHeading - 45})
-		else:
-			GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': 360 - electedHeading + 45})
-		logging.info("Moving to point")
-		GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': 20})
-		time.sleep(2.25)
-
-		x = messageServer['X']
-		y = messageServer['Y']
-
-		i+=1
 
 '''
 def updatePos():
@@ -259,65 +146,64 @@ def scan():
 	scan_result["AmmoPickup"] = {}
 	scan_result["Snitch"] = {}
 	scan_result["Emergency"] = False
-	#print(messageServer)
-	initial_turret_head = messageServer['TurretHeading']
+	snapshot = World.snapshot()
+	initial_turret_head = snapshot.me['TurretHeading']
 	current_turret_heading = initial_turret_head
-	print("Start Head: "+str(current_turret_heading))
-	message_in_function = None
+	if Trace.Enabled:
+		Trace.record(TraceEvents.SCANSTART, 0, -1, current_turret_heading)
+	seenVersion = snapshot.Version
 	turn = True
 	while (turn):
-		if serverResponse[1] == 18:
-			message_in_function = serverResponse[0]
-
-		if message_in_function is None:
-			continue
-		elif "Id" in message_in_function:
-			t_id = message_in_function["Id"]
-			if (t_id != idTank):
-				category = message_in_function["Type"]
-				t_x = message_in_function["X"]
-				t_y = message_in_function["Y"]
-				dist = calculateDistance(messageServer['X'],messageServer['Y'],t_x,t_y)
-				#for each t
-				scan_result[category][t_id] = {"x":t_x,"y":t_y,"dist": dist}
-				if category=="Tank":
-					scan_result[category][t_id]["hp"] = message_in_function["Health"]
-					if (dist <= 15):
-						scan_result["Emergency"] = True
-						break
+		#only look at what changed since the previous step
+		snapshot = World.snapshot()
+		me = snapshot.me
+		for t_id, message_in_function in snapshot.changedSince(seenVersion):
+			if message_in_function is None or t_id == snapshot.IdTank:
+				continue
+			category = message_in_function["Type"]
+			t_x = message_in_function["X"]
+			t_y = message_in_function["Y"]
+			dist = calculateDistance(me['X'],me['Y'],t_x,t_y)
+			#for each t
+			scan_result[category][t_id] = {"x":t_x,"y":t_y,"dist": dist}
+			if category=="Tank":
+				scan_result[category][t_id]["hp"] = message_in_function["Health"]
+				if (dist <= 15):
+					scan_result["Emergency"] = True
+		if scan_result["Emergency"]:
+			break
+		seenVersion = snapshot.Version
 		current_turret_heading =(current_turret_heading + 5) % 360
-		GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':current_turret_heading})
-		time.sleep(0.05)
+		aimTurret(current_turret_heading)
+		#our next update carries the new turret heading
+		yield
 		if (math.fabs(current_turret_heading-initial_turret_head) < 1):
 			turn = False
 
-	print("End Head: " + str(current_turret_heading))
+	if Trace.Enabled:
+		Trace.record(TraceEvents.SCANEND, 0, -1, current_turret_heading, len(scan_result["Tank"]))
 	return scan_result
 
-def fastScan(target_dict):
-	initial_turret_head = messageServer['TurretHeading']
+def fastScan():
+	snapshot = World.snapshot()
+	initial_turret_head = snapshot.me['TurretHeading']
 	current_turret_heading = initial_turret_head
 	turnFS = True
 	iFS = 0
 	while turnFS:
-		if enemiesIntel != None:
-			enemyTarget = enemiesIntel
-			if enemyTarget["Health"] < 7:#tempValue
-				#print(enemiesIntel)
-				dist = calculateDistance(messageServer['X'],messageServer['Y'],enemyTarget["X"],enemyTarget["Y"])
-				if dist < 30:
-					update_target_dict(enemiesIntel, target_dict)
-					print(str(dist) + " so close")
-			try:
-						aimHeading = getHeading(messageServer['X'],messageServer['Y'],enemyTarget["X"],enemyTarget["Y"])
-						movementContoller = True
-						time.sleep(5)
-						chase(aimHeading, dist, enemyTarget)
-						movementContoller = False
-						print("fastscan finished")
-						break
-			except:
-						continue
+		me = World.snapshot().me
+		#cheapest tank to kill right now - a heap peek, not a scan
+		enemyTarget = Targets.best(accept=weakTank(me, 30))
+		if enemyTarget is not None:
+			targetDist = calculateDistance(me['X'],me['Y'],enemyTarget["X"],enemyTarget["Y"])
+			if Trace.Enabled:
+				Trace.record(TraceEvents.TARGET, 0, enemyTarget['Id'], enemyTarget["X"], enemyTarget["Y"], targetDist, enemyTarget["Health"])
+			aimHeading = getHeading(me['X'],me['Y'],enemyTarget["X"],enemyTarget["Y"])
+			#chasing outranks sweeping and roaming - they wait until it is done
+			Scheduler.spawn('chase', Priorities.AIM, chase(aimHeading, targetDist, enemyTarget), ('hull', 'turret'))
+			#hand the turret over before touching it again
+			yield
+			break
 				#else:
 					#aimHeading = getHeading(messageServer['X'],messageServer['Y'],enemiesIntel["X"],enemiesIntel["Y"])
 					#movementContoller = True
@@ -327,12 +213,14 @@ def fastScan(target_dict):
 			current_turret_heading =(current_turret_heading + 15) % 360
 		elif iFS >=4 and iFS <12:
 			current_turret_heading =(current_turret_heading - 15) % 360
-		GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':current_turret_heading})
-		time.sleep(0.15)
+		aimTurret(current_turret_heading)
+		#wake early only for something worth chasing
+		yield Wait(0.15, weakTankNear(30))
 		if (math.fabs(current_turret_heading-initial_turret_head) < 1):
 			if iFS > 8:
 				turnFS = False
-				print("no tanks found during fast scan")
+				if Trace.Enabled:
+					Trace.record(TraceEvents.SCANEND, 0, -1, current_turret_heading, 0)
 
 		iFS += 1
 
@@ -343,22 +231,27 @@ def chase(aimHeading, dist, enemyTarget):
 	GameServer.sendMessage(ServerMessageTypes.STOPALL)
 	escapeFlag = False
 	while iChase < 4 and escapeFlag == False:
-		print("chasing")
-		GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':360 - aimHeading})
-		GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING,{'Amount':360 - aimHeading})
-		GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE,{'Amount':dist/2})
-
-		fireCoord(messageServer['X'],messageServer['Y'],enemyTarget["X"],enemyTarget["Y"])
-		print("fire")
-		dist = calculateDistance(messageServer['X'],messageServer['Y'],enemyTarget["X"],enemyTarget["Y"])
-
-		enemyTargetNew = ultraScan(target_dict)
+		if Trace.Enabled:
+			Trace.record(TraceEvents.CHASE, 0, enemyTarget['Id'], enemyTarget["X"], enemyTarget["Y"], dist)
+		with GameServer.batch():
+			aimTurret(360 - aimHeading)
+			GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING,{'Amount':360 - aimHeading})
+			GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE,{'Amount':dist/2})
+
+		me = World.snapshot().me
+		shot = shoot(me['X'],me['Y'],enemyTarget["X"],enemyTarget["Y"],enemyTarget['Id'])
+		#the scan turns the turret - let the shot aim and fire first
+		yield Wait(until=fired(shot))
+		me = World.snapshot().me
+		dist = calculateDistance(me['X'],me['Y'],enemyTarget["X"],enemyTarget["Y"])
+
+		enemyTargetNew = yield from ultraScan()
 
 		if enemyTargetNew == enemyTarget:
 			if escapeFlag == True:
 				break
 			else:
-				enemyTargetNew = ultraScan()
+				enemyTargetNew = yield from ultraScan()
 				escapeFlag = True
 				continue
 
@@ -366,122 +259,101 @@ def chase(aimHeading, dist, enemyTarget):
 
 
 
-def ultraScan(target_dict):
+def ultraScan():
 
-	initial_turret_headUS = messageServer['TurretHeading']
+	initial_turret_headUS = World.snapshot().me['TurretHeading']
 	current_turret_headingUS = initial_turret_headUS
 	turnUS = True
 	while (turnUS):
-		GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':current_turret_headingUS})
-		time.sleep(0.30)
+		aimTurret(current_turret_headingUS)
+		yield Wait(0.30, weakTankNear(25))
 		if (math.fabs(current_turret_headingUS-initial_turret_headUS) < 1):
 			turnUS = False
-			print("no tanks found during chase")
-		if enemiesIntel is not None:
-			#print("enemyTank")
-			if enemiesIntel["Health"] < 7:
-				distUS = calculateDistance(messageServer['X'],messageServer['Y'],enemiesIntel["X"],enemiesIntel["Y"])
-				if distUS < 25:
-					update_target_dict(enemiesIntel, target_dict)
-					print(str(distUS)+ " so close")
-					E_x, E_y =smart_shot(enemiesIntel, target_dict)
-					fireCoord(messageServer['X'],messageServer['Y'],E_x,E_y)
-					print("FIRE!!!!!! " + str(time.time()))
-					aimHeading = getHeading(messageServer['X'],messageServer['Y'],enemiesIntel["X"],enemiesIntel["Y"])
-					GameServer.sendMessage(ServerMessageTypes.STOPALL)
-					GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':360 - aimHeading})
-					GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING,{'Amount':360 - aimHeading})
-					time.sleep(1.5)
-					GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE,{'Amount':distUS/2})
-					continue
+			if Trace.Enabled:
+				Trace.record(TraceEvents.SCANEND, 0, -1, current_turret_headingUS, 0)
+		me = World.snapshot().me
+		enemy = Targets.best(accept=weakTank(me, 25))
+		if enemy is not None:
+			distUS = calculateDistance(me['X'],me['Y'],enemy["X"],enemy["Y"])
+			if Trace.Enabled:
+				Trace.record(TraceEvents.TARGET, 0, enemy['Id'], enemy["X"], enemy["Y"], distUS, enemy["Health"])
+			Tracks.setTarget(enemy['Id'])
+			E_x, E_y, confidence =smart_shot(enemy)
+			if confidence >= MinFireConfidence:
+				shot = shoot(me['X'],me['Y'],E_x,E_y,enemy['Id'],confidence)
+				#the shot has the turret until it is fired or given up
+				yield Wait(until=fired(shot))
+			aimHeading = getHeading(me['X'],me['Y'],enemy["X"],enemy["Y"])
+			with GameServer.batch():
+				GameServer.sendMessage(ServerMessageTypes.STOPALL)
+				aimTurret(360 - aimHeading)
+				GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING,{'Amount':360 - aimHeading})
+			yield 1.5
+			GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE,{'Amount':distUS/2})
 
 
 	current_turret_headingUS =(current_turret_headingUS + 45) % 360
-	GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':current_turret_headingUS})
-	time.sleep(0.30)
+	aimTurret(current_turret_headingUS)
+	yield Wait(0.30, weakTankNear(25))
 	if (math.fabs(current_turret_headingUS-initial_turret_headUS) < 1):
 		turnUS = False
-		print("no tanks found during chase")
-
-def update_target_dict(enemiesIntel, target_dict):
-	E_id = enemiesIntel['Id']
-	E_x = enemiesIntel['X']
-	E_y = enemiesIntel['Y']
-	if enemiesIntel['Id'] in target_dict:
-		target_dict[E_id].append([E_x, E_y, time.time()])
-	else:
-		target_dict[enemiesIntel["Id"]] = []
-		target_dict[E_id].append([E_x, E_y,time.time()])
-
-def smart_shot(enemiesIntel, target_dict):
-	delta_x = 0
-	delta_y = 0
-	time_diff = 0
-	E_id = enemiesIntel['Id']
-	aim_x = enemiesIntel['X']
-	aim_y = enemiesIntel['Y']
-	for i in range(len(target_dict[E_id])-1, 0, -1):
-		print(i)
-		print(target_dict[E_id][i])
-		t_time = target_dict[E_id][i][2]
-		if (t_time - time.time()) < 0.6 and (t_time - time.time()) > 0.01:
-			delta_x = enemiesIntel['X'] - target_dict[E_id][i][0]
-			delta_y = enemiesIntel['Y'] - target_dict[E_id][i][1]
-			time_diff = t_time - time.time()
-			break
+		if Trace.Enabled:
+			Trace.record(TraceEvents.SCANEND, 0, -1, current_turret_headingUS, 0)
 
-	if time_diff < 0.6 and time_diff > 0.01:
-		print("yuh")
-		while True:
-			missDist = hitTest(aim_x, aim_y, delta_x, delta_y, time_diff)
-			if missDist < 3.0:
-				break
-			missForward = hitTest(aim_x+delta_x, aim_y+delta_y, delta_x, delta_y, time_diff)
-			if missForward < missDist:
-				aim_x += (delta_x * missDist / 2)
-				aim_y += (delta_y * missDist / 2)
-				continue
-			else:
-				aim_x -= (delta_x * missDist / 2)
-				aim_y -= (delta_y * missDist / 2)
-	return aim_x, aim_y
+def facing(heading):
+	#condition for Waits - there is no me for a moment while we respawn
+	me = World.snapshot().me
+	return me is not None and abs(turnAngle(me['Heading'], heading)) < 5
+
+def weakTank(me, maxDist):
+	#an enemy tank worth going after, for Targets.best(accept=)
+	def accept(enemy):
+		return enemy["Health"] < 7 and calculateDistance(me['X'],me['Y'],enemy["X"],enemy["Y"]) < maxDist#tempValue
+	return accept
+
+def weakTankNear(maxDist):
+	#condition for Waits: there is a tank worth going after
+	def check():
+		me = World.snapshot().me
+		return me is not None and Targets.best(accept=weakTank(me, maxDist)) is not None
+	return check
 
-def hitTest (aim_x, aim_y, delta_x, delta_y, time_diff):
-	print("hitTest")
-	velocity = math.sqrt((delta_x ** 2) + (delta_y ** 2)) / time_diff
-	aim_dist = calculateDistance(messageServer['X'], messageServer['Y'], aim_x, aim_y)
-	time_taken = aim_dist/(40)
-	x_actual = delta_x*time_taken/time_diff
-	y_actual = delta_y*time_taken/time_diff
-	missDist = calculateDistance(x_actual, y_actual, aim_x, aim_y)
-	return missDist
+def fired(shot):
+	#condition for Waits: the fire task has fired, given up or expired
+	return lambda: not shot.Alive
+
+def smart_shot(enemy):
+	#lead the target: where it will be when a shell fired now gets there
+	me = World.snapshot().me
+	aim = Aim.aim(me['X'], me['Y'], enemy['Id'])
+	if aim is None:
+		return enemy['X'], enemy['Y'], 0.0
+	return aim
 
 
 
 
 
 def got_shot():
-	for i in range(1,3):
-		GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': random.randint(210,330)})
-		#GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': random.randint(80,120)})
-
-def pick_up_health(scan_out,messageServer):
-	if scan_out["HealthPickup"]:
-		flag=False
-		outer_list=[]
-		for k, v in scan_out["HealthPickup"].items():
-			print("key: {0}, value: {1}".format(k, v))
-
-			inner_list=[]
-
-			inner_list.append(v["x"])
-			inner_list.append(v["y"])
-			outer_list.append(inner_list)
-		for l in outer_list:
-			if calculateDistance(messageServer["X"],messageServer["Y"],l[0],l[1])<60:
-				flag = True
-		if flag:
-			goToForLists(messageServer["X"],messageServer["Y"],outer_list)
+	#on the reader thread, the moment HITDETECTED is read - dodge first, then
+	#keep the others off the hull until the dodge has been driven
+	global EvadeUntil
+	snapshot = World.snapshot()
+	if snapshot.me is None:
+		return
+	escape = evade(GameServer, Evasion, snapshot.me, snapshot.tanks(maxAge=2.0), budget=EvadeBudget)
+	EvadeUntil = time.monotonic() + escape.Seconds
+	if not Scheduler.running('evade'):
+		Scheduler.spawn('evade', Priorities.EVADE, holdHull(), ('hull',))
+
+def holdHull():
+	#another hit while dodging just moves EvadeUntil
+	yield Wait(until=lambda: time.monotonic() >= EvadeUntil)
+
+def pick_up_health(me):
+	closest = Space.nearest(me["X"], me["Y"], "HealthPickup")
+	if closest is not None and closest[0] < 60:
+		yield from goToForLists(me["X"],me["Y"],[[closest[2], closest[3]]])
 '''
 def find_Shoot(has_target, target):
 	if has_target:
@@ -514,71 +386,147 @@ def find_Shoot(has_target, target):
 
 
 def roamingFns():
-	startMessage = messageServer
-	GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': 25})
-	GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': random.randint((messageServer['Heading']-45)%360,(messageServer['Heading']-45)%360)})
+	startMessage = World.snapshot().me
+	with GameServer.batch():
+		GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': 25})
+		GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': random.randint((startMessage['Heading']-45)%360,(startMessage['Heading']-45)%360)})
+
+def aimTurret(turretHeading):
+	#every turret command goes through here so Turret knows where it is heading
+	GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING, {'Amount': turretHeading})
+	return Turret.command(turretHeading % 360)
 
 def aimAngle(aimHeading):
-	GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING, {'Amount': 360 - aimHeading})
+	return aimTurret(360 - aimHeading)
 
 def fireCoord(x, y, Tx, Ty):
-	aimHeading = getHeading(x, y, Tx, Ty)
-	if (abs(messageServer['TurretHeading'] - aimHeading) < 10.0):
-		logging.info("Firing")
-		GameServer.sendMessage(ServerMessageTypes.FIRE)
-	else:
-		aimAngle(aimHeading)
-		time.sleep(0.25)
-		logging.info("Firing")
-		GameServer.sendMessage(ServerMessageTypes.FIRE)
+	turretHeading = serverHeading(x, y, Tx, Ty)
+	tolerance = hitTolerance(calculateDistance(x, y, Tx, Ty))
+	if not Turret.onTarget(turretHeading, tolerance):
+		#fire on the first tick the turret is there - give it until it
+		#should be, plus a tick or two
+		fireAt = aimTurret(turretHeading)
+		onTarget = yield Wait(max(0.0, fireAt - time.monotonic()) + 0.1,
+			lambda: Turret.onTarget(turretHeading, tolerance))
+		if not onTarget:
+			logging.debug("Turret not on target, holding fire")
+			return False
+	logging.info("Firing")
+	GameServer.sendMessage(ServerMessageTypes.FIRE)
+	return True
+
+def fire(x, y, Tx, Ty, id, confidence):
+	if (yield from fireCoord(x, y, Tx, Ty)) and Trace.Enabled:
+		Trace.record(TraceEvents.FIRE, 0, id, Tx, Ty, confidence)
+
+def shoot(x, y, Tx, Ty, id, confidence=1.0):
+	#firing outranks aiming, and a shot that can't go out soon is stale
+	return Scheduler.spawn('fire', Priorities.FIRE, fire(x, y, Tx, Ty, id, confidence), ('turret',), FireExpiry)
 #thread functions
 def readServer():
-	global messageServer
-	global serverResponse
-	global enemiesIntel
-	enemiesIntel = None
+	lastEviction = time.monotonic()
 	while True:
-		#serverResponse=-1
 
 		try:
-			serverResponse = GameServer.readMessage()
-			if serverResponse[0]['Id'] == idTank:
-				messageServer = serverResponse[0]
-			elif serverResponse[0]['Type'] == "Tank":
-				enemiesIntel = serverResponse[0]
-				#print(enemiesIntel)
-
-		except:
+			message, messageType = GameServer.readMessage()
+			if messageType == ServerMessageTypes.HITDETECTED:
+				#before anything else - every tick we wait, the shooter gets to aim again
+				got_shot()
+			elif messageType == ServerMessageTypes.OBJECTUPDATE:
+				World.update(message)
+				if message['Id'] == idTank:
+					Turret.observe(message['TurretHeading'])
+					Targets.setShooter(message['X'], message['Y'], message['TurretHeading'], Turret.Speed)
+				else:
+					Space.update(message)
+					if message['Type'] == "Tank":
+						Tracks.update(message)
+						Aim.update(message)
+						Targets.update(message)
+						Heat.add(message['X'], message['Y'])
+			elif messageType in PickupTypes:
+				#we just drove over one - drop it from the index
+				me = World.snapshot().me
+				pickup = Space.nearest(me['X'], me['Y'], PickupTypes[messageType])
+				if pickup is not None and pickup[0] < 5:
+					Space.remove(pickup[1])
+			else:
+				for id in Tracks.handleMessage(message, messageType):
+					Aim.evict(id)
+					Space.remove(id)
+					Targets.remove(id)
+
+			now = time.monotonic()
+			if now - lastEviction > 1.0:
+				for id in Tracks.evictStale(now):
+					Aim.evict(id)
+					Space.remove(id)
+					Targets.remove(id)
+				lastEviction = now
+
+			#state is up to date - now wake whoever is waiting
+			Notifier.publish(message, messageType)
+			if messageType == ServerMessageTypes.OBJECTUPDATE and message['Id'] == idTank:
+				Scheduler.tick()
+			elif messageType == ServerMessageTypes.GAMETIMEUPDATE:
+				Scheduler.tick(message.get('Time'))
+
+		except ConnectionError as error:
+			#readMessage has already tried to reconnect - nothing more to read
+			logging.error("Giving up on the server: {!r}".format(error))
+			#the strategies have nothing left to act on
+			Scheduler.stop()
+			return
+		except Exception:
+			logging.debug("Could not handle a message", exc_info=True)
 			continue
 
 
+#scheduler tasks
 def main():
-	iMain = 15
-	target_dict = {}
-	time.sleep(3)
+	#the turret sweep - chase() takes over whenever fastScan finds a target
+	iMain = 0
+	yield 3.0
 	while True:
-<<<<<<< HEAD
-		fastScan()
-=======
-
-		fastScan(target_dict)
-
->>>>>>> 6d4c5ae557d2723d8a9bb6d0d31d0c3864936b81
+		with GameServer.Metrics.timer('decision.fastScan'):
+			yield from fastScan()
 		#time.sleep(100)
-		if (iMain % 15)==0:
-			scan_out = scan()
+		me = World.snapshot().me
+		hot = Heat.hottest(me['X'], me['Y'], maxRange=Targets.MaxRange)
+		if hot is None or (iMain % FullScanEvery)==0:
+			with GameServer.Metrics.timer('decision.scan'):
+				scan_out = yield from scan()
+		else:
+			#no need to look all the way round - point where they have been
+			#and let the next fastScan sweep either side of it
+			GameServer.Metrics.count('decision.focus')
+			settleAt = aimTurret(hot[0])
+			yield Wait(max(0.0, settleAt - time.monotonic()) + 0.1, lambda: Turret.onTarget(hot[0], 5.0))
 
-		#iMain+=1
+		iMain+=1
 		#time.sleep(1)
 
-		if messageServer["Health"] <3:
-			pick_up_health(scan_out, messageServer)
+def roam():
+	#the hull, while nothing more important needs it
+	yield 3.0
+	while True:
+		me = World.snapshot().me
+		if me["Health"] <3:
+			yield from pick_up_health(me)
 
 		# get out of the net
-		if messageServer["Y"]>101:
-			goToForLists(messageServer["X"],messageServer["Y"],[[random.randint(-15,15), random.randint(80,90)]])
-		if messageServer["Y"]<-101:
-			goToForLists(messageServer["X"],messageServer["Y"],[[random.randint(-15,15), random.randint(-80,-90)]])
+		if me["Y"]>101:
+			yield from goToForLists(me["X"],me["Y"],NorthExits)
+		if me["Y"]<-101:
+			yield from goToForLists(me["X"],me["Y"],SouthExits)
+
+		# don't sit where they keep turning up
+		me = World.snapshot().me
+		if Heat.danger(me["X"],me["Y"]) > RoamDanger:
+			quiet = Heat.safest(me["X"],me["Y"],RoamDistance)
+			if quiet is not None:
+				yield from goToForLists(me["X"],me["Y"],[list(quiet)])
+		yield 0.5
 
 
 '''
@@ -592,19 +540,16 @@ def main():
 		'''
 
 def movement():
+	#watches only - claims nothing, so it never holds up the others
 	while True:
-		print("i'm false")
-		while movementContoller == False:
-			#GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': 15})
-			#goToForLists(messageServer['X'], messageServer['Y'], [[0,0]])#[[15,90],[-15,90],[15,-90],[-15,-90]])
-			print("arrived")
-			time.sleep(1)
-			if serverResponse[1] == 18:
-				pass#print("its bout me")
-			elif serverResponse[1] == 27:
-				print("got shot")
-				#got_shot()
-			#time.sleep(70)
+		#GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': 15})
+		#goToForLists(messageServer['X'], messageServer['Y'], [[0,0]])#[[15,90],[-15,90],[15,-90],[-15,-90]])
+		seen = Notifier.latest(ServerMessageTypes.HITDETECTED)[0]
+		#the reader dodges and traces the hits itself
+		hit = yield Wait(1.0, Notifier.since(ServerMessageTypes.HITDETECTED, seen))
+		if not hit and Trace.Enabled:
+			Trace.record(TraceEvents.IDLE)
+		#time.sleep(70)
 '''
 def movement():
 	while True:
@@ -617,20 +562,59 @@ def movement():
 
 '''
 
-#getting our tank id
-global movementContoller
-movementContoller = False
-messageTemp = GameServer.readMessage()
-if messageTemp[1] == 18:
+def spawned(newIdTank):
+	#called by GameServer on our first spawn and again after every reconnect
 	global idTank
-	idTank = messageTemp[0]['Id']
-	print(str(idTank)+" idtank")
-
-t1 = threading.Thread(target=readServer)
-t2 = threading.Thread(target=main)
-t3 = threading.Thread(target=movement)
-
-t1.start()
-time.sleep(1)
-t2.start()
-t3.start()
+	oldIdTank = idTank
+	idTank = newIdTank
+	logging.info("Our tank id is {}".format(idTank))
+	World.setIdTank(idTank)
+	Turret.reset()
+	if oldIdTank is not None and oldIdTank != idTank:
+		#the server despawned our old tank - don't let it look like an enemy
+		World.remove(oldIdTank)
+		Space.remove(oldIdTank)
+		Tracks.evict(oldIdTank)
+		Aim.evict(oldIdTank)
+		Targets.remove(oldIdTank)
+
+def run(args):
+	'''
+	Connect, spawn and start the reader and the scheduler threads.
+	The strategy state is this module's globals, so one bot per process -
+	run more with multiBot.
+	'''
+	global GameServer
+	if getattr(args, 'asyncio', False):
+		import asyncClient
+		asyncClient.runBots(args.hostname, args.port, [args.name])
+		return
+
+	GameServer = connect(args)
+	GameServer.onSpawn(spawned)
+	Planner.warm(NorthExits + SouthExits)
+
+	#getting our tank id - readMessage hands it to spawned()
+	while GameServer.IdTank is None:
+		message, messageType = GameServer.readMessage()
+	World.update(message)
+
+	Scheduler.Metrics = GameServer.Metrics
+	Scheduler.spawn('sweep', Priorities.SCAN, main(), ('turret',))
+	Scheduler.spawn('roam', Priorities.ROAM, roam(), ('hull',))
+	Scheduler.spawn('watch', Priorities.ROAM, movement())
+
+	t1 = threading.Thread(target=readServer)
+	t2 = threading.Thread(target=Scheduler.run)
+
+	t1.start()
+	time.sleep(1)
+	t2.start()
+
+
+if __name__ == '__main__':
+	parser = argumentParser('RandomBot')
+	parser.add_argument('-a', '--asyncio', action='store_true', help='Run the strategies as coroutines on one thread instead of three threads')
+	args = parser.parse_args()
+	setupLogging(args.debug)
+	run(args)
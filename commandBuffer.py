@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+import json
+import threading
+
+
+# payload-less frames (FIRE, STOPALL, STOPMOVE, STOPTURRET, ...) never change,
+# so they are built once and reused
+ConstantFrames = [bytes((messageType, 0)) for messageType in range(256)]
+
+
+def encodeAmount(messageType, amount):
+	'''
+	Fast path for the {'Amount': x} payload every movement/turret command uses
+	'''
+	if type(amount) is int:
+		text = b'%d' % amount
+	else:
+		text = repr(float(amount)).encode('ascii')
+		if text[-1:] in (b'n', b'f'):
+			# nan/inf have their own spelling in JSON
+			return encodeJson(messageType, {'Amount': amount})
+	return b'%c%c{"Amount": %b}' % (messageType, 12 + len(text), text)
+
+
+def encodeFrame(messageType=None, messagePayload=None):
+	'''
+	Turn a message type and optional payload into wire bytes (see ServerComms)
+	'''
+	if messageType is None:
+		messageType = 0
+
+	if messagePayload is None:
+		return ConstantFrames[messageType]
+
+	if len(messagePayload) == 1 and 'Amount' in messagePayload:
+		return encodeAmount(messageType, messagePayload['Amount'])
+
+	return encodeJson(messageType, messagePayload)
+
+
+def encodeJson(messageType, messagePayload):
+	'''
+	Generic path - any JSON-serialisable payload
+	'''
+	messageBytes = json.dumps(messagePayload).encode('utf-8')
+	if len(messageBytes) > 255:
+		raise ValueError('Payload is {} bytes, the protocol allows 255'.format(len(messageBytes)))
+	return bytes((messageType, len(messageBytes))) + messageBytes
+
+
+class Batch(threading.local):
+	'''
+	One thread's open batch
+	'''
+	Depth = 0
+
+	def __init__(self):
+		self.Pending = []
+
+
+class CommandBuffer(object):
+	'''
+	Collects the frames issued during one decision step and writes them with
+	a single sendall
+
+	Outside a batch every frame is written straight away. Inside
+
+		with GameServer.batch():
+			GameServer.sendMessage(...)
+			GameServer.sendMessage(...)
+
+	frames are queued and flushed together when the outermost block exits.
+	Batches belong to the thread that opened them: a frame sent from
+	another thread (the reader dodging a shell) goes out at once instead of
+	waiting in someone else's batch.
+
+	The reader, the scheduler and the strategies all write, so every
+	sendall holds Lock: each frame, or each flushed batch, reaches the
+	socket whole and in one piece even when the socket buffer is full and
+	the kernel takes it in parts. A write that times out half way has the
+	socket shut down (ServerComms.lost) before the lock is let go, so
+	nothing follows a torn frame onto the stream.
+	'''
+	def __init__(self, sock):
+		self.Socket = sock
+		self.Batch = Batch()
+		self.Lock = threading.Lock()
+		self.Writes = 0
+		self.Frames = 0
+
+	def send(self, frame):
+		batch = self.Batch
+		if batch.Depth:
+			batch.Pending.append(frame)
+		else:
+			with self.Lock:
+				self.Socket.sendall(frame)
+				self.Writes += 1
+				self.Frames += 1
+		return len(frame)
+
+	def flush(self):
+		pending = self.Batch.Pending
+		if not pending:
+			return 0
+		data = b''.join(pending)
+		frames = len(pending)
+		del pending[:]
+		with self.Lock:
+			self.Socket.sendall(data)
+			self.Writes += 1
+			self.Frames += frames
+		return len(data)
+
+	def __enter__(self):
+		self.Batch.Depth += 1
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		batch = self.Batch
+		batch.Depth -= 1
+		if batch.Depth == 0:
+			self.flush()
+		return False
@@ -0,0 +1,143 @@
+import math
+import time
+
+from messageTypes import ServerMessageTypes
+from geometry import calculateDistance, turnAngle
+from turretControl import serverHeading, hitTolerance
+from pathPlanner import MoveSpeed
+from tracing import Trace, TraceEvents
+
+
+# how fast the hull turns, degrees a second
+HullSpeed = 90.0
+
+
+def direction(heading):
+	'''
+	Unit vector for a server heading (bots send 360 - the maths angle)
+	'''
+	radians = math.radians(heading)
+	return math.cos(radians), -math.sin(radians)
+
+
+class Escape(object):
+	'''
+	One planned dodge: turn the hull to Heading, then drive Distance -
+	backwards when Reverse, which saves turning the hull round
+	'''
+	__slots__ = ('Heading', 'Reverse', 'Distance', 'ShooterId', 'Seconds')
+
+	def __init__(self, heading, reverse, distance, shooterId, seconds):
+		self.Heading = heading
+		self.Reverse = reverse
+		self.Distance = distance
+		self.ShooterId = shooterId
+		self.Seconds = seconds
+
+
+class EvasionPlanner(object):
+	'''
+	Where to run when a shell hits us
+
+	HITDETECTED has no payload, so the shooter is estimated from the tanks
+	we know about: the one whose turret points at us most exactly, measured
+	against how wide a target we make at its range (hitTolerance), with
+	distance breaking ties. None if nobody's turret is within MaxAim of us.
+
+	Shells fly straight, so plan() tries headings every Step degrees and
+	scores where Distance units along each would leave us: across the line
+	of fire is best, further from it next; points near other tanks or
+	outside isOpen() cost, and so does turning the hull. Driving backwards
+	counts as the heading behind us, so a dodge along the hull's own axis
+	starts moving on the very next tick.
+	'''
+	def __init__(self, distance=15.0, step=30.0, maxAim=30.0, danger=20.0, turnWeight=0.5, isOpen=None):
+		self.Distance = distance
+		self.Step = step
+		self.MaxAim = maxAim
+		self.Danger = danger
+		self.TurnWeight = turnWeight
+		self.IsOpen = isOpen
+
+	def shooter(self, me, tanks):
+		best = None
+		bestScore = None
+		for tank in tanks:
+			distance = calculateDistance(tank['X'], tank['Y'], me['X'], me['Y'])
+			miss = abs(turnAngle(tank['TurretHeading'], serverHeading(tank['X'], tank['Y'], me['X'], me['Y'])))
+			if miss > self.MaxAim:
+				continue
+			score = (max(0.0, miss - hitTolerance(distance)), distance)
+			if bestScore is None or score < bestScore:
+				best = tank
+				bestScore = score
+		return best
+
+	def clear(self, x, y, heading):
+		if self.IsOpen is None:
+			return True
+		dx, dy = direction(heading)
+		return all(self.IsOpen(x + dx * self.Distance * part, y + dy * self.Distance * part) for part in (0.5, 1.0))
+
+	def plan(self, me, tanks):
+		'''
+		The Escape for me (our OBJECTUPDATE) given every enemy tank we know of
+		'''
+		shooter = self.shooter(me, tanks)
+		if shooter is not None:
+			fire = serverHeading(shooter['X'], shooter['Y'], me['X'], me['Y'])
+		best = None
+		bestScore = None
+		for index in range(int(360 // self.Step)):
+			heading = index * self.Step
+			if not self.clear(me['X'], me['Y'], heading):
+				continue
+			forward = abs(turnAngle(me['Heading'], heading))
+			backward = abs(turnAngle(me['Heading'], (heading + 180) % 360))
+			turn = min(forward, backward)
+			score = -self.TurnWeight * turn / 180.0
+			if shooter is not None:
+				angle = math.radians(turnAngle(fire, heading))
+				#across the line of fire, and away from the shooter rather than towards
+				score += abs(math.sin(angle)) + 0.25 * math.cos(angle)
+			dx, dy = direction(heading)
+			x = me['X'] + dx * self.Distance
+			y = me['Y'] + dy * self.Distance
+			for tank in tanks:
+				score -= max(0.0, 1.0 - calculateDistance(x, y, tank['X'], tank['Y']) / self.Danger)
+			if bestScore is None or score > bestScore:
+				reverse = backward < forward
+				best = (heading, reverse, turn)
+				bestScore = score
+		if best is None:
+			#boxed in - head for the middle of the arena
+			heading = serverHeading(me['X'], me['Y'], 0.0, 0.0)
+			best = (heading, False, abs(turnAngle(me['Heading'], heading)))
+		heading, reverse, turn = best
+		hullHeading = (heading + 180) % 360 if reverse else heading
+		return Escape(hullHeading, reverse, self.Distance, shooter['Id'] if shooter is not None else -1,
+			turn / HullSpeed + self.Distance / MoveSpeed)
+
+
+def evade(gameServer, planner, me, tanks, detectedAt=None, budget=0.05):
+	'''
+	Plan and send the dodge for a HITDETECTED - call it from the thread
+	that read the frame, before anything else. detectedAt is when the frame
+	was read (time.perf_counter(), by default gameServer.ReceivedAt); the
+	time from then until the commands are written goes to the evade.latency
+	histogram, and over budget seconds also counts evade.late.
+	'''
+	if detectedAt is None:
+		detectedAt = gameServer.ReceivedAt
+	escape = planner.plan(me, tanks)
+	move = ServerMessageTypes.MOVEBACKWARSDISTANCE if escape.Reverse else ServerMessageTypes.MOVEFORWARDDISTANCE
+	with gameServer.batch():
+		gameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': escape.Heading})
+		gameServer.sendMessage(move, {'Amount': escape.Distance})
+	latency = time.perf_counter() - detectedAt
+	gameServer.Metrics.observe('evade.latency', latency)
+	if latency > budget:
+		gameServer.Metrics.count('evade.late')
+	if Trace.Enabled:
+		Trace.record(TraceEvents.HIT, 0, escape.ShooterId, escape.Heading, escape.Distance, latency)
+	return escape
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+import socket
+import struct
+import argparse
+import threading
+import time
+import json
+
+
+class FrameReader(object):
+	'''
+	Buffered frame decoder for the server protocol (see ServerComms)
+
+	Every recv_into lands in one reusable buffer and every complete frame in
+	it is handed out before the socket is touched again, so a busy read of
+	many OBJECTUPDATEs costs one syscall instead of three per frame.
+
+	readFrame returns (messageType, payload) where payload is a memoryview
+	slice of the buffer - no copy is made. The view is only valid until the
+	next readFrame call, so decode it first. A frame that is only partly
+	received stays in the buffer until the rest arrives.
+	'''
+	MaxFrameSize = 2 + 255
+
+	def __init__(self, sock, bufferSize=65536):
+		self.Socket = sock
+		self.Buffer = bytearray(bufferSize)
+		self.View = memoryview(self.Buffer)
+		self.Start = 0
+		self.End = 0
+		self.Syscalls = 0
+		self.Frames = 0
+		self.BytesRead = 0
+
+	def readFrame(self):
+		'''
+		Return the next complete (messageType, payload) frame
+		'''
+		buf = self.Buffer
+		while True:
+			start = self.Start
+			if self.End - start >= 2:
+				frameEnd = start + 2 + buf[start + 1]
+				if frameEnd <= self.End:
+					self.Start = frameEnd
+					self.Frames += 1
+					return buf[start], self.View[start + 2:frameEnd]
+			self.fill()
+
+	def hasFrame(self):
+		'''
+		True if a complete frame is already buffered (readFrame won't block)
+		'''
+		start = self.Start
+		return self.End - start >= 2 and start + 2 + self.Buffer[start + 1] <= self.End
+
+	def fill(self):
+		'''
+		Do one recv_into, first moving any partial frame to the front if
+		there isn't room for a whole frame after it
+		'''
+		if self.Start == self.End:
+			self.Start = self.End = 0
+		elif len(self.Buffer) - self.End < self.MaxFrameSize:
+			remaining = self.End - self.Start
+			self.Buffer[:remaining] = self.Buffer[self.Start:self.End]
+			self.Start = 0
+			self.End = remaining
+
+		received = self.Socket.recv_into(self.View[self.End:])
+		self.Syscalls += 1
+		if received == 0:
+			raise ConnectionError('Server closed the connection')
+		self.End += received
+		self.BytesRead += received
+		return received
+
+	def stats(self):
+		return {
+			'frames': self.Frames,
+			'syscalls': self.Syscalls,
+			'bytes': self.BytesRead,
+			'syscallsPerFrame': self.Syscalls / float(self.Frames) if self.Frames else 0.0,
+		}
+
+
+class LegacyReader(object):
+	'''
+	The original three-recv reader, kept only so throughput mode has
+	something to compare against
+	'''
+	def __init__(self, sock):
+		self.Socket = sock
+		self.Syscalls = 0
+		self.Frames = 0
+
+	def readFrame(self):
+		messageType = struct.unpack('>B', self.Socket.recv(1))[0]
+		messageLen = struct.unpack('>B', self.Socket.recv(1))[0]
+		self.Syscalls += 2
+		messageData = b''
+		if messageLen:
+			messageData = self.Socket.recv(messageLen)
+			self.Syscalls += 1
+		self.Frames += 1
+		return messageType, messageData
+
+
+def syntheticStream(count, seed=0):
+	'''
+	Build a byte stream of OBJECTUPDATE frames like the ones a busy match sends
+	'''
+	frames = []
+	for i in range(count):
+		payload = json.dumps({
+			'Id': (seed + i) % 16, 'Name': 'Bot%d' % (i % 16), 'Type': 'Tank',
+			'X': (i * 7) % 200 - 100.0, 'Y': (i * 13) % 200 - 100.0,
+			'Heading': i % 360, 'TurretHeading': (i * 3) % 360,
+			'Health': 5, 'Ammo': 10}).encode()
+		frames.append(bytes((18, len(payload))) + payload)
+	return b''.join(frames)
+
+
+def measureThroughput(frameCount=200000, chunkSize=4096, legacy=False, decode=False):
+	'''
+	Push a synthetic frame stream through a socketpair and report frames/s
+	and syscalls per frame for the chosen reader
+	'''
+	stream = syntheticStream(1000)
+	perStream = 1000
+	repeats = max(1, frameCount // perStream)
+	reader, writer = socket.socketpair()
+
+	def feed():
+		view = memoryview(stream)
+		for _ in range(repeats):
+			for offset in range(0, len(view), chunkSize):
+				writer.sendall(view[offset:offset + chunkSize])
+		writer.close()
+
+	feeder = threading.Thread(target=feed)
+	feeder.daemon = True
+	frameReader = LegacyReader(reader) if legacy else FrameReader(reader)
+	total = repeats * perStream
+
+	feeder.start()
+	started = time.perf_counter()
+	for _ in range(total):
+		messageType, payload = frameReader.readFrame()
+		if decode:
+			json.loads(str(payload, 'utf-8'))
+	elapsed = time.perf_counter() - started
+	feeder.join()
+	reader.close()
+
+	return {
+		'reader': 'legacy' if legacy else 'buffered',
+		'frames': total,
+		'seconds': elapsed,
+		'framesPerSecond': total / elapsed,
+		'syscallsPerFrame': frameReader.Syscalls / float(total),
+	}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Frame decoder throughput mode')
+	parser.add_argument('-f', '--frames', default=200000, type=int, help='Number of frames to push')
+	parser.add_argument('-c', '--chunk', default=4096, type=int, help='Bytes per send on the writer side')
+	parser.add_argument('--decode', action='store_true', help='Also json-decode every payload')
+	parser.add_argument('--legacy', action='store_true', help='Also measure the old three-recv reader')
+	args = parser.parse_args()
+
+	runs = [False, True] if args.legacy else [False]
+	for legacy in runs:
+		result = measureThroughput(args.frames, args.chunk, legacy, args.decode)
+		print('{reader:>8}: {frames} frames in {seconds:.3f}s, {framesPerSecond:,.0f} frames/s, '
+			'{syscallsPerFrame:.3f} syscalls/frame'.format(**result))
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+import argparse
+import math
+import random
+import time
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+#scalar helpers - the ones every bot used to carry its own copy of
+def calculateDistance(ownX, ownY, otherX, otherY):
+	return math.hypot(otherX - ownX, otherY - ownY)
+
+
+#fns to calculate how many degree there is need to rotate
+def getHeading(x1, y1, x2, y2):
+	return radianToDegree(math.atan2(y2 - y1, x2 - x1)) % 360
+
+
+def radianToDegree(angle):
+	return angle * (180.0 / math.pi)
+
+
+def isTurnLeft(currentHeading, desiredHeading):
+	diff = desiredHeading - currentHeading
+	return diff >= 0 and diff <= 180
+
+
+def turnAngle(currentHeading, desiredHeading):
+	'''
+	Shortest signed turn from current to desired, in (-180, 180]
+	'''
+	return 180.0 - (180.0 - (desiredHeading - currentHeading)) % 360
+
+
+def inArc(heading, bearing, halfWidth):
+	return abs(turnAngle(heading, bearing)) <= halfWidth
+
+
+#batch versions - one call for every tracked object. They take sequences
+#(or numpy arrays) of x and y and return numpy arrays when numpy is
+#installed, plain lists otherwise.
+def distances(ownX, ownY, xs, ys):
+	if numpy is None:
+		return [calculateDistance(ownX, ownY, x, y) for x, y in zip(xs, ys)]
+	return numpy.hypot(numpy.asarray(xs, dtype=float) - ownX, numpy.asarray(ys, dtype=float) - ownY)
+
+
+def headings(ownX, ownY, xs, ys):
+	'''
+	getHeading from (ownX, ownY) to every point
+	'''
+	if numpy is None:
+		return [getHeading(ownX, ownY, x, y) for x, y in zip(xs, ys)]
+	dy = numpy.asarray(ys, dtype=float) - ownY
+	dx = numpy.asarray(xs, dtype=float) - ownX
+	return numpy.degrees(numpy.arctan2(dy, dx)) % 360
+
+
+def turnAngles(currentHeading, desiredHeadings):
+	if numpy is None:
+		return [turnAngle(currentHeading, desired) for desired in desiredHeadings]
+	return 180.0 - (180.0 - (numpy.asarray(desiredHeadings, dtype=float) - currentHeading)) % 360
+
+
+def inArcMask(ownX, ownY, xs, ys, heading, halfWidth, maxRange=None):
+	'''
+	True for every point within halfWidth degrees of heading (and within
+	maxRange, if given), as seen from (ownX, ownY)
+	'''
+	angles = turnAngles(heading, headings(ownX, ownY, xs, ys))
+	if numpy is None:
+		mask = [abs(angle) <= halfWidth for angle in angles]
+		if maxRange is not None:
+			mask = [inside and distance <= maxRange
+				for inside, distance in zip(mask, distances(ownX, ownY, xs, ys))]
+		return mask
+	mask = numpy.abs(angles) <= halfWidth
+	if maxRange is not None:
+		mask &= distances(ownX, ownY, xs, ys) <= maxRange
+	return mask
+
+
+def benchmark(counts=(10, 100, 1000), repeats=200):
+	'''
+	Scalar loop vs one batch call for distance + heading + turn + arc over
+	counts objects
+	'''
+	results = []
+	for count in counts:
+		xs = [random.uniform(-100, 100) for _ in range(count)]
+		ys = [random.uniform(-100, 100) for _ in range(count)]
+		if numpy is not None:
+			arrayXs = numpy.array(xs)
+			arrayYs = numpy.array(ys)
+		else:
+			arrayXs, arrayYs = xs, ys
+
+		started = time.perf_counter()
+		for _ in range(repeats):
+			for x, y in zip(xs, ys):
+				calculateDistance(10.0, -5.0, x, y)
+				bearing = getHeading(10.0, -5.0, x, y)
+				inArc(45.0, bearing, 30.0)
+		scalar = (time.perf_counter() - started) / repeats
+
+		started = time.perf_counter()
+		for _ in range(repeats):
+			distances(10.0, -5.0, arrayXs, arrayYs)
+			inArcMask(10.0, -5.0, arrayXs, arrayYs, 45.0, 30.0)
+		batch = (time.perf_counter() - started) / repeats
+
+		results.append((count, scalar, batch))
+	return results
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Scalar vs batch geometry benchmark')
+	parser.add_argument('-r', '--repeats', default=200, type=int, help='Calls per measurement')
+	args = parser.parse_args()
+
+	if numpy is None:
+		print('numpy is not installed - the batch numbers are the pure-Python fallback')
+	for count, scalar, batch in benchmark(repeats=args.repeats):
+		print('{:>5} objects: scalar {:9.1f} us  batch {:9.1f} us  ({:.1f}x)'.format(
+			count, scalar * 1e6, batch * 1e6, scalar / batch))
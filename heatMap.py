@@ -0,0 +1,217 @@
+#!/usr/bin/python
+
+import argparse
+import math
+import random
+import threading
+import time
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from geometry import distances, headings
+from pathPlanner import ArenaX, ArenaY, GoalDepth
+
+
+class HeatMap(object):
+	'''
+	Where the enemy tanks have been lately
+
+	A grid of cellSize squares over the arena, goals included. Every
+	sighting adds weight to the cell it was in, and all heat halves every
+	halfLife seconds. Decay is lazy: a sighting at time t is stored as
+	weight * exp((t - Epoch) / tau) and everything is multiplied back down
+	by exp(-(now - Epoch) / tau) when read, so add() touches one cell and
+	nothing runs between sightings. Epoch moves forward (one rescale of
+	the grid) before the stored numbers get large.
+
+	The queries look at the whole grid - with numpy in a handful of array
+	operations, otherwise in plain loops, as geometry does:
+
+	* hottest(x, y) - the bearing, in the server's turret headings, of the
+	  sector around (x, y) with the most recent activity
+	* danger(x, y) - heat in and around the cell holding (x, y)
+	* safest(x, y, maxDistance) - the centre of the open cell within reach
+	  with the least heat in and around it
+
+	The reader adds while strategies query, so every public method holds a
+	lock.
+	'''
+	def __init__(self, cellSize=10.0, halfLife=10.0, isOpen=None):
+		self.CellSize = float(cellSize)
+		self.Tau = halfLife / math.log(2.0)
+		self.Columns = int(math.ceil(2 * ArenaX / cellSize))
+		self.Rows = int(math.ceil(2 * (ArenaY + GoalDepth) / cellSize))
+		cells = range(self.Columns * self.Rows)
+		self.Xs = [-ArenaX + (cell % self.Columns + 0.5) * self.CellSize for cell in cells]
+		self.Ys = [-ArenaY - GoalDepth + (cell // self.Columns + 0.5) * self.CellSize for cell in cells]
+		self.Open = [isOpen is None or isOpen(x, y) for x, y in zip(self.Xs, self.Ys)]
+		if numpy is not None:
+			self.Xs = numpy.array(self.Xs)
+			self.Ys = numpy.array(self.Ys)
+			self.Open = numpy.array(self.Open)
+			self.Heat = numpy.zeros(len(cells))
+		else:
+			self.Heat = [0.0] * len(cells)
+		self.Epoch = None
+		self.Sightings = 0
+		self.Lock = threading.Lock()
+
+	def cellOf(self, x, y):
+		column = min(self.Columns - 1, max(0, int((x + ArenaX) // self.CellSize)))
+		row = min(self.Rows - 1, max(0, int((y + ArenaY + GoalDepth) // self.CellSize)))
+		return row * self.Columns + column
+
+	def add(self, x, y, weight=1.0, now=None):
+		'''
+		One sighting of an enemy at (x, y)
+		'''
+		if now is None:
+			now = time.monotonic()
+		with self.Lock:
+			if self.Epoch is None:
+				self.Epoch = now
+			scale = math.exp((now - self.Epoch) / self.Tau)
+			if scale > 1e6:
+				self.rescale(1.0 / scale)
+				self.Epoch = now
+				scale = 1.0
+			self.Heat[self.cellOf(x, y)] += weight * scale
+			self.Sightings += 1
+
+	def rescale(self, factor):
+		if numpy is not None:
+			self.Heat *= factor
+		else:
+			self.Heat = [heat * factor for heat in self.Heat]
+
+	def clear(self):
+		with self.Lock:
+			self.rescale(0.0)
+			self.Epoch = None
+
+	def values(self, now=None):
+		'''
+		Current heat of every cell, row by row
+		'''
+		if now is None:
+			now = time.monotonic()
+		with self.Lock:
+			if self.Epoch is None:
+				factor = 0.0
+			else:
+				factor = math.exp(-(now - self.Epoch) / self.Tau)
+			if numpy is not None:
+				return self.Heat * factor
+			return [heat * factor for heat in self.Heat]
+
+	def total(self, now=None):
+		return float(sum(self.values(now)))
+
+	def hottest(self, x, y, sectors=12, minHeat=1.0, maxRange=None, now=None):
+		'''
+		(server heading of the sector's centre, heat) for the hottest of
+		sectors equal slices around (x, y), or None if none has minHeat
+		'''
+		heat = self.values(now)
+		width = 360.0 / sectors
+		#the server's headings go the other way round from the maths angle
+		bearings = headings(x, y, self.Xs, self.Ys)
+		if numpy is not None:
+			weights = heat
+			if maxRange is not None:
+				weights = numpy.where(distances(x, y, self.Xs, self.Ys) <= maxRange, heat, 0.0)
+			slices = ((360.0 - bearings) % 360 // width).astype(int) % sectors
+			totals = numpy.bincount(slices, weights=weights, minlength=sectors)
+			best = int(numpy.argmax(totals))
+			hottest = float(totals[best])
+		else:
+			totals = [0.0] * sectors
+			ranges = distances(x, y, self.Xs, self.Ys) if maxRange is not None else None
+			for cell, value in enumerate(heat):
+				if not value or (ranges is not None and ranges[cell] > maxRange):
+					continue
+				totals[int((360.0 - bearings[cell]) % 360 // width) % sectors] += value
+			hottest = max(totals)
+			best = totals.index(hottest)
+		if hottest < minHeat:
+			return None
+		return (best + 0.5) * width, hottest
+
+	def spread(self, heat):
+		'''
+		Each cell plus its eight neighbours - being next to a hot cell is
+		nearly as bad as being in it
+		'''
+		columns = self.Columns
+		if numpy is not None:
+			grid = numpy.pad(heat.reshape(self.Rows, columns), 1)
+			total = sum(grid[1 + dr:1 + dr + self.Rows, 1 + dc:1 + dc + columns]
+				for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+			return total.ravel()
+		total = [0.0] * len(heat)
+		for cell, value in enumerate(heat):
+			if not value:
+				continue
+			row, column = divmod(cell, columns)
+			for r in range(max(0, row - 1), min(self.Rows, row + 2)):
+				for c in range(max(0, column - 1), min(columns, column + 2)):
+					total[r * columns + c] += value
+		return total
+
+	def danger(self, x, y, now=None):
+		return float(self.spread(self.values(now))[self.cellOf(x, y)])
+
+	def safest(self, x, y, maxDistance=40.0, now=None):
+		'''
+		(x, y) centre of the open cell within maxDistance of (x, y) with the
+		least heat around it - the nearest of equally quiet cells - or None
+		'''
+		threat = self.spread(self.values(now))
+		ranges = distances(x, y, self.Xs, self.Ys)
+		#a unit of heat outweighs any distance inside the arena
+		tieBreak = 1e-3 / (2 * (ArenaX + ArenaY + GoalDepth))
+		if numpy is not None:
+			score = numpy.where(self.Open & (ranges <= maxDistance), threat + tieBreak * ranges, numpy.inf)
+			best = int(numpy.argmin(score))
+			if numpy.isinf(score[best]):
+				return None
+		else:
+			candidates = [cell for cell in range(len(threat)) if self.Open[cell] and ranges[cell] <= maxDistance]
+			if not candidates:
+				return None
+			best = min(candidates, key=lambda cell: threat[cell] + tieBreak * ranges[cell])
+		return float(self.Xs[best]), float(self.Ys[best])
+
+
+def benchmark(sightings=10000, queries=1000):
+	heat = HeatMap()
+	points = [(random.uniform(-ArenaX, ArenaX), random.uniform(-ArenaY, ArenaY)) for _ in range(sightings)]
+	started = time.perf_counter()
+	for i, (x, y) in enumerate(points):
+		heat.add(x, y, now=i * 0.05)
+	add = (time.perf_counter() - started) / sightings
+	now = sightings * 0.05
+	started = time.perf_counter()
+	for _ in range(queries):
+		heat.hottest(0.0, 0.0, now=now)
+	hottest = (time.perf_counter() - started) / queries
+	started = time.perf_counter()
+	for _ in range(queries):
+		heat.safest(0.0, 0.0, now=now)
+	safest = (time.perf_counter() - started) / queries
+	return add, hottest, safest
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Time heat map updates and queries')
+	parser.add_argument('-s', '--sightings', default=10000, type=int, help='Sightings added')
+	parser.add_argument('-q', '--queries', default=1000, type=int, help='Calls per query timed')
+	args = parser.parse_args()
+
+	if numpy is None:
+		print('numpy is not installed - these are the pure-Python fallback numbers')
+	add, hottest, safest = benchmark(args.sightings, args.queries)
+	print('add {:.2f} us, hottest {:.1f} us, safest {:.1f} us'.format(add * 1e6, hottest * 1e6, safest * 1e6))
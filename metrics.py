@@ -0,0 +1,293 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+
+from messageTypes import ServerMessageTypes
+
+
+class Histogram(object):
+	'''
+	Latency histogram with power-of-two microsecond buckets - bucket k
+	holds samples below 2**k us, the last one everything from ~16s up.
+	Percentiles are the upper bound of the bucket they fall in, so they are
+	within a factor of two, which is plenty to see where time goes.
+	'''
+	Buckets = 25
+
+	def __init__(self):
+		self.Counts = [0] * self.Buckets
+		self.Count = 0
+		self.Sum = 0.0
+		self.Min = None
+		self.Max = 0.0
+
+	def record(self, seconds):
+		micros = seconds * 1e6
+		bucket = math.frexp(micros)[1] if micros >= 1.0 else 0
+		self.Counts[min(bucket, self.Buckets - 1)] += 1
+		self.Count += 1
+		self.Sum += seconds
+		if self.Min is None or seconds < self.Min:
+			self.Min = seconds
+		if seconds > self.Max:
+			self.Max = seconds
+
+	def percentile(self, fraction):
+		if not self.Count:
+			return 0.0
+		wanted = fraction * self.Count
+		seen = 0
+		for bucket, count in enumerate(self.Counts):
+			seen += count
+			if seen >= wanted:
+				return min(2.0 ** bucket / 1e6, self.Max)
+		return self.Max
+
+	def summary(self):
+		return {
+			'count': self.Count,
+			'meanMs': self.Sum / self.Count * 1e3 if self.Count else 0.0,
+			'minMs': (self.Min or 0.0) * 1e3,
+			'p50Ms': self.percentile(0.5) * 1e3,
+			'p90Ms': self.percentile(0.9) * 1e3,
+			'p99Ms': self.percentile(0.99) * 1e3,
+			'maxMs': self.Max * 1e3,
+		}
+
+
+class EffectTracker(object):
+	'''
+	Command-to-effect latency: a TURNTURRETTOHEADING/TURNTOHEADING is
+	pending until our own OBJECTUPDATE reports a heading within tolerance
+	degrees of what we asked for. A newer command for the same field
+	replaces the pending one unmeasured.
+
+	It takes no lock of its own: the reader observes while any thread
+	sends, so Metrics only calls it holding Metrics.Lock.
+	'''
+	# command -> the OBJECTUPDATE field it moves
+	Fields = {
+		ServerMessageTypes.TURNTURRETTOHEADING: 'TurretHeading',
+		ServerMessageTypes.TURNTOHEADING: 'Heading',
+	}
+
+	def __init__(self, tolerance=2.0, timeout=10.0):
+		self.Tolerance = tolerance
+		self.Timeout = timeout
+		self.IdTank = None
+		self.Pending = {}
+
+	def sent(self, messageType, messagePayload, now):
+		field = self.Fields.get(messageType)
+		if field is not None and messagePayload and 'Amount' in messagePayload:
+			self.Pending[field] = (messageType, messagePayload['Amount'] % 360, now)
+
+	def observed(self, message, now):
+		'''
+		(commandType, seconds) for every pending command this update completes
+		'''
+		if self.IdTank is None:
+			# the first update after we spawn is about us, see the bootstrap
+			self.IdTank = message.get('Id')
+		if message.get('Id') != self.IdTank or not self.Pending:
+			return []
+		done = []
+		for field, (messageType, target, sentAt) in list(self.Pending.items()):
+			value = message.get(field)
+			if value is None:
+				continue
+			off = abs((value - target + 180.0) % 360 - 180.0)
+			if off <= self.Tolerance:
+				done.append((messageType, now - sentAt))
+				del self.Pending[field]
+			elif now - sentAt > self.Timeout:
+				del self.Pending[field]
+		return done
+
+
+class Metrics(object):
+	'''
+	Counters and latency histograms for one bot
+
+	ServerComms calls inbound() for every frame it decodes and outbound()
+	for every frame it sends. That gives, per message type:
+
+	* in.TYPE / out.TYPE counters
+	* decode.TYPE - JSON decode time of an inbound frame
+	* send.TYPE - encode plus write (or queue, inside batch()) time
+	* reaction - from receiving an OBJECTUPDATE to the first command sent
+	  after it, i.e. how long the decision took
+	* effect.TYPE - command sent until the server reports it done (see
+	  EffectTracker)
+
+	Strategies can add their own with count(), observe() and timer().
+	'''
+	def __init__(self):
+		self.Lock = threading.Lock()
+		self.Started = time.monotonic()
+		self.Counters = {}
+		self.Histograms = {}
+		self.LastUpdate = None
+		self.Effects = EffectTracker()
+
+	def count(self, name, amount=1):
+		with self.Lock:
+			self.Counters[name] = self.Counters.get(name, 0) + amount
+
+	def observe(self, name, seconds):
+		with self.Lock:
+			histogram = self.Histograms.get(name)
+			if histogram is None:
+				histogram = self.Histograms[name] = Histogram()
+			histogram.record(seconds)
+
+	def timer(self, name):
+		return Timer(self, name)
+
+	def setIdTank(self, idTank):
+		with self.Lock:
+			self.Effects.IdTank = idTank
+
+	def inbound(self, messageType, receivedAt, decodeSeconds, messagePayload):
+		typeName = ServerMessageTypes.strings.get(messageType, str(messageType))
+		self.count('in.' + typeName)
+		self.observe('decode.' + typeName, decodeSeconds)
+		if messageType == ServerMessageTypes.OBJECTUPDATE:
+			with self.Lock:
+				self.LastUpdate = receivedAt
+				done = self.Effects.observed(messagePayload, receivedAt)
+			for commandType, seconds in done:
+				self.observe('effect.' + ServerMessageTypes.strings[commandType], seconds)
+
+	def outbound(self, messageType, startedAt, sendSeconds, messagePayload):
+		typeName = ServerMessageTypes.strings.get(messageType, str(messageType))
+		self.count('out.' + typeName)
+		self.observe('send.' + typeName, sendSeconds)
+		# only the first command after an update is a reaction to it - taken
+		# under the lock, as the reader sets LastUpdate and any thread sends.
+		# A command started before the update arrived isn't a reaction to
+		# it, so that update is left for the next one.
+		with self.Lock:
+			lastUpdate = self.LastUpdate
+			if lastUpdate is not None and lastUpdate <= startedAt:
+				self.LastUpdate = None
+			else:
+				lastUpdate = None
+			self.Effects.sent(messageType, messagePayload, startedAt)
+		if lastUpdate is not None:
+			self.observe('reaction', startedAt - lastUpdate)
+
+	def snapshot(self):
+		with self.Lock:
+			uptime = time.monotonic() - self.Started
+			return {
+				'uptime': uptime,
+				'counters': dict(self.Counters),
+				'rates': dict((name, count / uptime) for name, count in self.Counters.items()),
+				'histograms': dict((name, histogram.summary()) for name, histogram in self.Histograms.items()),
+			}
+
+
+class Timer(object):
+	'''
+	with metrics.timer('decision.scan'): ... records the block's duration
+	'''
+	def __init__(self, metrics, name):
+		self.Metrics = metrics
+		self.Name = name
+
+	def __enter__(self):
+		self.Started = time.perf_counter()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.Metrics.observe(self.Name, time.perf_counter() - self.Started)
+
+
+def serveHttp(metrics, port, host='127.0.0.1'):
+	'''
+	Serve metrics.snapshot() as JSON on http://host:port/ from a daemon
+	thread. Binds to localhost unless told otherwise.
+	'''
+	#http.server is most of this module's import time - only pay it when serving
+	from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+	class Handler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			body = json.dumps(metrics.snapshot(), indent=1, sort_keys=True).encode('utf-8')
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer((host, port), Handler)
+	server.daemon_threads = True
+	thread = threading.Thread(target=server.serve_forever, name='metrics-http')
+	thread.daemon = True
+	thread.start()
+	return server
+
+
+def dumpEvery(metrics, path, interval=5.0):
+	'''
+	Rewrite path with metrics.snapshot() every interval seconds from a
+	daemon thread. The file is replaced atomically, so a reader never
+	sees half of it.
+	'''
+	def dump():
+		while True:
+			time.sleep(interval)
+			temporary = path + '.tmp'
+			with open(temporary, 'w') as dumpFile:
+				json.dump(metrics.snapshot(), dumpFile, indent=1, sort_keys=True)
+			os.replace(temporary, path)
+
+	thread = threading.Thread(target=dump, name='metrics-dump')
+	thread.daemon = True
+	thread.start()
+	return thread
+
+
+def export(metrics, port=None, path=None, interval=5.0):
+	'''
+	Start whichever exporters the command line asked for
+	'''
+	if port:
+		serveHttp(metrics, port)
+	if path:
+		dumpEvery(metrics, path, interval)
+
+
+def formatSnapshot(snapshot):
+	lines = ['uptime {:.1f}s'.format(snapshot['uptime'])]
+	for name in sorted(snapshot['counters']):
+		lines.append('{:<32} {:>9} {:>9.1f}/s'.format(name, snapshot['counters'][name], snapshot['rates'][name]))
+	lines.append('{:<32} {:>9} {:>9} {:>9} {:>9} {:>9}'.format('histogram', 'count', 'mean ms', 'p50 ms', 'p99 ms', 'max ms'))
+	for name in sorted(snapshot['histograms']):
+		summary = snapshot['histograms'][name]
+		lines.append('{:<32} {count:>9} {meanMs:>9.3f} {p50Ms:>9.3f} {p99Ms:>9.3f} {maxMs:>9.3f}'.format(name, **summary))
+	return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Show the metrics of a running bot')
+	parser.add_argument('source', help='Port of a bot started with --metrics-port, or a file written with --metrics-file')
+	args = parser.parse_args()
+
+	if args.source.isdigit():
+		from urllib.request import urlopen
+		with urlopen('http://127.0.0.1:{}/'.format(args.source)) as response:
+			snapshot = json.load(response)
+	else:
+		with open(args.source) as source:
+			snapshot = json.load(source)
+	print(formatSnapshot(snapshot))
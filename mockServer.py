@@ -0,0 +1,428 @@
+#!/usr/bin/python
+
+import asyncio
+import argparse
+import json
+import logging
+import math
+import random
+
+from messageTypes import ServerMessageTypes
+from commandBuffer import encodeFrame
+
+
+# arena and physics - close enough to the real game for benchmarking
+ArenaX = 70.0
+ArenaY = 100.0
+GoalDepth = 20.0
+GoalWidth = 20.0
+MoveSpeed = 10.0
+TurnSpeed = 90.0
+TurretSpeed = 90.0
+ProjectileSpeed = 40.0
+ProjectileRange = 100.0
+HitRadius = 2.5
+PickupRadius = 3.0
+ViewAngle = 25.0
+ViewRange = 100.0
+StartHealth = 5
+StartAmmo = 10
+RespawnTime = 3.0
+
+
+def normaliseHeading(heading):
+	return heading % 360
+
+
+def turnTowards(current, target, maxStep):
+	diff = 180.0 - (180.0 - (target - current)) % 360
+	if abs(diff) <= maxStep:
+		return normaliseHeading(target), True
+	return normaliseHeading(current + math.copysign(maxStep, diff)), False
+
+
+def direction(heading):
+	'''
+	Unit vector for a server heading (bots send 360 - the maths angle)
+	'''
+	radians = math.radians(heading)
+	return math.cos(radians), -math.sin(radians)
+
+
+class MockObject(object):
+	def __init__(self, id, category, name, x, y):
+		self.Id = id
+		self.Type = category
+		self.Name = name
+		self.X = x
+		self.Y = y
+		self.Heading = 0.0
+		self.TurretHeading = 0.0
+		self.Health = 0
+		self.Ammo = 0
+
+	def payload(self):
+		return {
+			'Id': self.Id, 'Name': self.Name, 'Type': self.Type,
+			'X': round(self.X, 3), 'Y': round(self.Y, 3),
+			'Heading': round(self.Heading, 3), 'TurretHeading': round(self.TurretHeading, 3),
+			'Health': self.Health, 'Ammo': self.Ammo,
+		}
+
+
+class MockTank(MockObject):
+	def __init__(self, id, name, x, y, client):
+		MockObject.__init__(self, id, "Tank", name, x, y)
+		self.Client = client
+		self.Health = StartHealth
+		self.Ammo = StartAmmo
+		self.TargetHeading = None
+		self.TargetTurretHeading = None
+		self.Distance = 0.0
+		self.Toggles = set()
+		self.InGoal = False
+		self.DeadUntil = None
+
+	def stop(self, what):
+		if what in ('all', 'move'):
+			self.Distance = 0.0
+			self.Toggles.difference_update((ServerMessageTypes.TOGGLEFORWARD, ServerMessageTypes.TOGGLEREVERSE))
+		if what in ('all', 'turn'):
+			self.TargetHeading = None
+			self.Toggles.difference_update((ServerMessageTypes.TOGGLELEFT, ServerMessageTypes.TOGGLERIGHT))
+		if what in ('all', 'turret'):
+			self.TargetTurretHeading = None
+			self.Toggles.difference_update((ServerMessageTypes.TOGGLETURRETLEFT, ServerMessageTypes.TOGGLETURRETRIGHT))
+
+	def step(self, dt):
+		toggles = self.Toggles
+		if self.TargetHeading is not None:
+			self.Heading, done = turnTowards(self.Heading, self.TargetHeading, TurnSpeed * dt)
+			if done:
+				self.TargetHeading = None
+		elif ServerMessageTypes.TOGGLELEFT in toggles:
+			self.Heading = normaliseHeading(self.Heading - TurnSpeed * dt)
+		elif ServerMessageTypes.TOGGLERIGHT in toggles:
+			self.Heading = normaliseHeading(self.Heading + TurnSpeed * dt)
+
+		if self.TargetTurretHeading is not None:
+			self.TurretHeading, done = turnTowards(self.TurretHeading, self.TargetTurretHeading, TurretSpeed * dt)
+			if done:
+				self.TargetTurretHeading = None
+		elif ServerMessageTypes.TOGGLETURRETLEFT in toggles:
+			self.TurretHeading = normaliseHeading(self.TurretHeading - TurretSpeed * dt)
+		elif ServerMessageTypes.TOGGLETURRETRIGHT in toggles:
+			self.TurretHeading = normaliseHeading(self.TurretHeading + TurretSpeed * dt)
+
+		move = 0.0
+		if self.Distance:
+			move = math.copysign(min(abs(self.Distance), MoveSpeed * dt), self.Distance)
+			self.Distance -= move
+		elif ServerMessageTypes.TOGGLEFORWARD in toggles:
+			move = MoveSpeed * dt
+		elif ServerMessageTypes.TOGGLEREVERSE in toggles:
+			move = -MoveSpeed * dt
+		if move:
+			dx, dy = direction(self.Heading)
+			x = self.X + dx * move
+			y = self.Y + dy * move
+			# the goals are the only way past the end walls
+			limitY = ArenaY + GoalDepth if abs(x) < GoalWidth else ArenaY
+			self.X = max(-ArenaX, min(ArenaX, x))
+			self.Y = max(-limitY, min(limitY, y))
+
+
+class MockProjectile(object):
+	def __init__(self, owner, x, y, heading):
+		self.Owner = owner
+		self.X = x
+		self.Y = y
+		self.DX, self.DY = direction(heading)
+		self.Travelled = 0.0
+
+
+class MockClient(object):
+	def __init__(self, reader, writer):
+		self.Reader = reader
+		self.Writer = writer
+		self.Tank = None
+		self.Handler = None
+		self.FramesIn = 0
+		self.FramesOut = 0
+
+
+class MockServer(object):
+	'''
+	Local stand-in for the game server, speaking the ServerComms framing
+	(1-byte type, 1-byte length, JSON payload)
+
+	It accepts CREATETANK, DESPAWNTANK, FIRE and the movement, turret and
+	toggle commands, and simulates tanks, projectiles and pickups on a fixed
+	tick. Every tick uses the same dt whatever the wall clock does, and
+	spawns come from a seeded RNG, so one seed and one bot give the same
+	match every time. Clients get OBJECTUPDATE for their own tank and for
+	whatever is inside their turret's view, plus HITDETECTED,
+	SUCCESSFULLHIT, DESTROYED, KILL, HEALTHPICKUP, AMMOPICKUP, ENTEREDGOAL
+	and a GAMETIMEUPDATE every second.
+	'''
+	def __init__(self, tickRate=20.0, seed=0, duration=None, pickups=4, maxBuffered=1 << 16):
+		self.TickRate = float(tickRate)
+		self.Random = random.Random(seed)
+		self.Duration = duration
+		self.PickupCount = pickups
+		self.MaxBuffered = maxBuffered
+		self.Clients = []
+		self.Tanks = {}
+		self.Pickups = {}
+		self.Projectiles = []
+		self.NextId = 1
+		self.GameTime = 0.0
+		self.NextSecond = 1.0
+		self.Ticks = 0
+		self.FramesIn = 0
+		self.FramesOut = 0
+
+	def newId(self):
+		id = self.NextId
+		self.NextId += 1
+		return id
+
+	def randomPosition(self):
+		return self.Random.uniform(-ArenaX + 5, ArenaX - 5), self.Random.uniform(-ArenaY + 5, ArenaY - 5)
+
+	def spawnPickup(self):
+		category = self.Random.choice(("HealthPickup", "AmmoPickup"))
+		x, y = self.randomPosition()
+		pickup = MockObject(self.newId(), category, category, x, y)
+		self.Pickups[pickup.Id] = pickup
+
+	def send(self, client, messageType, messagePayload=None):
+		transport = client.Writer.transport
+		if transport.is_closing():
+			return
+		# a bot that stops reading loses updates rather than growing our buffers
+		if messageType == ServerMessageTypes.OBJECTUPDATE and \
+				transport.get_write_buffer_size() > self.MaxBuffered:
+			return
+		client.Writer.write(encodeFrame(messageType, messagePayload))
+		client.FramesOut += 1
+		self.FramesOut += 1
+
+	async def handleClient(self, reader, writer):
+		client = MockClient(reader, writer)
+		client.Handler = asyncio.current_task()
+		self.Clients.append(client)
+		try:
+			while True:
+				header = await reader.readexactly(2)
+				payload = None
+				if header[1]:
+					data = await reader.readexactly(header[1])
+					try:
+						payload = json.loads(data)
+					except ValueError:
+						payload = data
+				client.FramesIn += 1
+				self.FramesIn += 1
+				if payload is not None and not isinstance(payload, dict):
+					# the length byte kept us in step - drop just this frame
+					logging.debug("Dropped a frame with payload {!r}".format(payload))
+					continue
+				self.handleCommand(client, header[0], payload)
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			self.Clients.remove(client)
+			if client.Tank is not None:
+				self.Tanks.pop(client.Tank.Id, None)
+			writer.close()
+
+	def handleCommand(self, client, messageType, payload):
+		types = ServerMessageTypes
+		tank = client.Tank
+		if messageType == types.CREATETANK:
+			if tank is None:
+				x, y = self.randomPosition()
+				name = payload.get('Name', 'Tank') if payload else 'Tank'
+				tank = client.Tank = MockTank(self.newId(), name, x, y, client)
+				tank.Heading = self.Random.uniform(0, 360)
+				tank.TurretHeading = tank.Heading
+				self.Tanks[tank.Id] = tank
+				# bots learn their Id from the first OBJECTUPDATE they get
+				self.send(client, types.OBJECTUPDATE, tank.payload())
+			return
+		if tank is None or tank.DeadUntil is not None:
+			return
+
+		amount = payload.get('Amount', 0) if payload else 0
+		if type(amount) not in (int, float):
+			logging.debug("Dropped a command with Amount {!r}".format(amount))
+			return
+		if messageType == types.DESPAWNTANK:
+			self.Tanks.pop(tank.Id, None)
+			client.Tank = None
+		elif messageType == types.FIRE:
+			if tank.Ammo > 0:
+				tank.Ammo -= 1
+				self.Projectiles.append(MockProjectile(tank, tank.X, tank.Y, tank.TurretHeading))
+		elif messageType == types.TURNTOHEADING:
+			tank.TargetHeading = normaliseHeading(amount)
+		elif messageType == types.TURNTURRETTOHEADING:
+			tank.TargetTurretHeading = normaliseHeading(amount)
+		elif messageType == types.MOVEFORWARDDISTANCE:
+			tank.Distance = float(amount)
+		elif messageType == types.MOVEBACKWARSDISTANCE:
+			tank.Distance = -float(amount)
+		elif messageType == types.STOPALL:
+			tank.stop('all')
+		elif messageType == types.STOPTURN:
+			tank.stop('turn')
+		elif messageType == types.STOPMOVE:
+			tank.stop('move')
+		elif messageType == types.STOPTURRET:
+			tank.stop('turret')
+		elif types.TOGGLEFORWARD <= messageType <= types.TOGGLETURRETRIGHT:
+			if messageType in tank.Toggles:
+				tank.Toggles.discard(messageType)
+			else:
+				tank.Toggles.add(messageType)
+
+	def canSee(self, tank, other):
+		dx = other.X - tank.X
+		dy = other.Y - tank.Y
+		distance = math.hypot(dx, dy)
+		if distance > ViewRange:
+			return False
+		bearing = normaliseHeading(-math.degrees(math.atan2(dy, dx)))
+		return abs(180.0 - (180.0 - (bearing - tank.TurretHeading)) % 360) <= ViewAngle
+
+	def tick(self):
+		types = ServerMessageTypes
+		dt = 1.0 / self.TickRate
+		self.GameTime += dt
+		self.Ticks += 1
+
+		for tank in list(self.Tanks.values()):
+			if tank.DeadUntil is not None:
+				if self.GameTime >= tank.DeadUntil:
+					tank.DeadUntil = None
+					tank.Health = StartHealth
+					tank.Ammo = StartAmmo
+					tank.X, tank.Y = self.randomPosition()
+				continue
+			tank.step(dt)
+
+			inGoal = abs(tank.Y) > ArenaY
+			if inGoal and not tank.InGoal:
+				self.send(tank.Client, types.ENTEREDGOAL)
+			tank.InGoal = inGoal
+
+			for pickup in list(self.Pickups.values()):
+				if math.hypot(pickup.X - tank.X, pickup.Y - tank.Y) <= PickupRadius:
+					del self.Pickups[pickup.Id]
+					if pickup.Type == "HealthPickup":
+						tank.Health = min(StartHealth, tank.Health + 1)
+						self.send(tank.Client, types.HEALTHPICKUP)
+					else:
+						tank.Ammo += 5
+						self.send(tank.Client, types.AMMOPICKUP)
+
+		for projectile in list(self.Projectiles):
+			step = ProjectileSpeed * dt
+			projectile.X += projectile.DX * step
+			projectile.Y += projectile.DY * step
+			projectile.Travelled += step
+			if projectile.Travelled >= ProjectileRange:
+				self.Projectiles.remove(projectile)
+				continue
+			for tank in self.Tanks.values():
+				if tank is projectile.Owner or tank.DeadUntil is not None:
+					continue
+				if math.hypot(tank.X - projectile.X, tank.Y - projectile.Y) <= HitRadius:
+					self.Projectiles.remove(projectile)
+					tank.Health -= 1
+					self.send(tank.Client, types.HITDETECTED)
+					if projectile.Owner.Id in self.Tanks:
+						self.send(projectile.Owner.Client, types.SUCCESSFULLHIT)
+					if tank.Health <= 0:
+						tank.DeadUntil = self.GameTime + RespawnTime
+						self.send(tank.Client, types.DESTROYED)
+						if projectile.Owner.Id in self.Tanks:
+							self.send(projectile.Owner.Client, types.KILL)
+					break
+
+		while len(self.Pickups) < self.PickupCount:
+			self.spawnPickup()
+
+		for tank in self.Tanks.values():
+			if tank.DeadUntil is not None:
+				continue
+			self.send(tank.Client, types.OBJECTUPDATE, tank.payload())
+			for other in self.Tanks.values():
+				if other is not tank and other.DeadUntil is None and self.canSee(tank, other):
+					self.send(tank.Client, types.OBJECTUPDATE, other.payload())
+			for pickup in self.Pickups.values():
+				if self.canSee(tank, pickup):
+					self.send(tank.Client, types.OBJECTUPDATE, pickup.payload())
+
+		# half a tick of slack for the rounding in GameTime
+		if self.GameTime + dt / 2 >= self.NextSecond:
+			while self.NextSecond <= self.GameTime + dt / 2:
+				self.NextSecond += 1.0
+			remaining = int(self.Duration - self.GameTime) if self.Duration else int(self.GameTime)
+			for client in self.Clients:
+				self.send(client, types.GAMETIMEUPDATE, {'Time': remaining})
+
+	async def run(self):
+		loop = asyncio.get_event_loop()
+		interval = 1.0 / self.TickRate
+		nextTick = loop.time()
+		while self.Duration is None or self.GameTime < self.Duration:
+			self.tick()
+			nextTick += interval
+			await asyncio.sleep(max(0.0, nextTick - loop.time()))
+
+	async def serve(self, hostname, port):
+		server = await asyncio.start_server(self.handleClient, hostname, port)
+		logging.info("Mock server listening on {}:{} at {} ticks/s".format(hostname, port, self.TickRate))
+		async with server:
+			await self.run()
+			# let every handler see its connection close before the loop goes away
+			handlers = [client.Handler for client in self.Clients]
+			for client in list(self.Clients):
+				client.Writer.close()
+			await asyncio.gather(*handlers, return_exceptions=True)
+
+	def stats(self):
+		return {
+			'ticks': self.Ticks,
+			'gameTime': self.GameTime,
+			'clients': len(self.Clients),
+			'framesIn': self.FramesIn,
+			'framesOut': self.FramesOut,
+		}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Local protocol-compatible game server')
+	parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+	parser.add_argument('-H', '--hostname', default='127.0.0.1', help='Hostname to listen on')
+	parser.add_argument('-p', '--port', default=8052, type=int, help='Port to listen on')
+	parser.add_argument('-t', '--tick-rate', default=20.0, type=float, help='Simulation ticks per second')
+	parser.add_argument('-s', '--seed', default=0, type=int, help='Seed for spawn positions')
+	parser.add_argument('--duration', default=None, type=float, help='Stop after this many seconds of game time')
+	parser.add_argument('--pickups', default=4, type=int, help='Pickups kept on the field')
+	args = parser.parse_args()
+
+	if args.debug:
+		logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.DEBUG)
+	else:
+		logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.INFO)
+
+	server = MockServer(args.tick_rate, args.seed, args.duration, args.pickups)
+	try:
+		asyncio.run(server.serve(args.hostname, args.port))
+	except KeyboardInterrupt:
+		pass
+	logging.info("Finished after {ticks} ticks ({gameTime:.1f}s game time), "
+		"{framesIn} frames in, {framesOut} frames out".format(**server.stats()))
@@ -0,0 +1,215 @@
+#!/usr/bin/python
+
+import asyncio
+import collections.abc
+import contextvars
+import logging
+import resource
+import time
+
+from asyncClient import AsyncBot, AsyncAimBot, AsyncScanBot
+from serverComms import argumentParser, setupLogging, threadedOnly
+
+
+Strategies = {
+	'botPy': AsyncBot,
+	'aimBot': AsyncAimBot,
+	'scanBot': AsyncScanBot,
+}
+
+# the BotMeter of whichever bot started the running task - child tasks
+# inherit it, so everything a bot spawns is charged to that bot
+CurrentMeter = contextvars.ContextVar('CurrentMeter', default=None)
+
+
+def rss():
+	'''
+	Resident set size of the process in bytes
+	'''
+	try:
+		with open('/proc/self/statm') as statm:
+			return int(statm.read().split()[1]) * resource.getpagesize()
+	except (OSError, IndexError, ValueError):
+		# no procfs - peak RSS is the best we can do (KiB on Linux, bytes on macOS)
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class BotMeter(object):
+	'''
+	CPU seconds spent inside one bot's tasks, and what the process RSS did
+	while the bot started up
+	'''
+	def __init__(self, name, strategy):
+		self.Name = name
+		self.Strategy = strategy
+		self.Cpu = 0.0
+		self.Steps = 0
+		self.StartupRss = 0
+		self.Error = None
+
+
+class MeteredCoroutine(collections.abc.Coroutine):
+	'''
+	Wraps a coroutine and charges the thread CPU time of every step the
+	loop runs (send/throw) to meter
+	'''
+	def __init__(self, coro, meter):
+		self.Coro = coro
+		self.Meter = meter
+
+	def send(self, value):
+		started = time.thread_time()
+		try:
+			return self.Coro.send(value)
+		finally:
+			self.Meter.Cpu += time.thread_time() - started
+			self.Meter.Steps += 1
+
+	def throw(self, *args):
+		started = time.thread_time()
+		try:
+			return self.Coro.throw(*args)
+		finally:
+			self.Meter.Cpu += time.thread_time() - started
+			self.Meter.Steps += 1
+
+	def close(self):
+		return self.Coro.close()
+
+	def __await__(self):
+		return self.Coro.__await__()
+
+
+def meteringTaskFactory(loop, coro, context=None):
+	if context is None:
+		meter = CurrentMeter.get()
+	else:
+		meter = context.get(CurrentMeter)
+	if meter is not None and asyncio.iscoroutine(coro):
+		coro = MeteredCoroutine(coro, meter)
+	if context is None:
+		return asyncio.Task(coro, loop=loop)
+	return asyncio.Task(coro, loop=loop, context=context)
+
+
+class BotRunner(object):
+	'''
+	Hosts many bots in one process, one asyncio loop multiplexing all their
+	connections. Each bot is an AsyncBot (or subclass) with its own
+	AsyncServerComms, WorldState and aiming state - nothing is shared
+	between them.
+
+	Per-bot CPU is measured by timing every step of the bot's tasks. RSS
+	can't be split between bots living in one heap, so each bot gets the
+	growth seen while it connected and spawned, and the report also shows
+	the process total divided by the number of bots.
+	'''
+	def __init__(self, hostname, port, lineup):
+		self.Bots = []
+		self.Meters = []
+		for strategy, name in lineup:
+			self.Bots.append(Strategies[strategy](hostname, port, name))
+			self.Meters.append(BotMeter(name, strategy))
+
+	async def runBot(self, bot, meter):
+		CurrentMeter.set(meter)
+		before = rss()
+		task = asyncio.ensure_future(bot.run())
+		# the tank id arrives once the bot is up
+		while bot.IdTank is None and not task.done():
+			await asyncio.sleep(0.05)
+		meter.StartupRss = rss() - before
+		try:
+			await task
+		except Exception as exception:
+			meter.Error = exception
+			logging.error("{} stopped: {!r}".format(bot.Name, exception))
+
+	async def reportEvery(self, interval):
+		while True:
+			await asyncio.sleep(interval)
+			self.report()
+
+	async def runAsync(self, duration=None, reportInterval=None):
+		asyncio.get_running_loop().set_task_factory(meteringTaskFactory)
+		self.Started = time.monotonic()
+		self.StartedCpu = time.process_time()
+		# every task gets its own copy of the context, so the meter runBot
+		# sets stays with that bot and the tasks it spawns
+		runners = [asyncio.ensure_future(self.runBot(bot, meter)) for bot, meter in zip(self.Bots, self.Meters)]
+		reporter = asyncio.ensure_future(self.reportEvery(reportInterval)) if reportInterval else None
+		try:
+			await asyncio.wait_for(asyncio.gather(*runners), duration)
+		except asyncio.TimeoutError:
+			pass
+		finally:
+			if reporter is not None:
+				reporter.cancel()
+
+	def run(self, duration=None, reportInterval=None):
+		asyncio.run(self.runAsync(duration, reportInterval))
+		self.report()
+
+	def stats(self):
+		elapsed = max(time.monotonic() - self.Started, 1e-9)
+		processCpu = time.process_time() - self.StartedCpu
+		botCpu = sum(meter.Cpu for meter in self.Meters)
+		return {
+			'elapsed': elapsed,
+			'processCpu': processCpu,
+			'loopCpu': max(0.0, processCpu - botCpu),
+			'rss': rss(),
+			'bots': [{
+				'name': meter.Name,
+				'strategy': meter.Strategy,
+				'cpu': meter.Cpu,
+				'cpuShare': meter.Cpu / elapsed,
+				'steps': meter.Steps,
+				'startupRss': meter.StartupRss,
+				'error': repr(meter.Error) if meter.Error else None,
+			} for meter in self.Meters],
+		}
+
+	def report(self):
+		stats = self.stats()
+		# one print, so reports from several workers don't interleave
+		lines = ['{:<16} {:<8} {:>9} {:>7} {:>9} {:>11}'.format('bot', 'strategy', 'cpu s', 'core %', 'steps', 'startup KiB')]
+		for bot in stats['bots']:
+			lines.append('{name:<16} {strategy:<8} {cpu:>9.3f} {:>7.2f} {steps:>9} {:>11.0f}'.format(
+				bot['cpuShare'] * 100, bot['startupRss'] / 1024.0, **bot))
+		count = max(len(stats['bots']), 1)
+		lines.append('{} bots in {:.1f}s: process cpu {:.3f}s (loop and I/O {:.3f}s), rss {:.1f} MiB ({:.0f} KiB per bot)'.format(
+			len(stats['bots']), stats['elapsed'], stats['processCpu'], stats['loopCpu'],
+			stats['rss'] / 1048576.0, stats['rss'] / 1024.0 / count))
+		if stats['processCpu'] > 0:
+			lines.append('at this rate one core drives about {:.0f} bots'.format(
+				len(stats['bots']) * stats['elapsed'] / stats['processCpu']))
+		print('\n'.join(lines), flush=True)
+
+
+def parseLineup(specs, prefix=''):
+	'''
+	['botPy:3', 'scanBot'] -> [('botPy', 'botPy0'), ('botPy', 'botPy1'), ...]
+	'''
+	lineup = []
+	for spec in specs:
+		strategy, _, count = spec.partition(':')
+		if strategy not in Strategies:
+			raise ValueError('Unknown strategy {}, pick one of {}'.format(strategy, ', '.join(Strategies)))
+		for i in range(int(count or 1)):
+			lineup.append((strategy, '{}{}{}'.format(prefix, strategy, i)))
+	return lineup
+
+
+if __name__ == '__main__':
+	#-n is a prefix here - botPy0, botPy1, ... by default
+	parser = argumentParser('', 'Run many bots in one process on one event loop')
+	parser.add_argument('-t', '--duration', default=None, type=float, help='Stop after this many seconds')
+	parser.add_argument('-r', '--report', default=10.0, type=float, help='Seconds between reports, 0 for only at the end')
+	parser.add_argument('bots', nargs='*', default=['botPy'], help='strategy[:count], strategy one of ' + ', '.join(Strategies))
+	args = parser.parse_args()
+	threadedOnly(parser, args)
+	setupLogging(args.debug)
+
+	runner = BotRunner(args.hostname, args.port, parseLineup(args.bots, args.name))
+	runner.run(args.duration, args.report)
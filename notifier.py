@@ -0,0 +1,37 @@
+import threading
+
+
+class MessageNotifier(object):
+	'''
+	The reader thread publishes every message here, after the world state
+	is up to date; strategies look at the latest message of each type
+
+		seen = Notifier.latest(ServerMessageTypes.HITDETECTED)[0]
+		hit = yield Wait(1.0, Notifier.since(ServerMessageTypes.HITDETECTED, seen))
+
+	Every publish bumps Sequence, so a task can tell a new message from the
+	one it already saw. Nobody blocks here - tasks wait on the scheduler,
+	which checks their conditions every tick.
+	'''
+	def __init__(self):
+		self.Lock = threading.Lock()
+		self.Sequence = 0
+		self.Latest = {}
+
+	def publish(self, message, messageType):
+		with self.Lock:
+			self.Sequence += 1
+			self.Latest[messageType] = (self.Sequence, message)
+
+	def latest(self, messageType):
+		'''
+		(sequence, message) of the last messageType published, (0, None) if none
+		'''
+		with self.Lock:
+			return self.Latest.get(messageType, (0, None))
+
+	def since(self, messageType, sequence):
+		'''
+		Condition for a scheduler Wait: a messageType published after sequence
+		'''
+		return lambda: self.latest(messageType)[0] > sequence
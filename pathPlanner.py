@@ -0,0 +1,258 @@
+#!/usr/bin/python
+
+import argparse
+import heapq
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+# arena in game units - the goals are the GoalWidth-wide mouths at each
+# end, GoalDepth deep past Y = +-ArenaY
+ArenaX = 70.0
+ArenaY = 100.0
+GoalWidth = 20.0
+GoalDepth = 20.0
+# keep the tank's centre this far from any wall
+Clearance = 2.0
+# extra cost factor for cells near an enemy tank
+EnemyPenalty = 5.0
+# how far a tank drives in a second, for timeouts
+MoveSpeed = 10.0
+
+Sqrt2 = math.sqrt(2.0)
+Neighbours = [(1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+	(1, 1, Sqrt2), (1, -1, Sqrt2), (-1, 1, Sqrt2), (-1, -1, Sqrt2)]
+
+
+class PathPlanner(object):
+	'''
+	Occupancy grid of the arena with cached navigation fields
+
+	field(x, y) is the cost-to-go from every cell to the cell holding
+	(x, y) over the static map (walls and goal mouths). It is computed once
+	with Dijkstra and kept in an LRU cache, so routing to a goal, a camp
+	point or a pickup that was used before costs no search at all.
+
+	Enemy tanks are soft obstacles set with setObstacles(): cells near one
+	cost EnemyPenalty times more. While no obstacle sits on the cached
+	route, route() just walks down the field. Otherwise it runs A* with
+	the static field as heuristic - exact on the static map and never an
+	overestimate, since obstacles only add cost - so a detour around a
+	moved enemy only expands the cells around it.
+
+	Routes come back as waypoints: the cell path with every corner that
+	has a clear straight line past it removed.
+	'''
+	def __init__(self, cellSize=4.0, cacheSize=32):
+		self.CellSize = float(cellSize)
+		self.Columns = int(math.ceil(2 * ArenaX / cellSize))
+		self.Rows = int(math.ceil(2 * (ArenaY + GoalDepth) / cellSize))
+		self.Free = [self.isOpen(*self.centre(cell)) for cell in range(self.Columns * self.Rows)]
+		self.Penalty = {}
+		self.ObstacleVersion = 0
+		self.Fields = OrderedDict()
+		self.CacheSize = cacheSize
+		self.Lock = threading.Lock()
+		self.Searches = 0
+
+	def isOpen(self, x, y):
+		if abs(x) > ArenaX - Clearance:
+			return False
+		if abs(y) <= ArenaY - Clearance:
+			return True
+		return abs(x) < GoalWidth - Clearance and abs(y) <= ArenaY + GoalDepth - Clearance
+
+	def cellOf(self, x, y):
+		column = min(self.Columns - 1, max(0, int((x + ArenaX) // self.CellSize)))
+		row = min(self.Rows - 1, max(0, int((y + ArenaY + GoalDepth) // self.CellSize)))
+		return row * self.Columns + column
+
+	def centre(self, cell):
+		row, column = divmod(cell, self.Columns)
+		return (-ArenaX + (column + 0.5) * self.CellSize,
+			-ArenaY - GoalDepth + (row + 0.5) * self.CellSize)
+
+	def nearestFree(self, cell):
+		'''
+		cell itself if open, else the closest open cell - tanks pushed
+		against a wall still get a route
+		'''
+		if self.Free[cell]:
+			return cell
+		x, y = self.centre(cell)
+		return min((candidate for candidate in range(len(self.Free)) if self.Free[candidate]),
+			key=lambda candidate: math.hypot(self.centre(candidate)[0] - x, self.centre(candidate)[1] - y))
+
+	def neighbours(self, cell):
+		row, column = divmod(cell, self.Columns)
+		free = self.Free
+		for dc, dr, step in Neighbours:
+			c = column + dc
+			r = row + dr
+			if 0 <= c < self.Columns and 0 <= r < self.Rows:
+				other = r * self.Columns + c
+				# no cutting corners past a wall
+				if free[other] and free[row * self.Columns + c] and free[r * self.Columns + column]:
+					yield other, step
+
+	def setObstacles(self, points, radius=6.0):
+		'''
+		Replace the soft obstacles with circles of radius around points
+		'''
+		penalty = {}
+		reach = int(math.ceil(radius / self.CellSize))
+		for x, y in points:
+			centreCell = self.cellOf(x, y)
+			row, column = divmod(centreCell, self.Columns)
+			for r in range(max(0, row - reach), min(self.Rows, row + reach + 1)):
+				for c in range(max(0, column - reach), min(self.Columns, column + reach + 1)):
+					cell = r * self.Columns + c
+					cx, cy = self.centre(cell)
+					if math.hypot(cx - x, cy - y) <= radius + self.CellSize / 2:
+						penalty[cell] = EnemyPenalty
+		with self.Lock:
+			if penalty != self.Penalty:
+				self.Penalty = penalty
+				self.ObstacleVersion += 1
+
+	def field(self, x, y):
+		'''
+		Static cost-to-go to the cell holding (x, y), from the cache if we
+		have been there before
+		'''
+		target = self.nearestFree(self.cellOf(x, y))
+		with self.Lock:
+			field = self.Fields.get(target)
+			if field is not None:
+				self.Fields.move_to_end(target)
+				return field
+
+		field = [math.inf] * len(self.Free)
+		field[target] = 0.0
+		queue = [(0.0, target)]
+		while queue:
+			cost, cell = heapq.heappop(queue)
+			if cost > field[cell]:
+				continue
+			for other, step in self.neighbours(cell):
+				newCost = cost + step
+				if newCost < field[other]:
+					field[other] = newCost
+					heapq.heappush(queue, (newCost, other))
+
+		with self.Lock:
+			self.Fields[target] = field
+			while len(self.Fields) > self.CacheSize:
+				self.Fields.popitem(last=False)
+		return field
+
+	def warm(self, destinations):
+		for x, y in destinations:
+			self.field(x, y)
+
+	def distance(self, x, y, destX, destY):
+		'''
+		Length of the static route, in game units
+		'''
+		return self.field(destX, destY)[self.nearestFree(self.cellOf(x, y))] * self.CellSize
+
+	def descend(self, field, start):
+		'''
+		Cell path down the static field - the cached, no-search case
+		'''
+		path = [start]
+		cell = start
+		while field[cell] > 0:
+			cell = min(self.neighbours(cell), key=lambda neighbour: field[neighbour[0]] + neighbour[1])[0]
+			path.append(cell)
+		return path
+
+	def search(self, field, start, penalty):
+		'''
+		A* around the soft obstacles, guided by the static field
+		'''
+		self.Searches += 1
+		cost = {start: 0.0}
+		came = {}
+		queue = [(field[start], start)]
+		while queue:
+			_, cell = heapq.heappop(queue)
+			if field[cell] == 0:
+				path = [cell]
+				while cell in came:
+					cell = came[cell]
+					path.append(cell)
+				path.reverse()
+				return path
+			base = cost[cell]
+			for other, step in self.neighbours(cell):
+				newCost = base + step * (1.0 + penalty.get(other, 0.0))
+				if newCost < cost.get(other, math.inf):
+					cost[other] = newCost
+					came[other] = cell
+					heapq.heappush(queue, (newCost + field[other], other))
+		return [start]
+
+	def clear(self, a, b, penalty):
+		'''
+		True if the straight line between cells a and b stays on free,
+		unpenalised cells
+		'''
+		ax, ay = self.centre(a)
+		bx, by = self.centre(b)
+		steps = int(math.ceil(math.hypot(bx - ax, by - ay) / (self.CellSize / 2))) or 1
+		for i in range(steps + 1):
+			cell = self.cellOf(ax + (bx - ax) * i / steps, ay + (by - ay) * i / steps)
+			if not self.Free[cell] or (cell in penalty and cell != a):
+				return False
+		return True
+
+	def simplify(self, path, penalty):
+		waypoints = []
+		anchor = path[0]
+		for i in range(1, len(path)):
+			if not self.clear(anchor, path[i], penalty):
+				anchor = path[i - 1]
+				waypoints.append(anchor)
+		waypoints.append(path[-1])
+		return waypoints
+
+	def route(self, x, y, destX, destY):
+		'''
+		[(x, y), ...] waypoints from (x, y) to (destX, destY), the
+		destination itself last
+		'''
+		field = self.field(destX, destY)
+		start = self.nearestFree(self.cellOf(x, y))
+		if math.isinf(field[start]):
+			return [(destX, destY)]
+		penalty = self.Penalty
+		path = self.descend(field, start)
+		if any(cell in penalty for cell in path[1:]):
+			path = self.search(field, start, penalty)
+		waypoints = [self.centre(cell) for cell in self.simplify(path, penalty)]
+		waypoints[-1] = (destX, destY)
+		return waypoints
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Plan a route across the arena')
+	parser.add_argument('coords', nargs=4, type=float, metavar=('X', 'Y', 'DESTX', 'DESTY'))
+	parser.add_argument('-e', '--enemy', nargs=2, type=float, action='append', default=[], metavar=('X', 'Y'),
+		help='Enemy tank to route around, may be repeated')
+	args = parser.parse_args()
+
+	planner = PathPlanner()
+	x, y, destX, destY = args.coords
+	started = time.perf_counter()
+	planner.field(destX, destY)
+	cold = time.perf_counter() - started
+	planner.setObstacles(args.enemy)
+	started = time.perf_counter()
+	waypoints = planner.route(x, y, destX, destY)
+	warm = time.perf_counter() - started
+	print('field {:.2f} ms, route {:.2f} ms ({} searches)'.format(cold * 1e3, warm * 1e3, planner.Searches))
+	for wx, wy in waypoints:
+		print('{:8.2f} {:8.2f}'.format(wx, wy))
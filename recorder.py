@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+import argparse
+import mmap
+import struct
+import threading
+import time
+
+from messageTypes import ServerMessageTypes
+
+
+# file layout: Magic, then one record per frame -
+# <timestamp double> <direction byte> <message type byte> <length byte> <payload>
+Magic = b'GUTSREC1'
+RecordHeader = struct.Struct('<dBBB')
+Inbound = 0
+Outbound = 1
+
+
+class FrameRecorder(object):
+	'''
+	Writes every frame that goes through ServerComms to a compact binary
+	log, stamped with time.monotonic() relative to the start of recording
+
+	Each recording starts a new file - a second session appended after the
+	first would restart the timestamps mid-file. Every record is one write,
+	so a killed bot leaves at worst one torn record at the end, which
+	FrameReplayer ignores.
+	'''
+	def __init__(self, path):
+		self.File = open(path, 'wb')
+		self.File.write(Magic)
+		self.Started = time.monotonic()
+		self.LastFlush = self.Started
+		self.Lock = threading.Lock()
+		self.Frames = 0
+
+	def record(self, direction, messageType, payload):
+		now = time.monotonic()
+		header = RecordHeader.pack(now - self.Started, direction, messageType, len(payload))
+		with self.Lock:
+			self.File.write(header + payload)
+			self.Frames += 1
+			# a killed bot should still leave most of its match behind
+			if now - self.LastFlush > 1.0:
+				self.File.flush()
+				self.LastFlush = now
+
+	def recordFrame(self, direction, frame):
+		'''
+		Record an already-encoded frame (type, length, payload)
+		'''
+		self.record(direction, frame[0], memoryview(frame)[2:])
+
+	def flush(self):
+		with self.Lock:
+			self.File.flush()
+
+	def close(self):
+		with self.Lock:
+			self.File.close()
+
+
+class FrameReplayer(object):
+	'''
+	Feeds a recording back through the FrameReader interface, so a
+	ServerComms built with it reads the recorded match as if it were live
+
+	speed=1.0 keeps the original timing, 2.0 plays twice as fast and 0
+	plays as fast as possible. Only inbound frames are replayed; frames()
+	walks everything, outbound included. Past the last complete frame
+	readFrame raises ConnectionError, like a server hanging up - a torn
+	record at the end of a killed bot's file is never handed out.
+	'''
+	def __init__(self, path, speed=1.0):
+		with open(path, 'rb') as recording:
+			self.Map = mmap.mmap(recording.fileno(), 0, access=mmap.ACCESS_READ)
+		self.View = memoryview(self.Map)
+		if self.View[:len(Magic)] != Magic:
+			raise ValueError('{} is not a frame recording'.format(path))
+		self.Offset = len(Magic)
+		self.Speed = speed
+		self.Started = None
+		self.Frames = 0
+
+	def frames(self):
+		'''
+		Every (timestamp, direction, messageType, payload) in the file
+		'''
+		offset = len(Magic)
+		end = len(self.View)
+		while offset + RecordHeader.size <= end:
+			timestamp, direction, messageType, length = RecordHeader.unpack_from(self.View, offset)
+			offset += RecordHeader.size
+			if offset + length > end:
+				return
+			yield timestamp, direction, messageType, self.View[offset:offset + length]
+			offset += length
+
+	def readFrame(self):
+		view = self.View
+		end = len(view)
+		while self.Offset + RecordHeader.size <= end:
+			timestamp, direction, messageType, length = RecordHeader.unpack_from(view, self.Offset)
+			start = self.Offset + RecordHeader.size
+			if start + length > end:
+				#the bot was killed mid-record
+				break
+			self.Offset = start + length
+			if direction != Inbound:
+				continue
+
+			if self.Speed:
+				if self.Started is None:
+					self.Started = time.monotonic() - timestamp / self.Speed
+				delay = self.Started + timestamp / self.Speed - time.monotonic()
+				if delay > 0:
+					time.sleep(delay)
+			self.Frames += 1
+			return messageType, view[start:self.Offset]
+		raise ConnectionError('End of recording')
+
+	def hasFrame(self):
+		if self.Offset + RecordHeader.size > len(self.View):
+			return False
+		length = RecordHeader.unpack_from(self.View, self.Offset)[3]
+		return self.Offset + RecordHeader.size + length <= len(self.View)
+
+	def close(self):
+		# payload views handed out by readFrame/frames must be gone by now
+		self.View.release()
+		self.Map.close()
+
+
+class DiscardSink(object):
+	'''
+	Stands in for the socket while replaying - commands go nowhere
+	'''
+	def __init__(self):
+		self.Bytes = 0
+
+	def sendall(self, data):
+		self.Bytes += len(data)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Summarise a frame recording')
+	parser.add_argument('recording', help='File written with --record')
+	args = parser.parse_args()
+
+	types = ServerMessageTypes()
+	replayer = FrameReplayer(args.recording, speed=0)
+	counts = {}
+	duration = 0.0
+	for timestamp, direction, messageType, payload in replayer.frames():
+		key = (direction, messageType)
+		counts[key] = counts.get(key, 0) + 1
+		duration = timestamp
+	print('{:.1f}s recorded'.format(duration))
+	for (direction, messageType), count in sorted(counts.items()):
+		print('{:>3} {:<22} {}'.format('in' if direction == Inbound else 'out', types.toString(messageType), count))
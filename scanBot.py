@@ -1,200 +1,17 @@
 #!/usr/bin/python
 
-import json
-import socket
 import logging
-import binascii
-import struct
-import argparse
-import random
-import math   #needed for math fns
 import time
 
+from messageTypes import ServerMessageTypes
+from serverComms import argumentParser, setupLogging, connect
+from geometry import calculateDistance
+from evasion import EvasionPlanner, evade
+from tracing import Trace, TraceEvents
 
-class ServerMessageTypes(object):
-	TEST = 0
-	CREATETANK = 1
-	DESPAWNTANK = 2
-	FIRE = 3
-	TOGGLEFORWARD = 4
-	TOGGLEREVERSE = 5
-	TOGGLELEFT = 6
-	TOGGLERIGHT = 7
-	TOGGLETURRETLEFT = 8
-	TOGGLETURRETRIGHT = 9
-	TURNTURRETTOHEADING = 10
-	TURNTOHEADING = 11
-	MOVEFORWARDDISTANCE = 12
-	MOVEBACKWARSDISTANCE = 13
-	STOPALL = 14
-	STOPTURN = 15
-	STOPMOVE = 16
-	STOPTURRET = 17
-	OBJECTUPDATE = 18
-	HEALTHPICKUP = 19
-	AMMOPICKUP = 20
-	SNITCHPICKUP = 21
-	DESTROYED = 22
-	ENTEREDGOAL = 23
-	KILL = 24
-	SNITCHAPPEARED = 25
-	GAMETIMEUPDATE = 26
-	HITDETECTED = 27
-	SUCCESSFULLHIT = 28
 
-	strings = {
-		TEST: "TEST",
-		CREATETANK: "CREATETANK",
-		DESPAWNTANK: "DESPAWNTANK",
-		FIRE: "FIRE",
-		TOGGLEFORWARD: "TOGGLEFORWARD",
-		TOGGLEREVERSE: "TOGGLEREVERSE",
-		TOGGLELEFT: "TOGGLELEFT",
-		TOGGLERIGHT: "TOGGLERIGHT",
-		TOGGLETURRETLEFT: "TOGGLETURRETLEFT",
-		TOGGLETURRETRIGHT: "TOGGLETURRENTRIGHT",
-		TURNTURRETTOHEADING: "TURNTURRETTOHEADING",
-		TURNTOHEADING: "TURNTOHEADING",
-		MOVEFORWARDDISTANCE: "MOVEFORWARDDISTANCE",
-		MOVEBACKWARSDISTANCE: "MOVEBACKWARDSDISTANCE",
-		STOPALL: "STOPALL",
-		STOPTURN: "STOPTURN",
-		STOPMOVE: "STOPMOVE",
-		STOPTURRET: "STOPTURRET",
-		OBJECTUPDATE: "OBJECTUPDATE",
-		HEALTHPICKUP: "HEALTHPICKUP",
-		AMMOPICKUP: "AMMOPICKUP",
-		SNITCHPICKUP: "SNITCHPICKUP",
-		DESTROYED: "DESTROYED",
-		ENTEREDGOAL: "ENTEREDGOAL",
-		KILL: "KILL",
-		SNITCHAPPEARED: "SNITCHAPPEARED",
-		GAMETIMEUPDATE: "GAMETIMEUPDATE",
-		HITDETECTED: "HITDETECTED",
-		SUCCESSFULLHIT: "SUCCESSFULLHIT"
-	}
-
-	def toString(self, id):
-		if id in self.strings.keys():
-			return self.strings[id]
-		else:
-			return "??UNKNOWN??"
-
-
-class ServerComms(object):
-	'''
-	TCP comms handler
-
-	Server protocol is simple:
-
-	* 1st byte is the message type - see ServerMessageTypes
-	* 2nd byte is the length in bytes of the payload (so max 255 byte payload)
-	* 3rd byte onwards is the payload encoded in JSON
-	'''
-	ServerSocket = None
-	MessageTypes = ServerMessageTypes()
-
-
-	def __init__(self, hostname, port):
-		self.ServerSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.ServerSocket.connect((hostname, port))
-
-	def readMessage(self):
-		'''
-		Read a message from the server
-		'''
-		messageTypeRaw = self.ServerSocket.recv(1)
-		messageLenRaw = self.ServerSocket.recv(1)
-		messageType = struct.unpack('>B', messageTypeRaw)[0]
-		messageLen = struct.unpack('>B', messageLenRaw)[0]
-
-		if messageLen == 0:
-			messageData = bytearray()
-			messagePayload = {'messageType': messageType}
-		else:
-			messageData = self.ServerSocket.recv(messageLen)
-			logging.debug("*** {}".format(messageData))
-			messagePayload = json.loads(messageData.decode('utf-8'))
-			messagePayload['messageType'] = messageType
-
-		logging.debug('Turned message {} into type {} payload {}'.format(
-			binascii.hexlify(messageData),
-			self.MessageTypes.toString(messageType),
-			messagePayload))
-		return messagePayload, messageType
-
-	def sendMessage(self, messageType=None, messagePayload=None):
-		'''
-		Send a message to the server
-		'''
-		message = bytearray()
-
-
-		if messageType is not None:
-			message.append(messageType)
-		else:
-			message.append(0)
-
-		if messagePayload is not None:
-			messageString = json.dumps(messagePayload)
-			message.append(len(messageString))
-			message.extend(str.encode(messageString))
-
-		else:
-			message.append(0)
-
-		logging.debug('Turned message type {} payload {} into {}'.format(
-			self.MessageTypes.toString(messageType),
-			messagePayload,
-			binascii.hexlify(message)))
-		return self.ServerSocket.send(message)
-
-# Parse command line args
-parser = argparse.ArgumentParser()
-parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
-parser.add_argument('-H', '--hostname', default='127.0.0.1', help='Hostname to connect to')
-parser.add_argument('-p', '--port', default=8052, type=int, help='Port to connect to')
-parser.add_argument('-n', '--name', default='ScanBot', help='Name of bot')
-args = parser.parse_args()
-
-# Set up console logging
-if args.debug:
-	logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.DEBUG)
-else:
-	logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.INFO)
-
-# Connect to game server
-GameServer = ServerComms(args.hostname, args.port)
-
-# Spawn our tank
-logging.info("Creating tank with name '{}'".format(args.name))
-GameServer.sendMessage(ServerMessageTypes.CREATETANK, {'Name': args.name})
-
-#math and helper functions
-def calculateDistance(ownX, ownY, otherX, otherY):
-	headingX = otherX - ownX
-	headingY = otherY - ownY
-	return math.sqrt((headingX * headingX) + (headingY * headingY))
-
-
-#fns to calculate how many degree there is need to rotate
-def getHeading(x1, y1, x2, y2):
-   	heading = math.atan2(y2 - y1, x2 - x1)
-   	heading = radianToDegree(heading)
-   	heading = (heading - 360) % 360
-   	return math.fabs(heading)
-
-
-def radianToDegree(angle):
-	return angle * (180.0 / math.pi)
-
-
-def isTurnLeft(currentHeading, desiredHeading):
-	diff = desiredHeading - currentHeading
-	if diff >= 0 and diff <= 180:
-		return True
-	else:
-		return False
+# Set by run() - importing this module connects to nothing
+GameServer = None
 
 #definitions to invoke in main_loop
 def start(message):
@@ -204,6 +21,10 @@ our_id = 0;
 our_x = 0;
 our_y = 0;
 our_heading = 0;
+our_me = None
+# Id -> (latest OBJECTUPDATE, when) of every enemy tank we've seen
+enemies = {}
+Evasion = EvasionPlanner()
 
 
 def scan():
@@ -221,11 +42,13 @@ def scan():
 	scan_result["Snitch"] = {}
 	scan_result["Emergency"] = False
 	current_heading = our_heading
-	print(str(our_id) + " | "+str(our_x) + " | " + str(our_y))
-	print("Start Head: "+str(current_heading))
+	if Trace.Enabled:
+		Trace.record(TraceEvents.SCANSTART, 0, -1, current_heading, our_x, our_y)
 	for i in range(18):
-		message_in_function = GameServer.readMessage()
-		if message_in_function is None:
+		message_in_function, messageType = GameServer.readMessage()
+		#a hit mid-scan still gets dodged straight away
+		handle(message_in_function, messageType)
+		if messageType != ServerMessageTypes.OBJECTUPDATE:
 			pass
 		elif "Id" in message_in_function:
 			id = message_in_function["Id"]
@@ -247,45 +70,68 @@ def scan():
 		current_heading =(current_heading + 20) % 360
 		GameServer.sendMessage(ServerMessageTypes.TURNTURRETTOHEADING,{'Amount':current_heading})
 
-	print("End Head: " + str(current_heading))
-	print(scan_result)
+	if Trace.Enabled:
+		Trace.record(TraceEvents.SCANEND, 0, -1, current_heading, len(scan_result["Tank"]))
+	logging.debug("Scan from ({}, {}): {}".format(our_x, our_y, scan_result))
 	return scan_result
 
 
 
 def got_shot():
-	for i in range(1,3):
-		GameServer.sendMessage(ServerMessageTypes.TURNTOHEADING, {'Amount': random.randint(210,330)})
-		GameServer.sendMessage(ServerMessageTypes.MOVEFORWARDDISTANCE, {'Amount': random.randint(80,120)})
+	#one dodge across the shooter's line of fire, sent before the next read
+	if our_me is None:
+		return
+	now = time.monotonic()
+	evade(GameServer, Evasion, our_me, [tank for tank, seenAt in enemies.values() if now - seenAt < 2.0])
+
+def handle(message, messageType):
+	#every message read goes through here, wherever it was read
+	global our_x, our_y, our_heading, our_me
+	if messageType == ServerMessageTypes.HITDETECTED:
+		got_shot()
+	elif messageType == ServerMessageTypes.OBJECTUPDATE:
+		if message['Id'] == our_id:
+			our_me = message
+			our_x = message['X']
+			our_y = message['Y']
+			our_heading = message['Heading']
+		elif message['Type'] == "Tank":
+			enemies[message['Id']] = (message, time.monotonic())
+	elif messageType == ServerMessageTypes.DESTROYED:
+		#respawning - nobody is where we last saw them
+		enemies.clear()
 
-# Main loop - read game messages, ignore them and randomly perform actions
 campPoints = [[0,100], [0,-100]]
 
-i=0
-
-while True:
+def spawned(idTank):
+	#a reconnect gives us a new tank
+	global our_id
+	our_id = idTank
 
-	if GameServer.readMessage()[1]==18:
-		message = GameServer.readMessage()[0]
+def run(args):
+	global GameServer
+	GameServer = connect(args)
+	GameServer.onSpawn(spawned)
 
-	if GameServer.readMessage()[1]==27:
-		got_shot()
+	# Main loop - read game messages, ignore them and randomly perform actions
+	i=0
 
+	while True:
 
-	if i == 0:
-		our_id = message['Id']
+		#one read per pass - each message is looked at exactly once
+		message, messageType = GameServer.readMessage()
+		handle(message, messageType)
 
-	if message is None:
-		pass
-	else:
-		if 'Id' in message:
+		if messageType == ServerMessageTypes.OBJECTUPDATE:
 			if (message['Id'] == our_id):
-				our_x = message['X']
-				our_y = message['Y']
-				our_heading = message['Heading']
-
 				if (i % 20)==0:
 					logging.info("scanning")
 					scan()
 
-	i+=1
\ No newline at end of file
+		i+=1
+
+
+if __name__ == '__main__':
+	args = argumentParser('ScanBot').parse_args()
+	setupLogging(args.debug)
+	run(args)
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+
+
+class Priorities(object):
+	EVADE = 0
+	FIRE = 1
+	AIM = 2
+	SCAN = 3
+	ROAM = 4
+
+	strings = {
+		EVADE: "EVADE",
+		FIRE: "FIRE",
+		AIM: "AIM",
+		SCAN: "SCAN",
+		ROAM: "ROAM",
+	}
+
+	def toString(self, id):
+		if id in self.strings.keys():
+			return self.strings[id]
+		else:
+			return "??UNKNOWN??"
+
+
+class Wait(object):
+	'''
+	What a task yields to be resumed on the first tick where until() is
+	true (the yield then returns True) or seconds have passed (False)
+
+		hit = yield Wait(1.0, lambda: Turret.onTarget(heading))
+
+	A task can also yield None to run again next tick, or a number of
+	seconds to sleep - both return True.
+	'''
+	__slots__ = ('Seconds', 'Until')
+
+	def __init__(self, seconds=None, until=None):
+		self.Seconds = seconds
+		self.Until = until
+
+
+class Task(object):
+	'''
+	A generator stepped by TickScheduler, see spawn()
+	'''
+	def __init__(self, name, priority, generator, resources, expires, sequence):
+		self.Name = name
+		self.Priority = priority
+		self.Generator = generator
+		self.Resources = frozenset(resources)
+		self.Expires = expires
+		self.Sequence = sequence
+		self.Started = False
+		self.Alive = True
+		self.Preempted = False
+		self.WakeAt = None
+		self.WakeTick = 0
+		self.Until = None
+		self.TimeoutResult = True
+
+	def setWait(self, request, now, tick):
+		self.Until = None
+		self.WakeAt = None
+		self.WakeTick = 0
+		self.TimeoutResult = True
+		if isinstance(request, Wait):
+			self.Until = request.Until
+			if request.Seconds is not None:
+				self.WakeAt = now + request.Seconds
+			self.TimeoutResult = request.Until is None
+		elif request is not None:
+			self.WakeAt = now + request
+		if self.WakeAt is None and self.Until is None:
+			self.WakeTick = tick + 1
+
+	def ready(self, now, tick):
+		'''
+		None while still waiting, else what the pending yield returns
+		'''
+		if not self.Started:
+			return True
+		if self.Preempted:
+			return False
+		if self.WakeTick:
+			return True if tick >= self.WakeTick else None
+		if self.Until is not None and self.Until():
+			return True
+		if self.WakeAt is not None and now >= self.WakeAt:
+			return self.TimeoutResult
+		return None
+
+
+class TickScheduler(object):
+	'''
+	Runs strategy tasks on the game's tick clock
+
+	The reader calls tick() for every OBJECTUPDATE about us and every
+	GAMETIMEUPDATE - the server sends our own update once a frame, so
+	ticks follow the server's frames. Each tick the scheduler thread steps
+	every ready task once, highest priority first (Priorities, lower runs
+	first), so whatever a task waits for it sees on the very next tick
+	instead of at the end of a fixed sleep.
+
+	Tasks are generators that yield a Wait, a sleep in seconds or None.
+	A task claims resources ('hull', 'turret') for as long as it lives. A
+	task needing a resource that a higher-priority task holds is
+	preempted: it is not stepped until that task is done, and then its
+	pending yield returns False so it looks at the world again before
+	acting. Tasks that only watch for something should claim nothing and
+	spawn a task to act.
+
+	Every tick has a deadline of Budget times the tick period. Once it is
+	spent, tasks below FIRE wait for the next tick. A task spawned with
+	expires= that hasn't started by then is dropped as stale.
+	'''
+	def __init__(self, metrics=None, budget=0.5, period=0.05, idle=0.25):
+		self.Metrics = metrics
+		self.Budget = budget
+		self.Period = period
+		self.Idle = idle
+		self.Lock = threading.Lock()
+		self.Ticked = threading.Condition(self.Lock)
+		self.Tick = 0
+		self.TickAt = None
+		self.GameTime = None
+		self.Tasks = []
+		self.Spawned = 0
+		self.Stopped = False
+
+	def tick(self, gameTime=None, now=None):
+		if now is None:
+			now = time.monotonic()
+		with self.Lock:
+			if gameTime is not None:
+				self.GameTime = gameTime
+			else:
+				#only our own updates keep frame time
+				if self.TickAt is not None:
+					self.Period += 0.1 * (min(now - self.TickAt, 1.0) - self.Period)
+				self.TickAt = now
+			self.Tick += 1
+			self.Ticked.notify_all()
+
+	def spawn(self, name, priority, generator, resources=(), expires=None):
+		'''
+		Start a task, from any thread - expires is in seconds from now
+		'''
+		with self.Lock:
+			self.Spawned += 1
+			task = Task(name, priority, generator, resources,
+				None if expires is None else time.monotonic() + expires, self.Spawned)
+			self.Tasks.append(task)
+			self.Tasks.sort(key=lambda task: (task.Priority, task.Sequence))
+			self.Ticked.notify_all()
+		return task
+
+	def cancel(self, task):
+		with self.Lock:
+			if task in self.Tasks:
+				self.Tasks.remove(task)
+		task.Alive = False
+		task.Generator.close()
+
+	def running(self, name):
+		with self.Lock:
+			return any(task.Name == name for task in self.Tasks)
+
+	def count(self, name):
+		if self.Metrics is not None:
+			self.Metrics.count(name)
+
+	def runTick(self, now=None):
+		if now is None:
+			now = time.monotonic()
+		started = time.perf_counter()
+		deadline = started + self.Budget * self.Period
+		with self.Lock:
+			tasks = list(self.Tasks)
+			tick = self.Tick
+		claimed = set()
+		for task in tasks:
+			if not task.Started and task.Expires is not None and now > task.Expires:
+				self.count('scheduler.expired.' + task.Name)
+				self.finish(task)
+				continue
+			if task.Resources & claimed:
+				if not task.Preempted and task.Started:
+					task.Preempted = True
+					self.count('scheduler.preempted.' + task.Name)
+				continue
+			try:
+				result = task.ready(now, tick)
+			except Exception:
+				#a broken Wait condition ends its own task, not the scheduler
+				logging.exception("Task {} failed waiting".format(task.Name))
+				self.finish(task)
+				continue
+			claimed |= task.Resources
+			if result is None:
+				continue
+			if task.Priority > Priorities.FIRE and time.perf_counter() > deadline:
+				self.count('scheduler.deferred')
+				continue
+			self.step(task, result, now, tick)
+		if self.Metrics is not None:
+			self.Metrics.observe('scheduler.tick', time.perf_counter() - started)
+
+	def step(self, task, result, now, tick):
+		task.Preempted = False
+		try:
+			if task.Started:
+				request = task.Generator.send(result)
+			else:
+				task.Started = True
+				request = next(task.Generator)
+		except StopIteration:
+			self.finish(task)
+			return
+		except Exception:
+			logging.exception("Task {} failed".format(task.Name))
+			self.finish(task)
+			return
+		task.setWait(request, now, tick)
+
+	def finish(self, task):
+		task.Alive = False
+		with self.Lock:
+			if task in self.Tasks:
+				self.Tasks.remove(task)
+
+	def stop(self):
+		'''
+		End run() - the reader calls it when there is nothing more to read
+		'''
+		with self.Lock:
+			self.Stopped = True
+			self.Ticked.notify_all()
+
+	def run(self):
+		'''
+		The scheduler thread - one runTick per tick, or every Idle seconds
+		when the server goes quiet so sleeps still end, until stop()
+		'''
+		seen = 0
+		while True:
+			with self.Lock:
+				if self.Tick == seen and not self.Stopped:
+					self.Ticked.wait(self.Idle)
+				if self.Stopped:
+					return
+				seen = self.Tick
+			try:
+				self.runTick()
+			except Exception:
+				logging.exception("Scheduler tick failed")
@@ -0,0 +1,292 @@
+import socket
+import logging
+import argparse
+import time
+
+from messageTypes import ServerMessageTypes
+from messages import decodeMessage
+from frameReader import FrameReader
+from commandBuffer import CommandBuffer, encodeFrame
+from recorder import FrameRecorder, FrameReplayer, DiscardSink, Inbound, Outbound
+from metrics import Metrics, export
+from tracing import Trace, TraceEvents
+
+
+class ServerComms(object):
+	'''
+	TCP comms handler
+
+	Server protocol is simple:
+
+	* 1st byte is the message type - see ServerMessageTypes
+	* 2nd byte is the length in bytes of the payload (so max 255 byte payload)
+	* 3rd byte onwards is the payload encoded in JSON
+
+	A dropped connection is not the end of the match. Once a connection has
+	carried its first frame the server sends something every tick, so from
+	then on ReadTimeout seconds of silence counts as a dead socket - before
+	it (a match that hasn't started) only EOF or a keepalive failure does.
+	So does any error sending. readMessage
+	then reconnects itself - backing off from MinBackoff up to MaxBackoff,
+	giving up after MaxOutage - re-issues CREATETANK and carries on reading.
+	The first OBJECTUPDATE after a spawn is about us (the same bootstrap the
+	bots always used): it sets IdTank, calls every onSpawn() handler with
+	the Id, and after a reconnect re-sends the last turret and hull heading
+	commands so the new tank picks up where the old one was told to go.
+	Commands sent while disconnected are dropped.
+	'''
+	ServerSocket = None
+	MessageTypes = ServerMessageTypes()
+	ReadTimeout = 3.0
+	MinBackoff = 0.05
+	MaxBackoff = 2.0
+	MaxOutage = 120.0
+	# commands that describe where the tank should be rather than an action
+	StandingCommands = (ServerMessageTypes.TURNTURRETTOHEADING, ServerMessageTypes.TURNTOHEADING)
+
+
+	def __init__(self, hostname, port):
+		self.Hostname = hostname
+		self.Port = port
+		self.setup(DiscardSink())
+		self.open()
+
+	def setup(self, sink):
+		self.Commands = CommandBuffer(sink)
+		self.Recorder = None
+		self.Metrics = Metrics()
+		self.Name = None
+		self.IdTank = None
+		self.SpawnHandlers = []
+		self.Standing = {}
+		self.Reconnects = 0
+		self.LostAt = None
+		self.ReceivedAt = None
+
+	@classmethod
+	def replay(cls, path, speed=1.0):
+		'''
+		A ServerComms that reads a recording instead of the server
+		'''
+		comms = cls.__new__(cls)
+		comms.Hostname = None
+		comms.Port = None
+		comms.setup(DiscardSink())
+		comms.Reader = FrameReplayer(path, speed)
+		return comms
+
+	def open(self):
+		sock = socket.create_connection((self.Hostname, self.Port), self.ReadTimeout)
+		sock.settimeout(self.ReadTimeout)
+		#let the kernel notice a peer that vanished without a FIN
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+		for option, value in (('TCP_KEEPIDLE', 1), ('TCP_KEEPINTVL', 1), ('TCP_KEEPCNT', 3)):
+			if hasattr(socket, option):
+				sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+		self.ServerSocket = sock
+		self.Reader = FrameReader(sock)
+		self.Heard = False
+		self.Commands.Socket = self
+
+	def sendall(self, data):
+		'''
+		The CommandBuffer's sink - a failed write marks the connection lost
+		instead of killing the strategy thread that sent it
+		'''
+		sock = self.ServerSocket
+		try:
+			sock.sendall(data)
+		except OSError as error:
+			self.Metrics.count('connection.dropped')
+			self.lost(sock, error)
+
+	def lost(self, sock, error):
+		if sock is not self.ServerSocket:
+			#a late write to the socket we already replaced
+			return
+		if self.LostAt is None:
+			self.LostAt = time.monotonic()
+			logging.warning("Lost the server: {!r}".format(error))
+		#wake the reader now rather than at its next timeout
+		try:
+			sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+
+	def reconnect(self, error):
+		'''
+		Called by the reader - connect again with bounded backoff and respawn
+		'''
+		if self.LostAt is not None:
+			#lost() only logs the first failure of an outage
+			logging.warning("Reconnecting: {!r}".format(error))
+		self.lost(self.ServerSocket, error)
+		self.ServerSocket.close()
+		delay = self.MinBackoff
+		while True:
+			try:
+				self.open()
+				break
+			except OSError as error:
+				if time.monotonic() - self.LostAt > self.MaxOutage:
+					raise ConnectionError('Could not reconnect for {:.0f}s: {!r}'.format(self.MaxOutage, error))
+				time.sleep(delay)
+				delay = min(delay * 2, self.MaxBackoff)
+		self.Reconnects += 1
+		self.Metrics.count('connection.reconnects')
+		logging.info("Reconnected after {:.3f}s".format(time.monotonic() - self.LostAt))
+		if self.Name is not None:
+			self.spawn(self.Name)
+
+	def spawn(self, name):
+		'''
+		Send CREATETANK - the next OBJECTUPDATE tells us our Id
+		'''
+		self.Name = name
+		self.IdTank = None
+		logging.info("Creating tank with name '{}'".format(name))
+		self.sendMessage(ServerMessageTypes.CREATETANK, {'Name': name})
+
+	def onSpawn(self, handler):
+		'''
+		Call handler(idTank) every time our tank (re)spawns
+		'''
+		self.SpawnHandlers.append(handler)
+
+	def spawned(self, idTank):
+		self.IdTank = idTank
+		self.Metrics.setIdTank(idTank)
+		for handler in self.SpawnHandlers:
+			handler(idTank)
+		if self.LostAt is not None:
+			#back in the game - put the new tank where the strategy left the old one
+			for frame in list(self.Standing.values()):
+				self.Commands.send(frame)
+			self.Metrics.observe('connection.outage', time.monotonic() - self.LostAt)
+			self.LostAt = None
+
+	def record(self, path):
+		'''
+		Write every frame read or sent from now on to path, replacing it
+		'''
+		self.Recorder = FrameRecorder(path)
+
+	def readMessage(self):
+		'''
+		Read a message from the server, as (payload, messageType) - ReceivedAt
+		is when its frame came off the socket, in time.perf_counter() seconds
+		'''
+		while True:
+			try:
+				messageType, messageData = self.Reader.readFrame()
+				break
+			except socket.timeout:
+				if self.Hostname is None:
+					raise
+				if not self.Heard:
+					#nothing yet - the match may not have started
+					continue
+				self.reconnect(TimeoutError('No data from the server for {:.1f}s'.format(self.ReadTimeout)))
+			except OSError as error:
+				#includes ConnectionError
+				if self.Hostname is None:
+					raise
+				self.reconnect(error)
+		self.Heard = True
+		if self.Recorder is not None:
+			self.Recorder.record(Inbound, messageType, messageData)
+		receivedAt = self.ReceivedAt = time.perf_counter()
+
+		messagePayload = decodeMessage(messageType, messageData)
+
+		if Trace.Enabled:
+			Trace.message(TraceEvents.INBOUND, messageType, messagePayload)
+		self.Metrics.inbound(messageType, receivedAt, time.perf_counter() - receivedAt, messagePayload)
+		if self.IdTank is None and messageType == ServerMessageTypes.OBJECTUPDATE:
+			self.spawned(messagePayload['Id'])
+		return messagePayload, messageType
+
+	def sendMessage(self, messageType=None, messagePayload=None):
+		'''
+		Send a message to the server (queued until the end of the block when
+		inside batch())
+		'''
+		startedAt = time.perf_counter()
+		message = encodeFrame(messageType, messagePayload)
+		if self.Recorder is not None:
+			self.Recorder.recordFrame(Outbound, message)
+
+		if messageType in self.StandingCommands:
+			self.Standing[messageType] = message
+
+		if Trace.Enabled:
+			Trace.message(TraceEvents.OUTBOUND, messageType or 0, messagePayload)
+		queued = self.Commands.send(message)
+		self.Metrics.outbound(messageType, startedAt, time.perf_counter() - startedAt, messagePayload)
+		return queued
+
+	def batch(self):
+		'''
+		Coalesce every sendMessage in a with-block into one write
+		'''
+		return self.Commands
+
+
+def argumentParser(name, description=None):
+	'''
+	The command line every bot script shares, name being the default tank
+	name - scripts add their own options before parsing
+	'''
+	parser = argparse.ArgumentParser(description=description)
+	parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+	parser.add_argument('-H', '--hostname', default='127.0.0.1', help='Hostname to connect to')
+	parser.add_argument('-p', '--port', default=8052, type=int, help='Port to connect to')
+	parser.add_argument('-n', '--name', default=name, help='Name of bot')
+	parser.add_argument('--record', help='Record every frame to this file, replacing it')
+	parser.add_argument('--replay', help='Read the server from a recording instead of connecting')
+	parser.add_argument('--replay-speed', default=1.0, type=float, help='Replay speed multiplier, 0 for as fast as possible')
+	parser.add_argument('--metrics-port', type=int, help='Serve metrics as JSON on this localhost port')
+	parser.add_argument('--metrics-file', help='Dump metrics as JSON to this file every few seconds')
+	parser.add_argument('--trace', help='Keep a binary event trace, dumped to this file on exit, crash or SIGUSR1')
+	parser.add_argument('--trace-size', default=65536, type=int, help='Events kept in the trace ring buffer')
+	return parser
+
+
+def threadedOnly(parser, args):
+	'''
+	For entry points that run AsyncBots - they take the shared command line
+	but can't record, replay, export metrics or trace, so say so
+	'''
+	for option in ('record', 'replay', 'metrics_port', 'metrics_file', 'trace'):
+		if getattr(args, option) is not None:
+			parser.error('--{} needs the threaded bots (botPy, aimBot, scanBot)'.format(option.replace('_', '-')))
+
+
+def setupLogging(debug=False):
+	# Set up console logging
+	if debug:
+		logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.DEBUG)
+	else:
+		logging.basicConfig(format='[%(asctime)s] %(message)s', level=logging.INFO)
+
+
+def connect(args):
+	'''
+	Connect (or open the replay), start whatever recording, metrics and
+	tracing args ask for and spawn our tank - returns the ServerComms
+	'''
+	# Connect to game server
+	if args.replay:
+		gameServer = ServerComms.replay(args.replay, args.replay_speed)
+	else:
+		gameServer = ServerComms(args.hostname, args.port)
+	if args.record:
+		gameServer.record(args.record)
+	export(gameServer.Metrics, args.metrics_port, args.metrics_file)
+	if args.trace:
+		Trace.enable(args.trace_size)
+		Trace.install(args.trace)
+
+	# Spawn our tank
+	gameServer.spawn(args.name)
+	return gameServer
@@ -0,0 +1,157 @@
+import math
+import threading
+
+
+class SpatialIndex(object):
+	'''
+	Uniform grid over the arena, one grid per object Type
+
+	The playfield is roughly +-100 units (the goals sit just past +-100 in
+	Y), so the default grid covers +-130 in cellSize squares; anything
+	outside is clamped into the edge cells. update() moves an object
+	between cells only when it crosses a cell border, and the queries only
+	look at the rings of cells around the query point that can still hold
+	something closer than what they already found.
+
+	Results are (distance, id, x, y) tuples. The reader thread updates
+	while strategies query, so every public method holds a lock.
+	'''
+	def __init__(self, cellSize=10.0, extent=130.0):
+		self.CellSize = float(cellSize)
+		self.Extent = float(extent)
+		self.Columns = int(math.ceil(2 * extent / cellSize))
+		self.Grids = {}
+		self.Objects = {}
+		self.Lock = threading.RLock()
+
+	def __len__(self):
+		return len(self.Objects)
+
+	def __contains__(self, id):
+		return id in self.Objects
+
+	def cellOf(self, x, y):
+		last = self.Columns - 1
+		column = min(last, max(0, int((x + self.Extent) // self.CellSize)))
+		row = min(last, max(0, int((y + self.Extent) // self.CellSize)))
+		return column, row
+
+	def insert(self, id, category, x, y):
+		with self.Lock:
+			cell = self.cellOf(x, y)
+			current = self.Objects.get(id)
+			if current is not None:
+				oldCategory, _, _, oldCell = current
+				if oldCategory == category and oldCell == cell:
+					self.Grids[category][cell][id] = (x, y)
+					self.Objects[id] = (category, x, y, cell)
+					return
+				self.remove(id)
+
+			grid = self.Grids.get(category)
+			if grid is None:
+				grid = self.Grids[category] = {}
+			bucket = grid.get(cell)
+			if bucket is None:
+				bucket = grid[cell] = {}
+			bucket[id] = (x, y)
+			self.Objects[id] = (category, x, y, cell)
+
+	def update(self, message):
+		'''
+		Apply an OBJECTUPDATE payload
+		'''
+		self.insert(message['Id'], message['Type'], message['X'], message['Y'])
+
+	def remove(self, id):
+		with self.Lock:
+			current = self.Objects.pop(id, None)
+			if current is None:
+				return
+			category, _, _, cell = current
+			bucket = self.Grids[category][cell]
+			del bucket[id]
+			if not bucket:
+				del self.Grids[category][cell]
+
+	def ring(self, column, row, radius):
+		'''
+		Cells exactly radius steps (Chebyshev) from (column, row)
+		'''
+		if radius == 0:
+			yield column, row
+			return
+		last = self.Columns - 1
+		for c in range(column - radius, column + radius + 1):
+			if 0 <= c <= last:
+				if row - radius >= 0:
+					yield c, row - radius
+				if row + radius <= last:
+					yield c, row + radius
+		for r in range(row - radius + 1, row + radius):
+			if 0 <= r <= last:
+				if column - radius >= 0:
+					yield column - radius, r
+				if column + radius <= last:
+					yield column + radius, r
+
+	def grids(self, category):
+		if category is None:
+			return list(self.Grids.values())
+		grid = self.Grids.get(category)
+		return [grid] if grid else []
+
+	def kNearest(self, x, y, k, category=None, exclude=None):
+		'''
+		Up to k closest objects (of a Type, if given), closest first
+		'''
+		with self.Lock:
+			grids = self.grids(category)
+			if not grids or k <= 0:
+				return []
+			column, row = self.cellOf(x, y)
+			found = []
+			for radius in range(self.Columns):
+				for cell in self.ring(column, row, radius):
+					for grid in grids:
+						bucket = grid.get(cell)
+						if not bucket:
+							continue
+						for id, (ox, oy) in bucket.items():
+							if id != exclude:
+								found.append((math.hypot(ox - x, oy - y), id, ox, oy))
+				# nothing beyond this ring can be closer than radius * cellSize
+				if len(found) >= k:
+					found.sort()
+					if found[k - 1][0] <= radius * self.CellSize:
+						break
+			found.sort()
+			return found[:k]
+
+	def nearest(self, x, y, category=None, exclude=None):
+		found = self.kNearest(x, y, 1, category, exclude)
+		return found[0] if found else None
+
+	def within(self, x, y, radius, category=None, exclude=None):
+		'''
+		Every object (of a Type, if given) within radius, closest first
+		'''
+		with self.Lock:
+			grids = self.grids(category)
+			found = []
+			if not grids:
+				return found
+			lowColumn, lowRow = self.cellOf(x - radius, y - radius)
+			highColumn, highRow = self.cellOf(x + radius, y + radius)
+			for column in range(lowColumn, highColumn + 1):
+				for row in range(lowRow, highRow + 1):
+					for grid in grids:
+						bucket = grid.get((column, row))
+						if not bucket:
+							continue
+						for id, (ox, oy) in bucket.items():
+							distance = math.hypot(ox - x, oy - y)
+							if distance <= radius and id != exclude:
+								found.append((distance, id, ox, oy))
+			found.sort()
+			return found
@@ -0,0 +1,90 @@
+'''
+Everything a runner, benchmark or test needs from the bots, importable
+without a server
+
+	import tankbot
+	comms = tankbot.ServerComms('127.0.0.1', 8052)
+
+Nothing is imported until it is first used - tankbot.calculateDistance
+loads geometry and nothing else - so a process pays only for the parts
+it touches. The bot scripts themselves (botPy, aimBot, scanBot) only
+connect from run(), which their __main__ blocks call.
+'''
+
+import importlib
+
+
+# public name -> module it lives in
+Components = {
+	# protocol
+	'ServerComms': 'serverComms',
+	'ServerMessageTypes': 'messageTypes',
+	'argumentParser': 'serverComms',
+	'setupLogging': 'serverComms',
+	'connect': 'serverComms',
+	'FrameReader': 'frameReader',
+	'CommandBuffer': 'commandBuffer',
+	'encodeFrame': 'commandBuffer',
+	'decodeMessage': 'messages',
+	'ObjectUpdate': 'messages',
+	'FrameRecorder': 'recorder',
+	'FrameReplayer': 'recorder',
+	# geometry
+	'calculateDistance': 'geometry',
+	'getHeading': 'geometry',
+	'turnAngle': 'geometry',
+	'distances': 'geometry',
+	'headings': 'geometry',
+	'turnAngles': 'geometry',
+	'inArcMask': 'geometry',
+	# game state
+	'WorldState': 'worldState',
+	'TrackStore': 'trackStore',
+	'SpatialIndex': 'spatialIndex',
+	'MessageNotifier': 'notifier',
+	'AimingEngine': 'aiming',
+	'TurretController': 'turretControl',
+	'TargetQueue': 'targetQueue',
+	'PathPlanner': 'pathPlanner',
+	'HeatMap': 'heatMap',
+	'TickScheduler': 'scheduler',
+	'Priorities': 'scheduler',
+	'Wait': 'scheduler',
+	'EvasionPlanner': 'evasion',
+	'evade': 'evasion',
+	# instrumentation
+	'Metrics': 'metrics',
+	'Trace': 'tracing',
+	'TraceEvents': 'tracing',
+	# strategies
+	'AsyncServerComms': 'asyncClient',
+	'AsyncBot': 'asyncClient',
+	'AsyncAimBot': 'asyncClient',
+	'AsyncScanBot': 'asyncClient',
+	'Strategies': 'multiBot',
+	'BotRunner': 'multiBot',
+	'TeamPool': 'teamPool',
+	# the threaded scripts, as modules - call their run(args)
+	'botPy': None,
+	'aimBot': None,
+	'scanBot': None,
+}
+
+__all__ = sorted(Components)
+
+
+def __getattr__(name):
+	if name not in Components:
+		raise AttributeError("module 'tankbot' has no attribute '{}'".format(name))
+	moduleName = Components[name]
+	if moduleName is None:
+		value = importlib.import_module(name)
+	else:
+		value = getattr(importlib.import_module(moduleName), name)
+	#cache it, so the next lookup is a plain module attribute
+	globals()[name] = value
+	return value
+
+
+def __dir__():
+	return sorted(set(globals()) | set(Components))
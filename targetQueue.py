@@ -0,0 +1,219 @@
+import heapq
+import math
+import threading
+import time
+
+from aiming import ProjectileSpeed
+from geometry import calculateDistance, turnAngle
+from turretControl import serverHeading
+
+
+class IndexedHeap(object):
+	'''
+	Binary min-heap of (priority, key) that also knows where every key
+	sits, so changing or removing one key is O(log n) instead of a search
+	'''
+	def __init__(self):
+		self.Heap = []
+		self.Index = {}
+
+	def __len__(self):
+		return len(self.Heap)
+
+	def __contains__(self, key):
+		return key in self.Index
+
+	def push(self, key, priority):
+		'''
+		Insert key, or move it if it is already queued
+		'''
+		position = self.Index.get(key)
+		if position is None:
+			self.Heap.append((priority, key))
+			self.Index[key] = len(self.Heap) - 1
+			self.siftUp(len(self.Heap) - 1)
+			return
+		old = self.Heap[position][0]
+		self.Heap[position] = (priority, key)
+		if priority < old:
+			self.siftUp(position)
+		else:
+			self.siftDown(position)
+
+	def remove(self, key):
+		position = self.Index.pop(key, None)
+		if position is None:
+			return
+		last = self.Heap.pop()
+		if position < len(self.Heap):
+			self.Heap[position] = last
+			self.Index[last[1]] = position
+			self.siftUp(position)
+			self.siftDown(self.Index[last[1]])
+
+	def peek(self):
+		return self.Heap[0] if self.Heap else None
+
+	def ordered(self):
+		'''
+		(priority, key) best first, without popping - a walk down the heap
+		that only opens the children of what it has handed out, so stopping
+		after k entries costs O(k log k)
+		'''
+		heap = self.Heap
+		if not heap:
+			return
+		frontier = [(heap[0], 0)]
+		while frontier:
+			entry, position = heapq.heappop(frontier)
+			yield entry
+			for child in (2 * position + 1, 2 * position + 2):
+				if child < len(heap):
+					heapq.heappush(frontier, (heap[child], child))
+
+	def priority(self, key):
+		position = self.Index.get(key)
+		return self.Heap[position][0] if position is not None else None
+
+	def swap(self, i, j):
+		heap = self.Heap
+		heap[i], heap[j] = heap[j], heap[i]
+		self.Index[heap[i][1]] = i
+		self.Index[heap[j][1]] = j
+
+	def siftUp(self, position):
+		heap = self.Heap
+		while position > 0:
+			parent = (position - 1) // 2
+			if heap[position][0] >= heap[parent][0]:
+				break
+			self.swap(position, parent)
+			position = parent
+
+	def siftDown(self, position):
+		heap = self.Heap
+		size = len(heap)
+		while True:
+			smallest = position
+			for child in (2 * position + 1, 2 * position + 2):
+				if child < size and heap[child][0] < heap[smallest][0]:
+					smallest = child
+			if smallest == position:
+				return
+			self.swap(position, smallest)
+			position = smallest
+
+
+class TargetQueue(object):
+	'''
+	Every tracked enemy tank, ordered by how cheap it is to kill
+
+	The score of a tank is an estimate of the seconds needed to kill it -
+	turning the turret onto it, the shells' flight time and the reloads
+	between them - plus optional weights on raw health, distance and
+	rotation. Lower is better.
+
+	update() rescores just the tank in the OBJECTUPDATE against where we
+	were at the last setShooter(), and moves it in an IndexedHeap, so
+	best() is a peek. Our own movement doesn't rescore everyone - visible
+	tanks send updates every tick, which keeps their scores current.
+	Tanks out of range, or not seen for maxAge seconds, drop out lazily.
+	'''
+	def __init__(self, turretSpeed=90.0, projectileSpeed=ProjectileSpeed, reload=0.5, damage=1,
+			maxRange=100.0, maxAge=1.0, healthWeight=0.0, distanceWeight=0.0, rotationWeight=0.0):
+		self.TurretSpeed = turretSpeed
+		self.ProjectileSpeed = projectileSpeed
+		self.Reload = reload
+		self.Damage = damage
+		self.MaxRange = maxRange
+		self.MaxAge = maxAge
+		self.HealthWeight = healthWeight
+		self.DistanceWeight = distanceWeight
+		self.RotationWeight = rotationWeight
+		self.Heap = IndexedHeap()
+		self.Targets = {}
+		self.Shooter = None
+		self.Lock = threading.Lock()
+
+	def __len__(self):
+		return len(self.Heap)
+
+	def setShooter(self, x, y, turretHeading, turretSpeed=None):
+		self.Shooter = (x, y, turretHeading)
+		if turretSpeed:
+			self.TurretSpeed = turretSpeed
+
+	def score(self, message):
+		'''
+		Estimated cost of killing the tank in message, None if it can't be
+		shot from where we are
+		'''
+		x, y, turretHeading = self.Shooter
+		distance = calculateDistance(x, y, message['X'], message['Y'])
+		if distance > self.MaxRange:
+			return None
+		rotation = abs(turnAngle(turretHeading, serverHeading(x, y, message['X'], message['Y'])))
+		turnTime = rotation / self.TurretSpeed
+		hits = max(1, int(math.ceil(message['Health'] / float(self.Damage))))
+		timeToKill = turnTime + distance / self.ProjectileSpeed + (hits - 1) * self.Reload
+		return (timeToKill + self.HealthWeight * message['Health']
+			+ self.DistanceWeight * distance + self.RotationWeight * rotation)
+
+	def update(self, message, now=None):
+		'''
+		Rescore one tank from its OBJECTUPDATE
+		'''
+		if now is None:
+			now = time.monotonic()
+		id = message['Id']
+		with self.Lock:
+			if self.Shooter is None:
+				return
+			score = self.score(message)
+			if score is None:
+				self.Heap.remove(id)
+				self.Targets.pop(id, None)
+				return
+			self.Targets[id] = (message, now)
+			self.Heap.push(id, score)
+
+	def remove(self, id):
+		with self.Lock:
+			self.Heap.remove(id)
+			self.Targets.pop(id, None)
+
+	def best(self, now=None, accept=None):
+		'''
+		The OBJECTUPDATE of the cheapest tank to kill, or None - with accept,
+		the cheapest one accept(message) is true for, so a caller's own
+		limits (health, distance) never hide a tank that passes them behind
+		a better-scored one that doesn't
+		'''
+		if now is None:
+			now = time.monotonic()
+		oldest = now - self.MaxAge
+		with self.Lock:
+			while self.Heap:
+				_, id = self.Heap.peek()
+				message, seenAt = self.Targets[id]
+				if seenAt >= oldest:
+					break
+				self.Heap.remove(id)
+				del self.Targets[id]
+			else:
+				return None
+			if accept is None:
+				return message
+			for _, id in self.Heap.ordered():
+				message, seenAt = self.Targets[id]
+				if seenAt >= oldest and accept(message):
+					return message
+			return None
+
+	def ranked(self):
+		'''
+		(score, message) for every queued tank, best first - a full sort,
+		for logging and debugging only
+		'''
+		with self.Lock:
+			return [(score, self.Targets[id][0]) for score, id in sorted(self.Heap.Heap)]
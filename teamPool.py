@@ -0,0 +1,271 @@
+#!/usr/bin/python
+
+import logging
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+import multiBot
+from serverComms import argumentParser, setupLogging, threadedOnly
+
+
+# Type field of an OBJECTUPDATE <-> small int stored in the table
+Categories = ["Tank", "HealthPickup", "AmmoPickup", "Snitch"]
+CategoryCodes = dict((category, code) for code, category in enumerate(Categories))
+Removed = -1
+Unknown = len(Categories)
+
+Header = struct.Struct('<8sII')
+Magic = b'GUTSTEAM'
+# seq, Id, category, Health, Ammo, X, Y, Heading, TurretHeading, seenAt, seenBy
+Row = struct.Struct('<IiiiidddddI')
+
+
+class SharedWorld(object):
+	'''
+	Team-wide table of sightings in one shared-memory block
+
+	The block is split into one region per worker process and only that
+	worker ever writes its region, so writers never contend. Every row is
+	guarded by a sequence number (a seqlock): the writer makes it odd while
+	it rewrites the row and even again when done, and a reader retries any
+	row whose sequence was odd or changed under it. Readers take no lock
+	and never see a half-written row. A worker that dies mid-write leaves
+	its row odd for good, so a reader gives up on a row after ReadRetries
+	tries and treats it as empty.
+
+	sightings() merges all regions, keeping the freshest row per Id, and
+	hands back OBJECTUPDATE-shaped dicts with SeenAt/SeenBy added (Name is
+	not stored). seenAt is time.monotonic(), which is system-wide, so
+	ages compare across processes.
+
+	Every bot also reports itself, and a writer keeps those self-reports
+	in rows of their own that sightings by other bots never overwrite, so
+	teammates() knows a tank is ours whoever saw it last and however long
+	ago it last reported.
+	'''
+	ReadRetries = 1000
+
+	def __init__(self, memory, owner):
+		self.Memory = memory
+		self.Owner = owner
+		magic, self.Workers, self.Rows = Header.unpack_from(memory.buf, 0)
+		if magic != Magic:
+			raise ValueError('{} is not a team table'.format(memory.name))
+
+	@classmethod
+	def create(cls, workers, rows=64):
+		memory = shared_memory.SharedMemory(create=True, size=Header.size + workers * rows * Row.size)
+		Header.pack_into(memory.buf, 0, Magic, workers, rows)
+		return cls(memory, True)
+
+	@classmethod
+	def attach(cls, name):
+		return cls(shared_memory.SharedMemory(name=name), False)
+
+	@property
+	def name(self):
+		return self.Memory.name
+
+	def rowOffset(self, region, row):
+		return Header.size + (region * self.Rows + row) * Row.size
+
+	def writer(self, region):
+		if not 0 <= region < self.Workers:
+			raise ValueError('Region {} out of range, the table has {}'.format(region, self.Workers))
+		return RegionWriter(self, region)
+
+	def readRow(self, offset):
+		'''
+		Consistent copy of one row, None if it is empty or never settles
+		'''
+		buf = self.Memory.buf
+		for _ in range(self.ReadRetries):
+			before = Row.unpack_from(buf, offset)
+			if before[0] & 1:
+				continue
+			after = Row.unpack_from(buf, offset)[0]
+			if after != before[0]:
+				continue
+			if before[0] == 0 or before[2] == Removed:
+				return None
+			return before
+		return None
+
+	def sightings(self, maxAge=None, now=None):
+		'''
+		Id -> freshest sighting by anyone on the team
+		'''
+		if now is None:
+			now = time.monotonic()
+		oldest = None if maxAge is None else now - maxAge
+		found = {}
+		for region in range(self.Workers):
+			for row in range(self.Rows):
+				values = self.readRow(self.rowOffset(region, row))
+				if values is None:
+					continue
+				_, id, category, health, ammo, x, y, heading, turretHeading, seenAt, seenBy = values
+				if oldest is not None and seenAt < oldest:
+					continue
+				current = found.get(id)
+				if current is not None and current['SeenAt'] >= seenAt:
+					continue
+				found[id] = {
+					'Id': id, 'Type': Categories[category] if category < Unknown else None,
+					'X': x, 'Y': y, 'Heading': heading, 'TurretHeading': turretHeading,
+					'Health': health, 'Ammo': ammo, 'SeenAt': seenAt, 'SeenBy': seenBy,
+				}
+		return found
+
+	def teammates(self):
+		'''
+		Ids of the team's own tanks, from their self-reports
+		'''
+		teammates = set()
+		for region in range(self.Workers):
+			for row in range(self.Rows):
+				values = self.readRow(self.rowOffset(region, row))
+				if values is not None and values[10] == values[1]:
+					teammates.add(values[1])
+		return teammates
+
+	def close(self):
+		self.Memory.close()
+		if self.Owner:
+			self.Memory.unlink()
+
+
+class RegionWriter(object):
+	'''
+	Writes one worker's region of a SharedWorld. Not thread-safe - one per
+	worker, used from its event loop only.
+
+	Rows are keyed by (Id, whether it is a self-report), so one of our bots
+	seeing a teammate never replaces that teammate's own report, and a
+	full region gives up sightings before self-reports.
+	'''
+	def __init__(self, world, region):
+		self.World = world
+		self.Region = region
+		self.Slots = {}
+		self.Ids = [None] * world.Rows
+		self.SeenAt = [0.0] * world.Rows
+		self.Sequences = [0] * world.Rows
+
+	def slotFor(self, key):
+		row = self.Slots.get(key)
+		if row is not None:
+			return row
+		if len(self.Slots) < len(self.Ids):
+			row = self.Ids.index(None)
+		else:
+			# full - reuse the stalest sighting, a self-report only if there is no sighting left
+			row = min(range(len(self.Ids)), key=lambda row: (self.Ids[row][1], self.SeenAt[row]))
+			del self.Slots[self.Ids[row]]
+		self.Slots[key] = row
+		self.Ids[row] = key
+		return row
+
+	def write(self, row, id, category, health, ammo, x, y, heading, turretHeading, seenAt, seenBy):
+		buf = self.World.Memory.buf
+		offset = self.World.rowOffset(self.Region, row)
+		sequence = self.Sequences[row] + 1
+		struct.pack_into('<I', buf, offset, sequence)
+		Row.pack_into(buf, offset, sequence, id, category, health, ammo,
+			x, y, heading, turretHeading, seenAt, seenBy)
+		sequence += 1
+		struct.pack_into('<I', buf, offset, sequence)
+		self.Sequences[row] = sequence
+		self.SeenAt[row] = seenAt
+
+	def publish(self, message, seenBy, now=None):
+		'''
+		Record an OBJECTUPDATE seen by tank seenBy
+		'''
+		if now is None:
+			now = time.monotonic()
+		row = self.slotFor((message['Id'], seenBy == message['Id']))
+		self.write(row, message['Id'], CategoryCodes.get(message['Type'], Unknown),
+			int(message.get('Health', 0)), int(message.get('Ammo', 0)),
+			message['X'], message['Y'], message.get('Heading', 0.0), message.get('TurretHeading', 0.0),
+			now, seenBy)
+
+	def remove(self, id):
+		for key in ((id, False), (id, True)):
+			row = self.Slots.pop(key, None)
+			if row is None:
+				continue
+			self.write(row, id, Removed, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+			self.Ids[row] = None
+			self.SeenAt[row] = 0.0
+
+
+def runWorker(region, tableName, hostname, port, lineup, duration, reportInterval, debug=False):
+	'''
+	Body of one worker process: its share of the bots on one event loop,
+	all publishing into region of the team table
+	'''
+	#a forked worker inherits the parent's handler - replace it to say which worker
+	logging.basicConfig(format='[%(asctime)s] worker{} %(message)s'.format(region),
+		level=logging.DEBUG if debug else logging.INFO, force=True)
+	world = SharedWorld.attach(tableName)
+	writer = world.writer(region)
+	runner = multiBot.BotRunner(hostname, port, lineup)
+	for bot in runner.Bots:
+		bot.Team = writer
+		bot.TeamView = world
+	try:
+		runner.run(duration, reportInterval)
+	finally:
+		world.close()
+
+
+class TeamPool(object):
+	'''
+	Spreads a lineup of bots over worker processes, each running its bots
+	with multiBot.BotRunner, all sharing one SharedWorld table
+	'''
+	def __init__(self, hostname, port, lineup, workers, rows=64, debug=False):
+		self.Hostname = hostname
+		self.Port = port
+		self.Debug = debug
+		self.Workers = max(1, min(workers, len(lineup)))
+		self.Lineup = lineup
+		self.World = SharedWorld.create(self.Workers, rows)
+		self.Processes = []
+
+	def start(self, duration=None, reportInterval=None):
+		for region in range(self.Workers):
+			share = self.Lineup[region::self.Workers]
+			process = multiprocessing.Process(target=runWorker, name='worker{}'.format(region),
+				args=(region, self.World.name, self.Hostname, self.Port, share, duration, reportInterval, self.Debug))
+			process.start()
+			self.Processes.append(process)
+
+	def join(self):
+		try:
+			for process in self.Processes:
+				process.join()
+		finally:
+			for process in self.Processes:
+				if process.is_alive():
+					process.terminate()
+			self.World.close()
+
+
+if __name__ == '__main__':
+	#-n is a prefix here, as in multiBot
+	parser = argumentParser('', 'Run a team of bots over several processes with a shared world view')
+	parser.add_argument('-w', '--workers', default=multiprocessing.cpu_count(), type=int, help='Worker processes')
+	parser.add_argument('-t', '--duration', default=None, type=float, help='Stop after this many seconds')
+	parser.add_argument('-r', '--report', default=0, type=float, help='Seconds between per-worker reports, 0 for only at the end')
+	parser.add_argument('bots', nargs='*', default=['botPy:4'], help='strategy[:count], strategy one of ' + ', '.join(multiBot.Strategies))
+	args = parser.parse_args()
+	threadedOnly(parser, args)
+	setupLogging(args.debug)
+
+	pool = TeamPool(args.hostname, args.port, multiBot.parseLineup(args.bots, args.name), args.workers, debug=args.debug)
+	pool.start(args.duration, args.report)
+	pool.join()
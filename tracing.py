@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+import argparse
+import atexit
+import itertools
+import signal
+import struct
+import sys
+import threading
+import time
+
+
+class TraceEvents(object):
+	INBOUND = 1
+	OUTBOUND = 2
+	SCANSTART = 3
+	SCANEND = 4
+	TARGET = 5
+	FIRE = 6
+	CHASE = 7
+	HIT = 8
+	IDLE = 9
+	GOTO = 10
+
+	strings = {
+		INBOUND: "INBOUND",
+		OUTBOUND: "OUTBOUND",
+		SCANSTART: "SCANSTART",
+		SCANEND: "SCANEND",
+		TARGET: "TARGET",
+		FIRE: "FIRE",
+		CHASE: "CHASE",
+		HIT: "HIT",
+		IDLE: "IDLE",
+		GOTO: "GOTO",
+	}
+
+	def toString(self, id):
+		if id in self.strings.keys():
+			return self.strings[id]
+		else:
+			return "??UNKNOWN??"
+
+
+# timestamp, event, message type, Id, four event-specific floats
+Event = struct.Struct('<dHHi4f')
+Magic = b'GUTSTRC1'
+
+
+class Tracer(object):
+	'''
+	Fixed-size binary event log in a preallocated ring buffer
+
+	Call sites guard every event with the flag, so a disabled tracer costs
+	one attribute check and nothing is formatted:
+
+		if Trace.Enabled:
+			Trace.record(TraceEvents.FIRE, 0, id, x, y, confidence)
+
+	An event is 32 bytes - what happened, the message type and Id it is
+	about, and up to four floats (position, heading, amount, ...). Once
+	the buffer is full the oldest events are overwritten. dump() writes
+	the buffer out oldest first; install() arranges for that to happen on
+	exit, on an uncaught exception and on SIGUSR1.
+	'''
+	def __init__(self):
+		self.Enabled = False
+		self.Capacity = 0
+		self.Buffer = None
+		self.Counter = None
+		self.Path = None
+
+	def enable(self, capacity=65536):
+		self.Capacity = capacity
+		self.Buffer = bytearray(capacity * Event.size)
+		# next() on a count is atomic under the GIL, so threads never share a slot
+		self.Counter = itertools.count()
+		self.Enabled = True
+
+	def disable(self):
+		self.Enabled = False
+
+	def record(self, event, messageType=0, id=-1, a=0.0, b=0.0, c=0.0, d=0.0):
+		slot = next(self.Counter) % self.Capacity
+		Event.pack_into(self.Buffer, slot * Event.size, time.monotonic(), event, messageType, id, a, b, c, d)
+
+	def message(self, event, messageType, messagePayload):
+		'''
+		Record a frame - the fields of an OBJECTUPDATE, or a command's Amount
+		'''
+		if not messagePayload:
+			self.record(event, messageType)
+		elif 'X' in messagePayload:
+			self.record(event, messageType, messagePayload.get('Id', -1), messagePayload['X'], messagePayload['Y'],
+				messagePayload.get('Heading', 0.0), messagePayload.get('TurretHeading', 0.0))
+		else:
+			amount = messagePayload.get('Amount', 0.0)
+			self.record(event, messageType, messagePayload.get('Id', -1),
+				amount if isinstance(amount, (int, float)) else 0.0)
+
+	def events(self):
+		'''
+		Every recorded event, oldest first, as Event tuples
+		'''
+		if self.Buffer is None:
+			return []
+		buf = bytes(self.Buffer)
+		found = [Event.unpack_from(buf, offset) for offset in range(0, len(buf), Event.size)]
+		found = [event for event in found if event[0]]
+		found.sort()
+		return found
+
+	def dump(self, path=None):
+		path = path or self.Path
+		if path is None or self.Buffer is None:
+			return 0
+		events = self.events()
+		with open(path, 'wb') as dumpFile:
+			dumpFile.write(Magic)
+			for event in events:
+				dumpFile.write(Event.pack(*event))
+		return len(events)
+
+	def install(self, path):
+		'''
+		Dump to path at exit, on an uncaught exception in any thread and
+		on SIGUSR1 (where there is one)
+		'''
+		self.Path = path
+		atexit.register(self.dump)
+
+		previousHook = sys.excepthook
+		def excepthook(excType, excValue, traceback):
+			self.dump()
+			previousHook(excType, excValue, traceback)
+		sys.excepthook = excepthook
+
+		previousThreadHook = threading.excepthook
+		def threadExcepthook(args):
+			self.dump()
+			previousThreadHook(args)
+		threading.excepthook = threadExcepthook
+
+		if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+			signal.signal(signal.SIGUSR1, lambda signum, frame: self.dump())
+
+
+# the one every module records into
+Trace = Tracer()
+
+
+def readDump(path):
+	with open(path, 'rb') as dumpFile:
+		data = dumpFile.read()
+	if data[:len(Magic)] != Magic:
+		raise ValueError('{} is not a trace dump'.format(path))
+	return [Event.unpack_from(data, offset) for offset in range(len(Magic), len(data) - Event.size + 1, Event.size)]
+
+
+if __name__ == '__main__':
+	from messageTypes import ServerMessageTypes
+
+	parser = argparse.ArgumentParser(description='Print a trace dump')
+	parser.add_argument('dump', help='File written by a bot run with --trace')
+	parser.add_argument('-l', '--last', default=0, type=int, help='Only the last N events')
+	args = parser.parse_args()
+
+	events = readDump(args.dump)
+	if args.last:
+		events = events[-args.last:]
+	eventNames = TraceEvents()
+	messageTypes = ServerMessageTypes()
+	started = events[0][0] if events else 0.0
+	for timestamp, event, messageType, id, a, b, c, d in events:
+		print('{:10.4f} {:<10} {:<22} {:>5} {:10.3f} {:10.3f} {:10.3f} {:10.3f}'.format(
+			timestamp - started, eventNames.toString(event),
+			messageTypes.toString(messageType) if event in (TraceEvents.INBOUND, TraceEvents.OUTBOUND) else '',
+			id, a, b, c, d))
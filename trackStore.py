@@ -0,0 +1,168 @@
+import threading
+import time
+from array import array
+
+from messageTypes import ServerMessageTypes
+
+
+class Track(object):
+	'''
+	Fixed-capacity ring buffer of (x, y, t) samples for one object, stored in
+	one flat array of doubles. Samples must arrive in time order.
+	'''
+	def __init__(self, capacity):
+		self.Capacity = capacity
+		self.Samples = array('d', [0.0]) * (3 * capacity)
+		self.Start = 0
+		self.Count = 0
+
+	def __len__(self):
+		return self.Count
+
+	def append(self, x, y, t):
+		if self.Count < self.Capacity:
+			slot = (self.Start + self.Count) % self.Capacity
+			self.Count += 1
+		else:
+			# full - overwrite the oldest sample
+			slot = self.Start
+			self.Start = (self.Start + 1) % self.Capacity
+		i = slot * 3
+		samples = self.Samples
+		samples[i] = x
+		samples[i + 1] = y
+		samples[i + 2] = t
+
+	def sample(self, index):
+		'''
+		index-th sample counting from the oldest, negative counts from the newest
+		'''
+		if index < 0:
+			index += self.Count
+		i = ((self.Start + index) % self.Capacity) * 3
+		samples = self.Samples
+		return samples[i], samples[i + 1], samples[i + 2]
+
+	def time(self, index):
+		return self.Samples[((self.Start + index) % self.Capacity) * 3 + 2]
+
+	def latest(self):
+		return self.sample(-1) if self.Count else None
+
+	def closestTo(self, t):
+		'''
+		The sample whose time is closest to t - binary search, O(log n)
+		'''
+		if not self.Count:
+			return None
+		low = 0
+		high = self.Count - 1
+		while low < high:
+			middle = (low + high) // 2
+			if self.time(middle) < t:
+				low = middle + 1
+			else:
+				high = middle
+		if low > 0 and t - self.time(low - 1) < self.time(low) - t:
+			low -= 1
+		return self.sample(low)
+
+
+class TrackStore(object):
+	'''
+	Bounded per-target position history
+
+	Every Id gets a Track of at most capacity samples, so memory stays flat
+	however long the match runs. Tracks not updated for maxAge seconds are
+	dropped by evictStale, and DESTROYED/KILL messages evict through
+	handleMessage.
+	'''
+	def __init__(self, capacity=64, maxAge=5.0):
+		self.Capacity = capacity
+		self.MaxAge = maxAge
+		self.Tracks = {}
+		self.LastTarget = None
+		self.Lock = threading.Lock()
+
+	def __contains__(self, id):
+		return id in self.Tracks
+
+	def __len__(self):
+		return len(self.Tracks)
+
+	def append(self, id, x, y, t=None):
+		if t is None:
+			t = time.monotonic()
+		with self.Lock:
+			track = self.Tracks.get(id)
+			if track is None:
+				track = self.Tracks[id] = Track(self.Capacity)
+			track.append(x, y, t)
+
+	def update(self, message, t=None):
+		'''
+		Record an OBJECTUPDATE payload
+		'''
+		self.append(message['Id'], message['X'], message['Y'], t)
+
+	def latest(self, id):
+		with self.Lock:
+			track = self.Tracks.get(id)
+			return track.latest() if track is not None else None
+
+	def closest(self, id, secondsAgo, now=None):
+		'''
+		(x, y, t) of the sample closest to secondsAgo seconds before now
+		'''
+		if now is None:
+			now = time.monotonic()
+		with self.Lock:
+			track = self.Tracks.get(id)
+			return track.closestTo(now - secondsAgo) if track is not None else None
+
+	def setTarget(self, id):
+		'''
+		Remember who we are shooting at, so a KILL without an Id can evict it
+		'''
+		self.LastTarget = id
+
+	def evict(self, id):
+		with self.Lock:
+			self.Tracks.pop(id, None)
+		if self.LastTarget == id:
+			self.LastTarget = None
+
+	def clear(self):
+		with self.Lock:
+			self.Tracks.clear()
+		self.LastTarget = None
+
+	def evictStale(self, now=None):
+		if now is None:
+			now = time.monotonic()
+		oldest = now - self.MaxAge
+		with self.Lock:
+			stale = [id for id, track in self.Tracks.items() if track.latest()[2] < oldest]
+			for id in stale:
+				del self.Tracks[id]
+		return stale
+
+	def handleMessage(self, message, messageType):
+		'''
+		Evict on DESTROYED/KILL. An Id in the payload names the tank; without
+		one, DESTROYED means we died (all tracks are stale once we respawn)
+		and KILL means our last target is gone. Returns the evicted Ids.
+		'''
+		if messageType not in (ServerMessageTypes.DESTROYED, ServerMessageTypes.KILL):
+			return []
+		id = message.get('Id') if message else None
+		if id is None and messageType == ServerMessageTypes.DESTROYED:
+			evicted = list(self.Tracks)
+			self.clear()
+			return evicted
+		if id is None:
+			id = self.LastTarget
+		if id is None:
+			return []
+		self.evict(id)
+		return [id]
@@ -0,0 +1,106 @@
+import math
+import time
+
+from geometry import getHeading, turnAngle
+from aiming import TargetRadius
+
+
+def serverHeading(x, y, targetX, targetY):
+	'''
+	Heading from (x, y) to the target the way the server counts it -
+	what TURNTURRETTOHEADING takes and TurretHeading reports
+	'''
+	return (360 - getHeading(x, y, targetX, targetY)) % 360
+
+
+def hitTolerance(distance):
+	'''
+	Largest turret error, in degrees, that still hits a tank distance away
+	'''
+	if distance <= TargetRadius:
+		return 180.0
+	return max(1.0, math.degrees(math.atan2(TargetRadius, distance)))
+
+
+class TurretController(object):
+	'''
+	Turret model for one tank
+
+	Feed it our own TurretHeading on every update with observe(). While the
+	turret is slewing to a commanded heading the observed rate updates the
+	speed estimate (an exponential average), so command() can predict when
+	the turret will be on target: lag for the command to reach the server,
+	plus the shortest rotation over the learned speed. Fire at that moment
+	instead of after a fixed sleep, and check onTarget() first so a shot
+	isn't wasted when the model was wrong.
+	'''
+	def __init__(self, speed=90.0, lag=0.05, smoothing=0.3):
+		self.Speed = speed
+		self.Lag = lag
+		self.Smoothing = smoothing
+		self.Heading = None
+		self.SeenAt = None
+		self.Target = None
+		self.SettleAt = None
+
+	def reset(self):
+		'''
+		Forget where the turret is (a new tank) but keep the learned speed
+		and the heading it was told to go to
+		'''
+		self.Heading = None
+		self.SeenAt = None
+
+	def observe(self, turretHeading, now=None):
+		if now is None:
+			now = time.monotonic()
+		if self.Heading is not None and self.Target is not None:
+			dt = now - self.SeenAt
+			moved = abs(turnAngle(self.Heading, turretHeading))
+			remaining = abs(turnAngle(self.Heading, self.Target))
+			# only a full-speed step tells us the speed - not the last one,
+			# which stops short on the target
+			if dt > 0.01 and moved > 0.5 and moved < remaining - 0.5:
+				self.Speed += self.Smoothing * (moved / dt - self.Speed)
+		self.Heading = turretHeading
+		self.SeenAt = now
+
+	def rotation(self, desiredHeading, current=None):
+		'''
+		Shortest signed turn to desiredHeading, positive counts up
+		'''
+		if current is None:
+			current = self.Heading
+		return turnAngle(current, desiredHeading)
+
+	def settleTime(self, desiredHeading, current=None):
+		'''
+		Seconds from sending the command until the turret is on target -
+		before the first observe() the turret could be anywhere, so that is
+		the worst case, half a turn
+		'''
+		if current is None:
+			current = self.Heading
+		if current is None:
+			return self.Lag + 180.0 / self.Speed
+		return self.Lag + abs(self.rotation(desiredHeading, current)) / self.Speed
+
+	def command(self, desiredHeading, now=None):
+		'''
+		Note that TURNTURRETTOHEADING desiredHeading was just sent, and
+		return the time.monotonic() at which to fire
+		'''
+		if now is None:
+			now = time.monotonic()
+		#Heading stays unknown (and onTarget false) until observe() sees it
+		self.Target = desiredHeading
+		self.SettleAt = now + self.settleTime(desiredHeading)
+		return self.SettleAt
+
+	def onTarget(self, desiredHeading, tolerance=2.0, current=None):
+		'''
+		False while we haven't seen where the turret is
+		'''
+		if current is None:
+			current = self.Heading
+		return current is not None and abs(turnAngle(current, desiredHeading)) <= tolerance
@@ -0,0 +1,128 @@
+import threading
+import time
+
+
+class WorldSnapshot(object):
+	'''
+	Immutable view of every object we know about at one version
+
+	Objects maps Id -> latest OBJECTUPDATE payload, Versions maps Id -> the
+	version it last changed at and Removed maps Id -> the version it was
+	dropped at. Nothing in a snapshot is ever modified after it is
+	published, so a reader can hold on to one for a whole computation.
+	'''
+	def __init__(self, version, idTank, objects, versions, seenAt, removed):
+		self.Version = version
+		self.IdTank = idTank
+		self.Objects = objects
+		self.Versions = versions
+		self.SeenAt = seenAt
+		self.Removed = removed
+
+	@property
+	def me(self):
+		return self.Objects.get(self.IdTank)
+
+	def get(self, id):
+		return self.Objects.get(id)
+
+	def ofType(self, category, maxAge=None):
+		'''
+		Every object of a Type ("Tank", "HealthPickup", "AmmoPickup", "Snitch"),
+		our own tank excluded, optionally only those seen in the last maxAge s
+		'''
+		if maxAge is not None:
+			oldest = time.monotonic() - maxAge
+		result = []
+		for id, message in self.Objects.items():
+			if message['Type'] != category or id == self.IdTank:
+				continue
+			if maxAge is not None and self.SeenAt[id] < oldest:
+				continue
+			result.append(message)
+		return result
+
+	def tanks(self, maxAge=None):
+		return self.ofType("Tank", maxAge)
+
+	def changedSince(self, version):
+		'''
+		(Id, message) for everything updated after version, message is None
+		for objects removed since then
+		'''
+		changed = [(id, self.Objects[id]) for id, v in self.Versions.items() if v > version]
+		changed.extend((id, None) for id, v in self.Removed.items() if v > version)
+		return changed
+
+
+class WorldState(object):
+	'''
+	World-state store keyed by object Id
+
+	The reader thread calls update() for every OBJECTUPDATE. Each update
+	copies the (small) per-Id dicts, bumps the version and publishes a new
+	WorldSnapshot with a single reference swap, so readers never take a lock
+	and never see a half-applied update - snapshot() is just an attribute read.
+	'''
+	def __init__(self, idTank=None):
+		self.Lock = threading.Lock()
+		self.Current = WorldSnapshot(0, idTank, {}, {}, {}, {})
+
+	def snapshot(self):
+		return self.Current
+
+	@property
+	def version(self):
+		return self.Current.Version
+
+	def setIdTank(self, idTank):
+		with self.Lock:
+			old = self.Current
+			self.Current = WorldSnapshot(old.Version + 1, idTank,
+				old.Objects, old.Versions, old.SeenAt, old.Removed)
+
+	def update(self, message):
+		'''
+		Apply one OBJECTUPDATE payload
+		'''
+		id = message['Id']
+		now = time.monotonic()
+		with self.Lock:
+			old = self.Current
+			version = old.Version + 1
+
+			objects = dict(old.Objects)
+			objects[id] = message
+			versions = dict(old.Versions)
+			versions[id] = version
+			seenAt = dict(old.SeenAt)
+			seenAt[id] = now
+			removed = old.Removed
+			if id in removed:
+				removed = dict(removed)
+				del removed[id]
+
+			self.Current = WorldSnapshot(version, old.IdTank, objects, versions, seenAt, removed)
+		return version
+
+	def remove(self, id):
+		'''
+		Forget an object (destroyed, picked up, ...)
+		'''
+		with self.Lock:
+			old = self.Current
+			if id not in old.Objects:
+				return old.Version
+			version = old.Version + 1
+
+			objects = dict(old.Objects)
+			del objects[id]
+			versions = dict(old.Versions)
+			del versions[id]
+			seenAt = dict(old.SeenAt)
+			del seenAt[id]
+			removed = dict(old.Removed)
+			removed[id] = version
+
+			self.Current = WorldSnapshot(version, old.IdTank, objects, versions, seenAt, removed)
+		return version